@@ -2,7 +2,7 @@
 # ==============================================================================
 # Script: battle_engine.py
 # Role:   Logic Engine (Central Brain)
-# Version: 3.2.0 (Fix: Host Tag Extraction)
+# Version: 3.4.0 (Live State Bus)
 # ==============================================================================
 
 import time
@@ -11,6 +11,9 @@ import datetime
 import os
 from influxdb import InfluxDBClient
 
+from influx_writer import InfluxWriter
+from aircraft_state import connect_state
+
 DB_HOST = os.getenv("INFLUX_HOST_NAME", "influxdb") 
 DB_PORT = 8086
 DB_NAME = 'readsb'
@@ -34,6 +37,7 @@ class BattleRef:
     def __init__(self):
         print(f"[BATTLE] Initializing Logic Engine v3.2.0...")
         self.client = InfluxDBClient(host=DB_HOST, port=DB_PORT)
+        self.writer = InfluxWriter(f"http://{DB_HOST}:{DB_PORT}", DB_NAME, name="battle-engine")
         while True:
             try:
                 self.client.switch_database(DB_NAME)
@@ -42,48 +46,40 @@ class BattleRef:
             except Exception as e:
                 print(f"[WAIT] Database not ready: {e}")
                 time.sleep(5)
+        # Per-host live state (MQTT state bus, InfluxDB query fallback)
+        self.state = connect_state("BattleEngine", self.client, ["lat", "lon", "alt_baro_ft"])
 
     def run(self):
         print("[RUNNING] Calculating Battle Stats...")
         while True:
             try:
-                # Query last known position for every ICAO, grouped by host
-                query = """
-                    SELECT last("lat") as lat, last("lon") as lon, last("alt_baro_ft") as alt
-                    FROM "local_aircraft_state" 
-                    WHERE time > now() - 15s 
-                    GROUP BY "icao24", "host"
-                """
-                results = self.client.query(query)
+                # Last known position for every ICAO, per host
+                snapshot = self.state.snapshot(max_age=15, per_host=True)
                 
                 stats = {} 
 
-                # Iterate through the ResultSet
-                # keys are (measurement, tags) tuples
-                for (name, tags), points in results.items():
-                    host = tags.get('host', 'unknown')
+                # keys are (host, icao) tuples
+                for (host, icao), p in snapshot.items():
+                    host = host or 'unknown'
+                    lat = p.get('lat')
+                    lon = p.get('lon')
+                    alt = p.get('alt_baro_ft')
                     
-                    # Process points
-                    for p in points:
-                        lat = p.get('lat')
-                        lon = p.get('lon')
-                        alt = p.get('alt')
-                        
-                        if not lat or not lon: continue
+                    if not lat or not lon: continue
 
-                        if host not in stats:
-                            stats[host] = {'count': 0, 'max_range': 0.0, 'ground': 0, 'low': 0, 'mid': 0, 'high': 0}
+                    if host not in stats:
+                        stats[host] = {'count': 0, 'max_range': 0.0, 'ground': 0, 'low': 0, 'mid': 0, 'high': 0}
 
-                        dist = haversine(REF_LAT, REF_LON, lat, lon)
-                        if dist > stats[host]['max_range']:
-                            stats[host]['max_range'] = dist
+                    dist = haversine(REF_LAT, REF_LON, lat, lon)
+                    if dist > stats[host]['max_range']:
+                        stats[host]['max_range'] = dist
 
-                        stats[host]['count'] += 1
-                        
-                        if alt is None or alt == 0: stats[host]['ground'] += 1
-                        elif alt < 10000: stats[host]['low'] += 1
-                        elif alt < 30000: stats[host]['mid'] += 1
-                        else: stats[host]['high'] += 1
+                    stats[host]['count'] += 1
+                    
+                    if alt is None or alt == 0: stats[host]['ground'] += 1
+                    elif alt < 10000: stats[host]['low'] += 1
+                    elif alt < 30000: stats[host]['mid'] += 1
+                    else: stats[host]['high'] += 1
 
                 # Write Stats
                 timestamp = datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
@@ -103,7 +99,7 @@ class BattleRef:
                     })
 
                 if points_to_write:
-                    self.client.write_points(points_to_write)
+                    self.writer.write_points(points_to_write)
             
             except Exception as e:
                 print(f"[ERROR] Loop Failed: {e}")
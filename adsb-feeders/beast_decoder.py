@@ -0,0 +1,449 @@
+import math
+import socket
+import time
+
+# ==============================================================================
+# Module: beast_decoder.py
+# Version: 1.0.0 (Streaming Ingest)
+# Description:
+#   Reader for the Beast binary protocol (readsb port 30005) and a minimal
+#   ADS-B (DF17/DF18) decoder. Turns raw Mode-S frames into the same field
+#   names used by 'local_aircraft_state', so the feeder can write per message
+#   instead of re-parsing the full aircraft.json snapshot every second.
+#
+#   Decoded message types:
+#     TC 1-4   : Identity (callsign + wake category)
+#     TC 5-8   : Surface position (CPR, movement, track)
+#     TC 9-18  : Airborne position, barometric altitude (CPR)
+#     TC 19    : Airborne velocity (ground speed / airspeed, vertical rate)
+#     TC 20-22 : Airborne position, GNSS altitude (CPR)
+#     TC 28    : Emergency status + squawk
+#     TC 31    : Operational status (ADS-B version)
+#
+#   This file is shared: adsb-feeders/ holds the master copy, the other
+#   services carry an identical copy in their build context. Edit the
+#   master only, then run tools/sync_shared_modules.py.
+# ==============================================================================
+
+# --- BEAST FRAMING ---
+BEAST_ESCAPE = 0x1a
+# Frame type byte -> Mode-S payload length ('1' Mode A/C, '2' short, '3' long)
+FRAME_LENGTHS = {0x31: 2, 0x32: 7, 0x33: 14}
+BEAST_HEADER_LEN = 7  # 6 byte MLAT timestamp + 1 byte signal level
+
+# --- CPR CONSTANTS ---
+CPR_SCALE = 131072.0  # 2^17
+CPR_MAX_PAIR_AGE = 10.0  # Seconds between even/odd frames for a global decode
+CPR_MAX_LOCAL_NM = 180.0  # Local decode is only unambiguous within this range
+
+CALLSIGN_CHARSET = "#ABCDEFGHIJKLMNOPQRSTUVWXYZ##### ###############0123456789######"
+
+
+class BeastReader:
+    """
+    Incremental Beast frame splitter.
+    Feed it raw socket bytes; it returns complete frames and keeps any
+    partial frame for the next call. Handles 0x1a 0x1a escaping.
+    """
+
+    def __init__(self):
+        self.buf = bytearray()
+
+    def feed(self, data):
+        """Returns a list of (msg_bytes, timestamp_raw, signal_level) tuples."""
+        self.buf += data
+        buf = self.buf
+        frames = []
+        i = 0
+        n = len(buf)
+
+        while True:
+            start = buf.find(BEAST_ESCAPE, i)
+            if start < 0:
+                i = n
+                break
+            if start + 1 >= n:
+                i = start
+                break
+
+            length = FRAME_LENGTHS.get(buf[start + 1])
+            if length is None:
+                # Out of sync (or a 4/status frame we don't care about)
+                i = start + 1
+                continue
+
+            need = BEAST_HEADER_LEN + length
+            frame, end = self._unescape(buf, start + 2, need)
+            if frame is None:
+                if end < 0:
+                    # Incomplete: wait for more bytes
+                    i = start
+                    break
+                # Corrupt frame: resync at the unexpected escape byte
+                i = end
+                continue
+
+            ts = int.from_bytes(frame[0:6], 'big')
+            frames.append((bytes(frame[7:]), ts, frame[6]))
+            i = end
+
+        del buf[:i]
+        return frames
+
+    @staticmethod
+    def _unescape(buf, pos, need):
+        """
+        Reads 'need' unescaped bytes starting at pos.
+        Returns (frame, end_pos); (None, -1) if incomplete, (None, resync_pos) if corrupt.
+        """
+        n = len(buf)
+        # Fast path: no escape byte inside the frame
+        chunk = buf[pos:pos + need]
+        if len(chunk) == need and BEAST_ESCAPE not in chunk:
+            return chunk, pos + need
+
+        out = bytearray()
+        j = pos
+        while len(out) < need:
+            if j >= n:
+                return None, -1
+            b = buf[j]
+            if b == BEAST_ESCAPE:
+                if j + 1 >= n:
+                    return None, -1
+                if buf[j + 1] != BEAST_ESCAPE:
+                    return None, j
+                j += 1
+            out.append(b)
+            j += 1
+        return out, j
+
+
+def iter_beast_frames(host, port, timeout=30):
+    """Connects to a Beast TCP output and yields frames as they arrive."""
+    reader = BeastReader()
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        sock.settimeout(timeout)
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                raise ConnectionError(f"Beast stream {host}:{port} closed")
+            for frame in reader.feed(data):
+                yield frame
+
+
+def signal_to_rssi(level):
+    """Beast signal byte (sqrt of power, 0-255) -> dBFS, matching readsb."""
+    if level <= 0:
+        return -49.5
+    return round(20 * math.log10(level / 255.0), 1)
+
+
+# ==============================================================================
+# MODE-S / ADS-B DECODING
+# ==============================================================================
+
+def cpr_nl(lat):
+    """Number of longitude zones for a given latitude (DO-260B A.1.7.2)."""
+    lat = abs(lat)
+    if lat == 0:
+        return 59
+    if lat == 87.0:
+        return 2
+    if lat > 87.0:
+        return 1
+    a = 1 - math.cos(math.pi / 30)
+    b = math.cos(math.pi / 180 * lat) ** 2
+    return int(math.floor(2 * math.pi / math.acos(1 - a / b)))
+
+
+def cpr_global(even, odd, surface=False):
+    """
+    Global CPR decode from an even/odd frame pair.
+    even/odd are (lat_cpr, lon_cpr, rx_time) tuples with raw 17-bit values.
+    Returns (lat, lon) or None if the pair straddles a latitude zone.
+    """
+    span = 90.0 if surface else 360.0
+    lat_e, lon_e = even[0] / CPR_SCALE, even[1] / CPR_SCALE
+    lat_o, lon_o = odd[0] / CPR_SCALE, odd[1] / CPR_SCALE
+    dlat_e = span / 60
+    dlat_o = span / 59
+
+    j = math.floor(59 * lat_e - 60 * lat_o + 0.5)
+    rlat_e = dlat_e * (j % 60 + lat_e)
+    rlat_o = dlat_o * (j % 59 + lat_o)
+    if rlat_e >= 270: rlat_e -= 360
+    if rlat_o >= 270: rlat_o -= 360
+    if abs(rlat_e) > 90 or abs(rlat_o) > 90:
+        return None
+
+    nl = cpr_nl(rlat_e)
+    if nl != cpr_nl(rlat_o):
+        return None
+
+    if even[2] >= odd[2]:
+        lat = rlat_e
+        ni = max(nl, 1)
+        m = math.floor(lon_e * (nl - 1) - lon_o * nl + 0.5)
+        lon = (span / ni) * (m % ni + lon_e)
+    else:
+        lat = rlat_o
+        ni = max(nl - 1, 1)
+        m = math.floor(lon_e * (nl - 1) - lon_o * nl + 0.5)
+        lon = (span / ni) * (m % ni + lon_o)
+
+    if lon >= 180: lon -= 360
+    return lat, lon
+
+
+def cpr_local(lat_cpr, lon_cpr, odd, ref_lat, ref_lon, surface=False):
+    """Local CPR decode against a reference position (receiver or last fix)."""
+    span = 90.0 if surface else 360.0
+    lat_c, lon_c = lat_cpr / CPR_SCALE, lon_cpr / CPR_SCALE
+
+    dlat = span / (59 if odd else 60)
+    j = math.floor(ref_lat / dlat) + math.floor(0.5 + (ref_lat % dlat) / dlat - lat_c)
+    lat = dlat * (j + lat_c)
+
+    ni = cpr_nl(lat) - (1 if odd else 0)
+    dlon = span / ni if ni > 0 else span
+    m = math.floor(ref_lon / dlon) + math.floor(0.5 + (ref_lon % dlon) / dlon - lon_c)
+    lon = dlon * (m + lon_c)
+    return lat, lon
+
+
+def decode_ac12(alt12):
+    """12-bit altitude code -> feet. Gillham (Q=0) coded altitudes are not supported."""
+    if alt12 == 0:
+        return None
+    if alt12 & 0x10:
+        n = ((alt12 & 0xFE0) >> 1) | (alt12 & 0x00F)
+        return n * 25 - 1000
+    return None
+
+
+def decode_squawk(id13):
+    """13-bit Mode A identity field (C1 A1 C2 A2 C4 A4 X B1 D1 B2 D2 B4 D4) -> '7700'."""
+    bit = lambda n: (id13 >> (12 - n)) & 1
+    a = bit(5) * 4 + bit(3) * 2 + bit(1)
+    b = bit(11) * 4 + bit(9) * 2 + bit(7)
+    c = bit(4) * 4 + bit(2) * 2 + bit(0)
+    d = bit(12) * 4 + bit(10) * 2 + bit(8)
+    return f"{a}{b}{c}{d}"
+
+
+def decode_surface_movement(mov):
+    """Surface movement code -> ground speed (knots)."""
+    if mov == 0 or mov > 124: return None
+    if mov == 1: return 0.0
+    if mov == 124: return 175.0
+    steps = ((2, 0.125, 0.125), (9, 1.0, 0.25), (13, 2.0, 0.5),
+             (39, 15.0, 1.0), (94, 70.0, 2.0), (109, 100.0, 5.0))
+    for lo, base, step in reversed(steps):
+        if mov >= lo:
+            return base + (mov - lo) * step
+    return None
+
+
+EMERGENCY_STATES = ["none", "general", "lifeguard", "minfuel", "nordo", "unlawful", "downed", "reserved"]
+
+
+def decode_message(msg):
+    """
+    Decodes one Mode-S frame.
+    Returns a dict with 'icao' and the decoded content, or None for frames
+    that are not DF17/DF18 extended squitters.
+    """
+    if len(msg) != 14:
+        return None
+
+    df = msg[0] >> 3
+    if df == 18:
+        # Only CF 0 (ADS-B, ICAO address) and CF 6 (ADS-R) carry a real address
+        if (msg[0] & 7) not in (0, 6):
+            return None
+    elif df != 17:
+        return None
+
+    me = msg[4:11]
+    tc = me[0] >> 3
+    out = {'icao': msg[1:4].hex(), 'tc': tc}
+
+    if 1 <= tc <= 4:
+        chars = int.from_bytes(me[1:7], 'big')
+        callsign = "".join(CALLSIGN_CHARSET[(chars >> (42 - 6 * k)) & 0x3F] for k in range(8))
+        out['callsign'] = callsign.replace('#', '').strip()
+        out['category'] = f"{'DCBA'[tc - 1]}{me[0] & 7}"
+
+    elif 5 <= tc <= 8:
+        out['surface'] = True
+        mov = ((me[0] & 7) << 4) | (me[1] >> 4)
+        gs = decode_surface_movement(mov)
+        if gs is not None:
+            out['gs_knots'] = gs
+        if (me[1] >> 3) & 1:
+            out['track'] = round((((me[1] & 7) << 4) | (me[2] >> 4)) * 360.0 / 128, 1)
+        out['cpr'] = _cpr_fields(me)
+
+    elif 9 <= tc <= 18 or 20 <= tc <= 22:
+        alt12 = (me[1] << 4) | (me[2] >> 4)
+        if tc <= 18:
+            alt = decode_ac12(alt12)
+            if alt is not None:
+                out['alt_baro_ft'] = alt
+        elif alt12:
+            out['alt_geom_ft'] = int(alt12 * 3.28084)
+        out['cpr'] = _cpr_fields(me)
+
+    elif tc == 19:
+        _decode_velocity(me, out)
+
+    elif tc == 28 and (me[0] & 7) == 1:
+        out['emergency'] = EMERGENCY_STATES[(me[1] >> 5) & 7]
+        id13 = ((me[1] & 0x1F) << 8) | me[2]
+        if id13:
+            out['squawk'] = decode_squawk(id13)
+
+    elif tc == 31 and (me[0] & 7) in (0, 1):
+        out['adsb_version'] = (me[5] >> 5) & 7
+
+    return out
+
+
+def _cpr_fields(me):
+    odd = (me[2] >> 2) & 1
+    lat_cpr = ((me[2] & 3) << 15) | (me[3] << 7) | (me[4] >> 1)
+    lon_cpr = ((me[4] & 1) << 16) | (me[5] << 8) | me[6]
+    return odd, lat_cpr, lon_cpr
+
+
+def _decode_velocity(me, out):
+    st = me[0] & 7
+    if st in (1, 2):
+        v_ew = (((me[1] & 3) << 8) | me[2]) - 1
+        v_ns = (((me[3] & 0x7F) << 3) | (me[4] >> 5)) - 1
+        if v_ew >= 0 and v_ns >= 0:
+            mult = 4 if st == 2 else 1
+            vx = -v_ew * mult if (me[1] >> 2) & 1 else v_ew * mult
+            vy = -v_ns * mult if (me[3] >> 7) & 1 else v_ns * mult
+            out['gs_knots'] = round(math.hypot(vx, vy), 1)
+            out['track'] = round(math.degrees(math.atan2(vx, vy)) % 360, 1)
+    elif st in (3, 4):
+        if (me[1] >> 2) & 1:
+            out['mag_heading'] = round((((me[1] & 3) << 8) | me[2]) * 360.0 / 1024, 1)
+        airspeed = (((me[3] & 0x7F) << 3) | (me[4] >> 5)) - 1
+        if airspeed >= 0:
+            out['tas_knots' if (me[3] >> 7) & 1 else 'ias_knots'] = airspeed * (4 if st == 4 else 1)
+    else:
+        return
+
+    vr = ((me[4] & 7) << 6) | (me[5] >> 2)
+    if vr:
+        rate = (vr - 1) * 64
+        if (me[4] >> 3) & 1:
+            rate = -rate
+        # VrSrc: 0 = GNSS (geometric), 1 = Barometric
+        out['vert_rate_fpm' if (me[4] >> 4) & 1 else 'geom_rate_fpm'] = rate
+
+
+# ==============================================================================
+# PER-AIRCRAFT TRACKER
+# ==============================================================================
+
+class BeastTracker:
+    """
+    Keeps the minimum per-aircraft context needed to turn single messages
+    into 'local_aircraft_state' rows: CPR frame pairs, last position and
+    callsign (which is a tag in the schema).
+    """
+
+    def __init__(self, ref_lat, ref_lon, max_age=300):
+        self.ref_lat = ref_lat
+        self.ref_lon = ref_lon
+        self.max_age = max_age
+        self.aircraft = {}
+
+    def _state(self, icao, now):
+        ac = self.aircraft.get(icao)
+        if ac is None:
+            ac = {'callsign': 'N/A', 'even': None, 'odd': None, 'pos': None, 'pos_time': 0, 'last_seen': now}
+            self.aircraft[icao] = ac
+        ac['last_seen'] = now
+        return ac
+
+    def update(self, msg, now=None):
+        """
+        Decodes a frame and returns (icao, callsign, fields) with only the
+        fields carried by this message, or None if nothing is writable.
+        """
+        decoded = decode_message(msg)
+        if not decoded:
+            return None
+
+        now = now or time.time()
+        icao = decoded.pop('icao')
+        decoded.pop('tc', None)
+        ac = self._state(icao, now)
+        fields = {}
+
+        if 'callsign' in decoded:
+            if decoded['callsign']:
+                ac['callsign'] = decoded.pop('callsign')
+            else:
+                decoded.pop('callsign')
+
+        cpr = decoded.pop('cpr', None)
+        surface = decoded.pop('surface', False)
+        if cpr:
+            pos = self._resolve_position(ac, cpr, surface, now)
+            if pos:
+                fields['lat'] = round(pos[0], 6)
+                fields['lon'] = round(pos[1], 6)
+            if surface:
+                fields['alt_baro_ft'] = 0
+
+        fields.update(decoded)
+        if not fields:
+            return None
+        return icao, ac['callsign'], fields
+
+    def _resolve_position(self, ac, cpr, surface, now):
+        odd, lat_cpr, lon_cpr = cpr
+        frame = (lat_cpr, lon_cpr, now)
+        ac['odd' if odd else 'even'] = frame
+
+        pos = None
+        even_f, odd_f = ac['even'], ac['odd']
+        if not surface and even_f and odd_f and abs(even_f[2] - odd_f[2]) <= CPR_MAX_PAIR_AGE:
+            pos = cpr_global(even_f, odd_f)
+
+        if pos is None:
+            # Local decode: prefer the aircraft's own recent fix, then the receiver site
+            if ac['pos'] and now - ac['pos_time'] < 30:
+                ref_lat, ref_lon = ac['pos']
+            else:
+                ref_lat, ref_lon = self.ref_lat, self.ref_lon
+            pos = cpr_local(lat_cpr, lon_cpr, odd, ref_lat, ref_lon, surface)
+            if _approx_nm(pos, (ref_lat, ref_lon)) > CPR_MAX_LOCAL_NM:
+                return None
+
+        if abs(pos[0]) < 0.1 and abs(pos[1]) < 0.1:
+            return None
+        ac['pos'] = pos
+        ac['pos_time'] = now
+        return pos
+
+    def expire(self, now=None):
+        """Drops aircraft not heard from in max_age seconds."""
+        now = now or time.time()
+        stale = [k for k, v in self.aircraft.items() if now - v['last_seen'] > self.max_age]
+        for k in stale:
+            del self.aircraft[k]
+        return len(stale)
+
+
+def _approx_nm(p1, p2):
+    """Equirectangular distance in NM, good enough for range gating."""
+    dlat = p1[0] - p2[0]
+    dlon = (p1[1] - p2[1]) * math.cos(math.radians((p1[0] + p2[0]) / 2))
+    return 60.0 * math.hypot(dlat, dlon)
@@ -1,80 +1,178 @@
-import requests
 import time
 import os
 import sys
+import argparse
+from urllib.parse import urlsplit
+
+import numpy as np
 
 # ==============================================================================
 # Service: live_labeler.py
 # Role: AI Training Supervisor
 # Description: Monitors physics and writes 'Ground Truth' labels to InfluxDB.
+#              Reads aircraft state from the MQTT live state bus.
+#              The rule set is a vectorized classifier (classify_batch) over
+#              whole columns; the same code labels the live snapshot and,
+#              with --offline, weeks of exported local_aircraft_state data:
+#                python3 live_labeler.py --offline secure_skies_local_v2.csv
 # ==============================================================================
 
 INFLUX_HOST = os.getenv("INFLUX_HOST", "http://influxdb:8086")
 DB_NAME = "readsb"
-WRITE_URL = f"{INFLUX_HOST}/write?db={DB_NAME}"
 
 # Physics Thresholds
-LANDING_ALT = 1500      
-TAKEOFF_VS = 500        
-LANDING_VS = -300       
-CRUISE_ALT = 25000      
+LANDING_ALT = 1500
+TAKEOFF_VS = 500
+LANDING_VS = -300
+CRUISE_ALT = 25000
+
+STATE_FIELDS = ["alt_baro_ft", "vert_rate_fpm", "gs_knots", "track"]
+
+# Offline input columns: raw Influx field names or the extract_csv_from_dump names
+OFFLINE_COLUMNS = {
+    "alt": ["alt_baro_ft", "Baro_Altitude"],
+    "vs": ["vert_rate_fpm", "v_rate_fpm", "Vertical_Rate"],
+    "speed": ["gs_knots", "Velocity"],
+}
+OFFLINE_CHUNK_ROWS = 1_000_000
 
-def get_snapshot():
-    q = 'SELECT last("alt_baro_ft"), last("vert_rate_fpm"), last("gs_knots"), last("track") FROM "local_aircraft_state" WHERE time > now() - 1m GROUP BY "icao24", "callsign"'
+def get_snapshot(state):
     try:
-        r = requests.get(f"{INFLUX_HOST}/query", params={'db': DB_NAME, 'q': q}, timeout=5)
-        return r.json()
+        return state.snapshot(max_age=60)
     except Exception as e:
-        print(f"Query Error: {e}")
+        print(f"Snapshot Error: {e}")
         return None
 
+def classify_batch(alt, vs, speed):
+    """
+    Vectorized rule set. Takes equal-length arrays (missing values = 0) and
+    returns an array of labels. Conditions are in priority order, exactly as
+    the original if/elif chain.
+    """
+    alt = np.asarray(alt, dtype=float)
+    vs = np.asarray(vs, dtype=float)
+    speed = np.asarray(speed, dtype=float)
+    low = alt < LANDING_ALT
+    conditions = [
+        (alt < 200) & (speed < 40),
+        low & (vs < LANDING_VS),
+        low & (vs > TAKEOFF_VS),
+        low & (speed > 120),
+        (alt > CRUISE_ALT) & (vs > -100) & (vs < 100),
+        vs > 1500,
+        vs < -1500,
+    ]
+    choices = ["TAXI_PARKED", "FINAL_APPROACH", "TAKEOFF_CLIMB", "LOW_PASS",
+               "CRUISE_FLIGHT", "RAPID_CLIMB", "RAPID_DESCENT"]
+    return np.select(conditions, choices, default="EN_ROUTE")
+
 def classify(alt, vs, speed):
-    if alt < 200 and speed < 40: return "TAXI_PARKED"
-    if alt < LANDING_ALT:
-        if vs < LANDING_VS: return "FINAL_APPROACH"
-        elif vs > TAKEOFF_VS: return "TAKEOFF_CLIMB"
-        elif speed > 120: return "LOW_PASS"
-    if alt > CRUISE_ALT and -100 < vs < 100: return "CRUISE_FLIGHT"
-    if vs > 1500: return "RAPID_CLIMB"
-    if vs < -1500: return "RAPID_DESCENT"
-    return "EN_ROUTE"
+    """Single-aircraft convenience wrapper around classify_batch()."""
+    return str(classify_batch([alt], [vs], [speed])[0])
+
+def snapshot_to_columns(snapshot):
+    """{icao: record} -> (icaos, callsigns, alt, vs, speed) with None -> 0."""
+    icaos = list(snapshot)
+    recs = [snapshot[i] for i in icaos]
+    callsigns = [r.get('callsign') or 'unknown' for r in recs]
+    alt = np.array([r.get('alt_baro_ft') or 0 for r in recs], dtype=float)
+    vs = np.array([r.get('vert_rate_fpm') or 0 for r in recs], dtype=float)
+    speed = np.array([r.get('gs_knots') or 0 for r in recs], dtype=float)
+    return icaos, callsigns, alt, vs, speed
+
+def run_live():
+    from influxdb import InfluxDBClient
+    from influx_writer import InfluxWriter
+    from aircraft_state import connect_state
 
-def main():
     print("--- 🤖 AI LABELING SERVICE STARTED ---")
-    
+    writer = InfluxWriter(INFLUX_HOST, DB_NAME, name="live-labeler")
+    url = urlsplit(INFLUX_HOST)
+    client = InfluxDBClient(host=url.hostname, port=url.port or 8086, database=DB_NAME)
+    state = connect_state("LiveLabeler", client, STATE_FIELDS)
+
     while True:
-        data = get_snapshot()
-        if data and 'results' in data and 'series' in data['results'][0]:
-            lines = []
+        data = get_snapshot(state)
+        if data:
             now_ns = int(time.time() * 1e9)
-            
-            for series in data['results'][0]['series']:
-                tags = series.get('tags', {})
-                icao = tags.get('icao24', 'unknown')
-                callsign = tags.get('callsign', 'unknown')
-                
-                vals = series['values'][0]
-                alt = vals[1] if vals[1] is not None else 0
-                vs = vals[2] if vals[2] is not None else 0
-                speed = vals[3] if vals[3] is not None else 0
-                
-                label = classify(alt, vs, speed)
-                
-                # Write to 'ai_training_labels' table
-                line = f"ai_training_labels,icao24={icao},callsign={callsign},maneuver={label} alt_ft={int(alt)}i,vs_fpm={int(vs)}i,confidence=1.0 {now_ns}"
-                lines.append(line)
-            
+            icaos, callsigns, alt, vs, speed = snapshot_to_columns(data)
+            labels = classify_batch(alt, vs, speed)
+            alt_i = alt.astype(int).tolist()
+            vs_i = vs.astype(int).tolist()
+
+            # Write to 'ai_training_labels' table (one batch per cycle)
+            lines = [
+                f"ai_training_labels,icao24={icao},callsign={callsign},maneuver={label} alt_ft={a}i,vs_fpm={v}i,confidence=1.0 {now_ns}"
+                for icao, callsign, label, a, v in zip(icaos, callsigns, labels.tolist(), alt_i, vs_i)
+            ]
+
             if lines:
-                try:
-                    requests.post(WRITE_URL, data="\n".join(lines), timeout=5)
-                    # Log interesting events for verification
-                    for l in lines:
-                        if "TAKEOFF" in l or "FINAL" in l:
-                            print(f"🏷️  LABELED: {l.split(',')[2]} -> {l.split(',')[3].split(' ')[0]}")
-                except:
-                    pass
+                writer.write_lines(lines)
+                # Log interesting events for verification
+                for i in np.flatnonzero((labels == "TAKEOFF_CLIMB") | (labels == "FINAL_APPROACH")):
+                    print(f"🏷️  LABELED: {icaos[i]} -> {labels[i]}")
 
         time.sleep(5)
 
+def pick_column(df, names):
+    for name in names:
+        if name in df.columns:
+            return df[name]
+    return None
+
+def run_offline(input_path, output_path):
+    """Relabels an exported local_aircraft_state CSV/Parquet file in column chunks."""
+    import pandas as pd
+
+    print(f"[OFFLINE] Labeling {input_path} -> {output_path}")
+    if input_path.endswith(".parquet"):
+        chunks = [pd.read_parquet(input_path)]
+    else:
+        chunks = pd.read_csv(input_path, chunksize=OFFLINE_CHUNK_ROWS, low_memory=False)
+
+    start = time.time()
+    total = 0
+    counts = {}
+    header = True
+    for df in chunks:
+        cols = {k: pick_column(df, names) for k, names in OFFLINE_COLUMNS.items()}
+        missing = [k for k, c in cols.items() if c is None]
+        if missing:
+            print(f"[ERROR] Input has no column for: {', '.join(missing)}")
+            sys.exit(1)
+        values = {k: pd.to_numeric(c, errors='coerce').fillna(0).to_numpy() for k, c in cols.items()}
+        labels = classify_batch(values["alt"], values["vs"], values["speed"])
+
+        out = pd.DataFrame({
+            "Timestamp": pick_column(df, ["time", "Timestamp"]),
+            "ICAO24": pick_column(df, ["icao24", "ICAO24"]),
+            "Callsign": pick_column(df, ["callsign", "Callsign"]),
+            "maneuver": labels,
+            "alt_ft": values["alt"].astype(int),
+            "vs_fpm": values["vs"].astype(int),
+        })
+        out.to_csv(output_path, mode='w' if header else 'a', header=header, index=False)
+        header = False
+
+        total += len(out)
+        for label, n in zip(*np.unique(labels, return_counts=True)):
+            counts[label] = counts.get(label, 0) + int(n)
+        print(f"  > Labeled {total:,} rows...", end='\r')
+
+    print(f"\n[OFFLINE] {total:,} rows in {time.time() - start:.1f}s")
+    for label, n in sorted(counts.items(), key=lambda kv: -kv[1]):
+        print(f"  {label:<16} {n:>12,}")
+
+def main():
+    parser = argparse.ArgumentParser(description="AI training labeler (live service or offline relabeling)")
+    parser.add_argument("--offline", metavar="INPUT", help="Label an exported CSV/Parquet file instead of the live feed")
+    parser.add_argument("--out", default="ai_training_labels.csv", help="Output CSV for --offline")
+    args = parser.parse_args()
+
+    if args.offline:
+        run_offline(args.offline, args.out)
+    else:
+        run_live()
+
 if __name__ == "__main__":
     main()
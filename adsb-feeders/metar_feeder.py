@@ -2,25 +2,55 @@ import requests
 import time
 import os
 import re
+import json
+import paho.mqtt.client as mqtt
+
+from influx_writer import InfluxWriter
 
 # ==============================================================================
 # Script: metar_feeder.py
 # Service: Local Weather (METAR)
-# Version: 1.0.1 (Restoration)
-# Description: Fetches real-time aviation weather for EFHK (Helsinki).
+# Version: 1.2.0 (Weather Events)
+# Description: Fetches real-time aviation weather for EFHK (Helsinki) and any
+#              extra stations in METAR_STATIONS. Every new observation is also
+#              published (retained) on MQTT 'aviation/weather/<station>' so
+#              consumers (physics-guard QNH) update without polling InfluxDB.
 # ==============================================================================
 
 # Configuration
 INFLUX_HOST = os.getenv("INFLUX_HOST", "http://influxdb:8086")
 INFLUX_DB = os.getenv("INFLUX_DB", "readsb")
-INFLUX_WRITE_URL = f"{INFLUX_HOST}/write?db={INFLUX_DB}"
 
-STATION = "EFHK"
-METAR_URL = f"https://tgftp.nws.noaa.gov/data/observations/metar/stations/{STATION}.TXT"
+STATIONS = [s.strip().upper() for s in os.getenv("METAR_STATIONS", "EFHK").split(',') if s.strip()]
+METAR_URL = "https://tgftp.nws.noaa.gov/data/observations/metar/stations/{station}.TXT"
+
+MQTT_HOST = os.getenv("MQTT_HOST", "mqtt")
+MQTT_PORT = int(os.getenv("MQTT_PORT", 1883))
+MQTT_TOPIC_WEATHER = "aviation/weather"
+
+def setup_mqtt():
+    client = mqtt.Client("MetarFeeder")
+    try:
+        client.connect(MQTT_HOST, MQTT_PORT, 60)
+        client.loop_start()
+        print(f"[METAR] Publishing observations to mqtt://{MQTT_HOST}:{MQTT_PORT}/{MQTT_TOPIC_WEATHER}/#")
+        return client
+    except Exception as e:
+        print(f"[METAR] MQTT unavailable ({e}). InfluxDB only.")
+        return None
 
-def parse_metar(raw):
+def publish_weather(client, parsed, raw):
+    """Retained, so a consumer that (re)connects gets the current QNH immediately."""
+    if client is None:
+        return
+    msg = {k: v for k, v in parsed.items() if k != "raw_metar"}
+    msg["raw_metar"] = raw.strip()
+    msg["ts"] = time.time()
+    client.publish(f"{MQTT_TOPIC_WEATHER}/{parsed['station']}", json.dumps(msg), qos=1, retain=True)
+
+def parse_metar(raw, station="EFHK"):
     data = {
-        "station": STATION,
+        "station": station,
         "raw_metar": f'"{raw.strip()}"'
     }
     
@@ -50,35 +80,39 @@ def parse_metar(raw):
     return data
 
 def main():
-    print(f"[METAR] Starting Weather Feeder for {STATION}...")
+    print(f"[METAR] Starting Weather Feeder for {', '.join(STATIONS)}...")
     
-    last_raw = ""
+    last_raw = {}
+    writer = InfluxWriter(INFLUX_HOST, INFLUX_DB, name="metar-feeder")
+    mqtt_client = setup_mqtt()
     
     while True:
-        try:
-            r = requests.get(METAR_URL, timeout=10)
-            if r.status_code == 200:
-                lines = r.text.strip().split('\n')
-                if len(lines) >= 2:
-                    current_metar = lines[1]
-                    
-                    if current_metar != last_raw:
-                        last_raw = current_metar
-                        parsed = parse_metar(current_metar)
-                        
-                        tags = f"station={parsed['station']}"
-                        fields = []
-                        for k, v in parsed.items():
-                            if k != "station":
-                                fields.append(f"{k}={v}")
+        for station in STATIONS:
+            try:
+                r = requests.get(METAR_URL.format(station=station), timeout=10)
+                if r.status_code == 200:
+                    lines = r.text.strip().split('\n')
+                    if len(lines) >= 2:
+                        current_metar = lines[1]
                         
-                        line = f"weather_local,{tags} {','.join(fields)}"
+                        if current_metar != last_raw.get(station):
+                            last_raw[station] = current_metar
+                            parsed = parse_metar(current_metar, station)
+                            
+                            tags = f"station={parsed['station']}"
+                            fields = []
+                            for k, v in parsed.items():
+                                if k != "station":
+                                    fields.append(f"{k}={v}")
+                            
+                            line = f"weather_local,{tags} {','.join(fields)} {time.time_ns()}"
+                            
+                            writer.write(line)
+                            publish_weather(mqtt_client, parsed, current_metar)
+                            print(f"[METAR] Updated: {current_metar}")
                         
-                        requests.post(INFLUX_WRITE_URL, data=line)
-                        print(f"[METAR] Updated: {current_metar}")
-                    
-        except Exception as e:
-            print(f"[METAR] Error: {e}")
+            except Exception as e:
+                print(f"[METAR] {station} Error: {e}")
             
         time.sleep(300)
 
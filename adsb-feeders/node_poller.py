@@ -0,0 +1,125 @@
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+# ==============================================================================
+# Module: node_poller.py
+# Version: 1.0.0 (Concurrent Node Polling)
+# Description:
+#   Shared polling layer for the sensor node HTTP APIs (readsb /data/*.json).
+#   - One keep-alive Session (connection pool) per node.
+#   - All nodes fetched concurrently on a thread pool.
+#   - Per-node deadline: a slow node is reported as late, it never stalls
+#     the cycle beyond its own deadline.
+#   - Per-node fetch latency is returned with every result.
+#
+#   This file is shared: adsb-feeders/ holds the master copy, the other
+#   services carry an identical copy in their build context. Edit the
+#   master only, then run tools/sync_shared_modules.py.
+# ==============================================================================
+
+DEFAULT_DEADLINE = 2.0  # Seconds
+
+
+class NodeResult:
+    """Outcome of one node fetch."""
+    __slots__ = ("node", "data", "latency_ms", "error")
+
+    def __init__(self, node, data=None, latency_ms=None, error=None):
+        self.node = node
+        self.data = data
+        self.latency_ms = latency_ms
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None and self.data is not None
+
+
+class NodePoller:
+    """
+    Usage:
+        poller = NodePoller({"keimola-office": "http://192.168.1.153:8080"})
+        results = poller.fetch("/data/aircraft.json")
+        for node, res in results.items():
+            if res.ok: ...
+    """
+
+    def __init__(self, nodes, deadline=DEFAULT_DEADLINE, deadlines=None):
+        self.nodes = dict(nodes)
+        self.deadline = deadline
+        self.deadlines = deadlines or {}
+        self.sessions = {name: self._make_session() for name in self.nodes}
+        # Two slots per node so a hung request cannot starve the other path
+        self.executor = ThreadPoolExecutor(max_workers=max(2, 2 * len(self.nodes)),
+                                           thread_name_prefix="node-poller")
+        self.inflight = {}  # (node, path) -> Future still running from an earlier cycle
+
+    @staticmethod
+    def _make_session():
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=0)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _get(self, node, path, timeout):
+        start = time.time()
+        try:
+            r = self.sessions[node].get(f"{self.nodes[node]}{path}", timeout=timeout)
+            latency = (time.time() - start) * 1000
+            if r.status_code != 200:
+                return NodeResult(node, latency_ms=latency, error=f"HTTP {r.status_code}")
+            return NodeResult(node, r.json(), latency)
+        except Exception as e:
+            return NodeResult(node, latency_ms=(time.time() - start) * 1000, error=type(e).__name__)
+
+    def fetch_all(self, paths):
+        """
+        Fetches every path from every node concurrently.
+        Returns {node: {path: NodeResult}}.
+        """
+        start = time.time()
+        futures = {}
+        results = {node: {} for node in self.nodes}
+
+        for node in self.nodes:
+            deadline = self.deadlines.get(node, self.deadline)
+            for path in paths:
+                key = (node, path)
+                prev = self.inflight.get(key)
+                if prev is not None and not prev.done():
+                    # Previous request is still hanging; don't pile up more on a dead node
+                    results[node][path] = NodeResult(node, error="previous request still pending")
+                    continue
+                fut = self.executor.submit(self._get, node, path, deadline)
+                self.inflight[key] = fut
+                futures[key] = (fut, start + deadline)
+
+        # Collect in deadline order so one late node never delays an earlier one
+        for (node, path), (fut, due) in sorted(futures.items(), key=lambda kv: kv[1][1]):
+            try:
+                results[node][path] = fut.result(timeout=max(0.0, due - time.time()))
+            except FutureTimeout:
+                results[node][path] = NodeResult(node, latency_ms=(time.time() - start) * 1000,
+                                                 error="deadline exceeded")
+            else:
+                self.inflight.pop((node, path), None)
+
+        return results
+
+    def fetch(self, path):
+        """Fetches one path from every node. Returns {node: NodeResult}."""
+        return {node: res[path] for node, res in self.fetch_all([path]).items()}
+
+
+def format_latencies(results):
+    """'office=12ms balcony=FAIL(deadline exceeded)' style summary for heartbeat logs."""
+    parts = []
+    for node, res in results.items():
+        if res.ok:
+            parts.append(f"{node}={res.latency_ms:.0f}ms")
+        else:
+            parts.append(f"{node}=FAIL({res.error})")
+    return " ".join(parts)
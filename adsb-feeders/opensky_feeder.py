@@ -5,19 +5,23 @@ import re
 import sys
 from datetime import datetime
 
+from influx_writer import InfluxWriter
+
 # ==============================================================================
 # Script: opensky_feeder.py
 # Service: Global Truth Data (OpenSky Network)
-# Version: 6.0.0 (AI Schema Alignment)
+# Version: 6.2.0 (Position Timestamps)
 # Description: 
 #   Fetches Global Reference data using OAuth2.
 #   Aligns schema EXACTLY with local_aircraft_state for AI comparison.
+#   Rows are stamped with OpenSky's 'time_position' (when the position was
+#   last updated), not with the poll time, so they can be time-aligned with
+#   the local feed.
 # ==============================================================================
 
 # --- CONFIGURATION ---
 INFLUX_HOST = os.getenv("INFLUX_HOST", "http://influxdb:8086")
 INFLUX_DB = os.getenv("INFLUX_DB", "readsb")
-INFLUX_WRITE_URL = f"{INFLUX_HOST}/write?db={INFLUX_DB}"
 
 # OAuth2 Credentials
 CLIENT_ID = os.getenv("OPENSKY_CLIENT_ID")
@@ -90,6 +94,8 @@ def main():
     if not CLIENT_ID or not CLIENT_SECRET:
         print("❌ CRITICAL: OPENSKY_CLIENT_ID or OPENSKY_CLIENT_SECRET missing.")
         print("   Running in Anonymous Mode (Very limited rate/data).")
+
+    writer = InfluxWriter(INFLUX_HOST, INFLUX_DB, name="opensky-feeder")
     
     while True:
         try:
@@ -161,15 +167,16 @@ def main():
                             f'origin_data="GlobalReference"'
                         ]
                         
-                        lines.append(f"global_aircraft_state,{tags} {','.join(fields)} {now_ns}")
+                        # Position time (s[3]), else last contact (s[4]), else poll time
+                        pos_time = s[3] or s[4]
+                        ts_ns = int(pos_time * 1e9) if pos_time else now_ns
+                        
+                        lines.append(f"global_aircraft_state,{tags} {','.join(fields)} {ts_ns}")
 
                     # Write to Influx
                     if lines:
-                        w = requests.post(INFLUX_WRITE_URL, data="\n".join(lines), timeout=5)
-                        if w.status_code < 400:
-                            print(f"[OpenSky] Pushed {len(lines)} aircraft (Global Truth).")
-                        else:
-                            print(f"[OpenSky] DB Write Error: {w.status_code}")
+                        writer.write_lines(lines)
+                        print(f"[OpenSky] Pushed {len(lines)} aircraft (Global Truth).")
                 else:
                     print(f"[OpenSky] Area Empty.")
 
@@ -1,13 +1,16 @@
-import requests
 import time
 import os
 import re
 from datetime import datetime
 
+from node_poller import NodePoller
+from influx_writer import InfluxWriter
+
 # ==============================================================================
 # Script: readsb_feeder.py
-# Version: 3.0.0 (System Vitals - Stats.json)
+# Version: 3.2.0 (Batched Writer)
 # Description: Ingests global performance metrics (Range, Msg Rate, CPU).
+#              Nodes are polled concurrently; fetch latency is recorded per node.
 # ==============================================================================
 
 NODES = {
@@ -18,25 +21,21 @@ NODES = {
 
 INFLUX_HOST = os.getenv("INFLUX_HOST", "http://influxdb:8086")
 INFLUX_DB = os.getenv("INFLUX_DB", "readsb")
-INFLUX_WRITE_URL = f"{INFLUX_HOST}/write?db={INFLUX_DB}"
 
 MEASUREMENT = "local_performance"
-
-def fetch_stats(base_url):
-    try:
-        r = requests.get(f"{base_url}/data/stats.json", timeout=2)
-        if r.status_code == 200: return r.json()
-    except:
-        pass
-    return None
+NODE_DEADLINE = float(os.getenv("NODE_DEADLINE", 2))  # Max wait per node (seconds)
 
 def main():
-    print(f"--- Performance Feeder v3.0.0 Started ---")
+    print(f"--- Performance Feeder v3.2.0 Started ---")
+    poller = NodePoller(NODES, deadline=NODE_DEADLINE)
+    writer = InfluxWriter(INFLUX_HOST, INFLUX_DB, name="performance-feeder")
     while True:
         lines = []
-        for node_name, node_url in NODES.items():
-            data = fetch_stats(node_url)
-            if not data: continue
+        now_ns = time.time_ns()
+        results = poller.fetch("/data/stats.json")
+        for node_name, res in results.items():
+            if not res.ok: continue
+            data = res.data
             
             # --- 1. GLOBAL COUNTERS ---
             # These are instant snapshots of the tracker state
@@ -74,16 +73,14 @@ def main():
                 f"positions_last1min={pos_rate}i",
                 f"max_range_meters={max_range_m}",
                 f"remote_bytes_in={remote_bytes_in}i",
-                f"cpu_load_ms={cpu_load}i"
+                f"cpu_load_ms={cpu_load}i",
+                f"fetch_latency_ms={round(res.latency_ms, 1)}"
             ]
             
-            lines.append(f"{MEASUREMENT},{tags} {','.join(fields)}")
+            lines.append(f"{MEASUREMENT},{tags} {','.join(fields)} {now_ns}")
 
         if lines:
-            try:
-                requests.post(INFLUX_WRITE_URL, data="\n".join(lines), timeout=2)
-            except Exception as e:
-                print(f"Write Error: {e}")
+            writer.write_lines(lines)
             
         time.sleep(10)
 
@@ -1,16 +1,27 @@
-import requests
 import time
 import os
 import re
+import threading
 from datetime import datetime
 
+from beast_decoder import BeastTracker, iter_beast_frames, signal_to_rssi
+from node_poller import NodePoller, format_latencies
+from influx_writer import InfluxWriter
+from aircraft_state import StatePublisher, lp_fields_to_dict
+
 # ==============================================================================
 # Script: readsb_position_feeder.py
-# Version: 3.0.0 (The "All-Seeing Eye")
+# Version: 3.5.0 (Live State Bus)
 # Author: Operations Team
 # Description: 
 #   Ingests detailed aircraft telemetry from Readsb/Tar1090 JSON endpoint.
 #   Now captures Pilot Intent (FMS), GPS Integrity (NIC/SIL), and Signal Data.
+#   INGEST_MODE=beast decodes the Beast stream (port 30005) message by message
+#   instead of polling aircraft.json once per second.
+#   DELTA_MODE drops aircraft that have not updated since the last poll
+#   ("skip") or writes only the fields that changed between keyframes ("fields").
+#   Every written update is also published on MQTT 'aviation/state/<host>'
+#   (aircraft_state.py) so detectors read live state without querying InfluxDB.
 # ==============================================================================
 
 NODES = {
@@ -21,10 +32,30 @@ NODES = {
 # InfluxDB Configuration
 INFLUX_HOST = os.getenv("INFLUX_HOST", "http://influxdb:8086")
 INFLUX_DB = os.getenv("INFLUX_DB", "readsb")
-INFLUX_WRITE_URL = f"{INFLUX_HOST}/write?db={INFLUX_DB}"
 
 MEASUREMENT = "local_aircraft_state"
 FETCH_INTERVAL = 1  # How often to poll (seconds)
+NODE_DEADLINE = float(os.getenv("NODE_DEADLINE", 2))  # Max wait per node (seconds)
+
+# Ingest Mode: "json" (poll aircraft.json) or "beast" (stream port 30005)
+INGEST_MODE = os.getenv("INGEST_MODE", "json").lower()
+
+# Beast sources as "name=host:port;name=host:port" (default: fused readsb feed)
+BEAST_SOURCES = os.getenv("BEAST_SOURCES", "central-brain=readsb:30005")
+BEAST_FLUSH_INTERVAL = float(os.getenv("BEAST_FLUSH_INTERVAL", 0.25))  # Seconds
+BEAST_BATCH_SIZE = int(os.getenv("BEAST_BATCH_SIZE", 500))  # Lines per write
+
+# Delta Emission (JSON mode)
+# "off"    : Write every aircraft on every poll (legacy behaviour)
+# "skip"   : Drop aircraft whose last update time ('now' - 'seen') has not moved
+# "fields" : "skip" + write only changed fields, full row every KEYFRAME_INTERVAL
+DELTA_MODE = os.getenv("DELTA_MODE", "skip").lower()
+KEYFRAME_INTERVAL = float(os.getenv("KEYFRAME_INTERVAL", 30))  # Seconds
+DELTA_STATE_TTL = 300  # Forget aircraft not updated for this long (seconds)
+
+# Receiver reference position (for local CPR decoding)
+REF_LAT = float(os.getenv("LAT", 60.319555))
+REF_LON = float(os.getenv("LON", 24.830819))
 
 def clean_tag(value):
     """Removes spaces/special chars to prevent Line Protocol breakage."""
@@ -43,30 +74,149 @@ def get_val(data, key, default=0, type_cast=float):
     except:
         return default
 
-def fetch_node_data(base_url):
-    """Pulls the live aircraft.json from the Readsb API."""
-    try:
-        url = f"{base_url}/data/aircraft.json"
-        r = requests.get(url, timeout=2)
-        if r.status_code == 200: return r.json()
-    except:
-        pass
-    return None
+class DeltaTracker:
+    """
+    Per-node, per-ICAO memory of the last written row.
+    Decides whether an aircraft is written at all, and which fields.
+    """
 
-def main():
-    print(f"--- Position Feeder v3.0.0 (Full Telemetry) Started ---")
+    def __init__(self, mode, keyframe_interval):
+        self.mode = mode
+        self.keyframe_interval = keyframe_interval
+        self.state = {}  # (node, icao) -> {'updated', 'callsign', 'fields', 'keyframe', 'seen_at'}
+        self.last_prune = time.time()
+
+    def filter(self, node, icao, callsign, last_update, fields, now):
+        """
+        fields: list of 'key=value' strings.
+        Returns the list of fields to write, or None to drop the aircraft.
+        """
+        if self.mode == "off":
+            return fields
+
+        key = (node, icao)
+        prev = self.state.get(key)
+        if prev and prev['updated'] == last_update:
+            return None
+
+        current = dict(f.split('=', 1) for f in fields)
+        keyframe = (
+            self.mode != "fields" or prev is None
+            or prev['callsign'] != callsign
+            or now - prev['keyframe'] >= self.keyframe_interval
+        )
+
+        if keyframe:
+            out = fields
+            keyframe_at = now
+        else:
+            last = prev['fields']
+            out = [f for f in fields if last.get(f.split('=', 1)[0]) != f.split('=', 1)[1]]
+            keyframe_at = prev['keyframe']
+
+        self.state[key] = {
+            'updated': last_update, 'callsign': callsign,
+            'fields': current, 'keyframe': keyframe_at, 'seen_at': now
+        }
+        return out or None
+
+    def prune(self, now):
+        """Drops aircraft that left coverage (cheap, runs once a minute)."""
+        if now - self.last_prune < 60:
+            return
+        self.last_prune = now
+        stale = [k for k, v in self.state.items() if now - v['seen_at'] > DELTA_STATE_TTL]
+        for k in stale:
+            del self.state[k]
+
+def format_field(key, value):
+    """Formats one Line Protocol field, keeping the types of the JSON path."""
+    if isinstance(value, str):
+        return f'{key}="{value}"'
+    if isinstance(value, int):
+        return f"{key}={value}i"
+    return f"{key}={float(value)}"
+
+def parse_beast_sources(spec):
+    """'office=192.168.1.153:30005;balcony=...' -> {'office': ('192.168.1.153', 30005)}"""
+    sources = {}
+    for entry in spec.split(';'):
+        if '=' not in entry: continue
+        name, addr = entry.split('=', 1)
+        host, _, port = addr.strip().rpartition(':')
+        sources[clean_tag(name)] = (host, int(port))
+    return sources
+
+def beast_source_loop(node_name, host, port, writer, state):
+    """Decodes one Beast stream forever, pushing ready Line Protocol rows."""
+    tracker = BeastTracker(REF_LAT, REF_LON)
+    last_expire = time.time()
+
+    while True:
+        try:
+            print(f"[BEAST] Connecting to {node_name} ({host}:{port})...")
+            for msg, _, signal in iter_beast_frames(host, port):
+                now = time.time()
+                update = tracker.update(msg, now)
+                if update:
+                    icao, callsign, fields = update
+                    fields['rssi'] = signal_to_rssi(signal)
+                    fields['origin_data'] = "LocalBeast"
+
+                    tags = f"icao24={icao},callsign={clean_tag(callsign)},host={node_name},source=LocalBeast"
+                    field_str = ','.join(format_field(k, v) for k, v in fields.items())
+                    writer.write(f"{MEASUREMENT},{tags} {field_str} {int(now * 1e9)}")
+                    state.add(node_name, icao, clean_tag(callsign), now,
+                              dict(fields, pos_ts=now) if 'lat' in fields else fields)
+
+                if now - last_expire > 60:
+                    tracker.expire(now)
+                    last_expire = now
+        except Exception as e:
+            print(f"[BEAST] {node_name} stream error: {e}. Reconnecting in 5s...")
+            time.sleep(5)
+
+def run_beast():
+    """Streams Beast frames from all sources; the writer flushes small batches."""
+    sources = parse_beast_sources(BEAST_SOURCES)
+    print(f"--- Position Feeder v3.5.0 (Beast Stream: {', '.join(sources)}) Started ---")
+
+    writer = InfluxWriter(INFLUX_HOST, INFLUX_DB, name="position-feeder",
+                          batch_size=BEAST_BATCH_SIZE, flush_interval=BEAST_FLUSH_INTERVAL)
+    state = StatePublisher("PositionFeeder", interval=BEAST_FLUSH_INTERVAL)
+    for node_name, (host, port) in sources.items():
+        threading.Thread(target=beast_source_loop, args=(node_name, host, port, writer, state), daemon=True).start()
+
+    last_written = 0
+    while True:
+        time.sleep(60)
+        # Heartbeat log every 60 seconds
+        stats = writer.stats
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Pushed {stats['written'] - last_written} messages (Beast Stream). Spooled: {stats['spooled']}")
+        last_written = stats['written']
+
+def run_json():
+    print(f"--- Position Feeder v3.5.0 (Full Telemetry, Delta: {DELTA_MODE}) Started ---")
     last_log = 0
+    writer = InfluxWriter(INFLUX_HOST, INFLUX_DB, name="position-feeder")
+    state = StatePublisher("PositionFeeder")
+    delta = DeltaTracker(DELTA_MODE, KEYFRAME_INTERVAL)
+    # Pulls the live aircraft.json from every node concurrently (keep-alive sessions)
+    poller = NodePoller(NODES, deadline=NODE_DEADLINE)
     
     while True:
         start_time = time.time()
         lines = []
+        delta.prune(start_time)
+        results = poller.fetch("/data/aircraft.json")
         
-        for node_name, node_url in NODES.items():
-            data = fetch_node_data(node_url)
-            if not data: continue
+        for node_name, res in results.items():
+            if not res.ok: continue
+            data = res.data
 
             # ReadsB timestamp (Nanoseconds for InfluxDB)
-            now = int(data.get('now', time.time()) * 1e9)
+            data_now = data.get('now', time.time())
+            now = int(data_now * 1e9)
             
             for ac in data.get('aircraft', []):
                 # We only log aircraft that have a Hex ID and a Position.
@@ -126,6 +276,7 @@ def main():
                     rssi = get_val(ac, 'rssi', -49.5, float)
                     messages = get_val(ac, 'messages', 0, int) # Total msgs from this plane
                     seen = get_val(ac, 'seen', 0.0, float) # Seconds since last update
+                    seen_pos = get_val(ac, 'seen_pos', seen, float) # Seconds since last position
 
                     # --- CONSTRUCT FIELD SET ---
                     fields = [
@@ -165,22 +316,36 @@ def main():
                         f"seen_seconds={seen}",
                         f'origin_data="LocalReadsb"'
                     ]
+
+                    # --- DELTA FILTER ---
+                    # 'seen' is relative to the snapshot, so now - seen is the last update time
+                    last_update = round(data_now - seen, 1)
+                    fields = delta.filter(node_name, icao, call, last_update, fields, start_time)
+                    if not fields: continue
                     
                     lines.append(f"{MEASUREMENT},{tags} {','.join(fields)} {now}")
+                    update = lp_fields_to_dict(fields)
+                    if 'lat' in update:
+                        # Position time: 'seen' also counts velocity / identity messages
+                        update['pos_ts'] = round(data_now - seen_pos, 1)
+                    state.add(node_name, icao, call, last_update, update)
 
         if lines:
-            try:
-                requests.post(INFLUX_WRITE_URL, data="\n".join(lines), timeout=2)
+            writer.write_lines(lines)
                 
-                # Heartbeat log every 60 seconds
-                if time.time() - last_log > 60:
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Pushed {len(lines)} aircraft (Full Telemetry).")
-                    last_log = time.time()
-            except Exception as e:
-                print(f"Write Error: {e}")
+            # Heartbeat log every 60 seconds
+            if time.time() - last_log > 60:
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] Pushed {len(lines)} aircraft (Full Telemetry). Fetch: {format_latencies(results)}")
+                last_log = time.time()
 
         # Sleep to maintain fetch interval
         time.sleep(max(0, FETCH_INTERVAL - (time.time() - start_time)))
 
+def main():
+    if INGEST_MODE == "beast":
+        run_beast()
+    else:
+        run_json()
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# ==============================================================================
+# DATASET I/O v1.0.0 (Columnar Parquet Datasets)
+# ==============================================================================
+# Author:      RW / Central Brain Project
+# Description: Shared reader/writer for the AI training datasets.
+#              - Writer: typed Arrow tables appended to a Hive-partitioned
+#                Parquet dataset  <name>.parquet/date=YYYY-MM-DD/icao_bucket=X/
+#                (icao_bucket = first hex digit of the ICAO address, so one
+#                aircraft always lives in one bucket without creating
+#                thousands of per-aircraft files). Rows are sorted by
+#                icao+time inside each file, icao is dictionary-encoded,
+#                compression is zstd.
+#              - Reader: memory-mapped columnar read of only the requested
+#                columns/days; falls back to the legacy CSV datasets.
+#
+# Requires: pyarrow (pip install pyarrow)
+# ==============================================================================
+
+import glob
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import fs
+
+FEATURES = ['lat', 'lon', 'alt_baro_ft', 'gs_knots', 'track', 'v_rate_fpm']
+
+SCHEMA = pa.schema([
+    ('time', pa.timestamp('ns', tz='UTC')),
+    ('icao', pa.dictionary(pa.int32(), pa.string())),
+    ('lat', pa.float64()),
+    ('lon', pa.float64()),
+    ('alt_baro_ft', pa.float32()),
+    ('gs_knots', pa.float32()),
+    ('track', pa.float32()),
+    ('v_rate_fpm', pa.float32()),
+])
+
+PARTITIONING = ds.partitioning(pa.schema([('date', pa.string()), ('icao_bucket', pa.string())]), flavor='hive')
+COMPRESSION = 'zstd'
+ROW_GROUP_ROWS = 256 * 1024
+CHECKPOINT_NAME = "_harvest.json"   # Harvester progress; '_' files are skipped by pyarrow
+
+def series_to_table(series_list, features=FEATURES):
+    """
+    InfluxDB raw JSON series (query(..., epoch='ns').raw['series'], grouped
+    by icao24) -> typed Arrow table sorted by icao, time. No per-point dicts.
+    """
+    times, icaos, cols = [], [], {f: [] for f in features}
+    for series in series_list:
+        names = series['columns']
+        values = series['values']
+        if not values:
+            continue
+        icao = (series.get('tags') or {}).get('icao24')
+        columns = list(zip(*values))
+        times.append(np.asarray(columns[names.index('time')], dtype=np.int64))
+        icaos.append(np.full(len(values), icao, dtype=object))
+        for f in features:
+            cols[f].append(np.asarray(columns[names.index(f)], dtype=float) if f in names
+                           else np.full(len(values), np.nan))
+
+    if not times:
+        return None
+    arrays = {
+        'time': pa.array(np.concatenate(times), type=pa.timestamp('ns', tz='UTC')),
+        'icao': pa.array(np.concatenate(icaos), type=pa.string()),
+    }
+    for f in features:
+        arrays[f] = pa.array(np.concatenate(cols[f]), type=SCHEMA.field(f).type, from_pandas=True)
+    return sort_and_encode(pa.table(arrays))
+
+def sort_and_encode(table):
+    """Sorts by icao, time (on plain strings) and dictionary-encodes icao."""
+    icao_idx = table.schema.get_field_index('icao')
+    if pa.types.is_dictionary(table.schema.field(icao_idx).type):
+        table = table.set_column(icao_idx, 'icao', table['icao'].cast(pa.string()))
+    table = table.sort_by([('icao', 'ascending'), ('time', 'ascending')])
+    return table.set_column(icao_idx, 'icao', pc.dictionary_encode(table['icao']))
+
+def add_partition_columns(table):
+    """Adds 'date' (UTC day) and 'icao_bucket' (first hex digit) for the partitioning."""
+    day = pc.strftime(table['time'], format='%Y-%m-%d')
+    icao = table['icao'].cast(pa.string())
+    bucket = pc.utf8_lower(pc.utf8_slice_codeunits(icao, 0, 1))
+    return table.append_column('date', day).append_column('icao_bucket', bucket)
+
+def write_table(table, root, part_name):
+    """Appends one table (e.g. one time slice) to the dataset under root."""
+    table = add_partition_columns(table)
+    ds.write_dataset(
+        table, root, format='parquet', partitioning=PARTITIONING,
+        basename_template=f"{part_name}-{{i}}.parquet",
+        existing_data_behavior='overwrite_or_ignore',
+        file_options=ds.ParquetFileFormat().make_write_options(compression=COMPRESSION),
+        max_rows_per_group=ROW_GROUP_ROWS, min_rows_per_group=min(ROW_GROUP_ROWS, table.num_rows))
+
+def is_complete(path):
+    """False for a Parquet dataset whose harvest was interrupted (see fetch_training_data --resume)."""
+    ckpt = os.path.join(path, CHECKPOINT_NAME)
+    if not os.path.exists(ckpt):
+        return True
+    with open(ckpt) as f:
+        return json.load(f).get('complete', False)
+
+def latest_dataset(dataset_dir):
+    """Newest complete dataset in dataset_dir: a *.parquet dataset directory, else a legacy *.csv."""
+    candidates = [p for p in glob.glob(os.path.join(dataset_dir, "*.parquet")) if is_complete(p)]
+    candidates += glob.glob(os.path.join(dataset_dir, "*.csv"))
+    return max(candidates, key=os.path.getctime) if candidates else None
+
+def load_dataset(path, columns=None, days=None):
+    """
+    DataFrame sorted by icao, time.
+      columns: columns to read (None = all); 'icao' and 'time' are always included
+      days:    optional list of 'YYYY-MM-DD' partitions to read (Parquet only)
+    Parquet is read memory-mapped and only the requested columns are touched.
+    """
+    if path.endswith('.csv'):
+        df = pd.read_csv(path, usecols=None if columns is None else lambda c: c in set(columns) | {'icao', 'time'})
+        df['time'] = pd.to_datetime(df['time'], format='ISO8601')
+        return df.sort_values(by=['icao', 'time'], kind='stable').reset_index(drop=True)
+
+    dataset = ds.dataset(path, format='parquet', partitioning=PARTITIONING,
+                         filesystem=fs.LocalFileSystem(use_mmap=True))
+    if columns is not None:
+        columns = ['time', 'icao'] + [c for c in columns if c not in ('time', 'icao')]
+    flt = ds.field('date').isin(days) if days else None
+    table = sort_and_encode(dataset.to_table(columns=columns, filter=flt))
+    return table.to_pandas(self_destruct=True)
+
+def dataset_info(path):
+    """(rows, days) of a Parquet dataset from the file metadata only."""
+    files = glob.glob(os.path.join(path, "date=*", "*", "*.parquet"))
+    rows = sum(pq.ParquetFile(f).metadata.num_rows for f in files)
+    days = sorted({os.path.basename(os.path.dirname(os.path.dirname(f)))[5:] for f in files})
+    return rows, days
@@ -5,9 +5,10 @@
 # Updates:
 # - Added MODEL C: GRU Evaluation
 # - Added "Architecture Battle" (LSTM vs GRU) comparison
+# - Reads Parquet datasets via dataset_io (legacy CSV still supported)
+# - Per-flight windows (sequences.py); LSTM/GRU scored on the NEXT position
 # ==============================================================================
 
-import pandas as pd
 import numpy as np
 import joblib
 import tensorflow as tf
@@ -16,6 +17,8 @@ import os
 import re
 import matplotlib.pyplot as plt
 from sklearn.metrics import mean_squared_error, mean_absolute_error
+from dataset_io import FEATURES, latest_dataset, load_dataset
+from sequences import Sequences
 
 # === PATH CONFIGURATION ===
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -28,12 +31,9 @@ if not os.path.exists(EVAL_DIR):
     os.makedirs(EVAL_DIR)
 
 SEQ_LEN = 10
+HORIZON = 1
 TEST_SPLIT = 0.2
-FEATURE_NAMES = ['lat', 'lon', 'alt_baro_ft', 'gs_knots', 'track', 'v_rate_fpm']
-
-def get_latest_dataset():
-    files = glob.glob(f"{DATASET_DIR}/*.csv")
-    return max(files, key=os.path.getctime) if files else None
+FEATURE_NAMES = FEATURES
 
 def get_run_ids():
     ids = []
@@ -45,12 +45,6 @@ def get_run_ids():
         ids.append("LEGACY")
     return sorted(ids)
 
-def create_sequences(data, seq_len):
-    X = []
-    for i in range(len(data) - seq_len):
-        X.append(data[i : i + seq_len])
-    return np.array(X)
-
 def evaluate(y_true, y_pred, name):
     mse = mean_squared_error(y_true.flatten(), y_pred.flatten())
     rmse = np.sqrt(mse)
@@ -111,10 +105,10 @@ def plot_architecture_battle(y_true, pred_lstm, pred_gru, run_id, scaler):
 def main():
     print(f"📊 EVALUATOR v1.5 | Root: {PROJECT_ROOT}")
     
-    csv_file = get_latest_dataset()
-    if not csv_file: return print("❌ No data found.")
+    dataset = latest_dataset(DATASET_DIR)
+    if not dataset: return print("❌ No data found.")
     
-    df = pd.read_csv(csv_file)
+    df = load_dataset(dataset, columns=FEATURE_NAMES)
     data = df[FEATURE_NAMES].values
     
     run_ids = get_run_ids()
@@ -134,8 +128,8 @@ def main():
 
         scaler = joblib.load(s_p)
         data_scaled = scaler.transform(data)
-        X_all = create_sequences(data_scaled, SEQ_LEN)
-        X_test = X_all[int(len(X_all) * (1 - TEST_SPLIT)):]
+        _, test_seqs = Sequences.from_frame(df, data_scaled, SEQ_LEN, HORIZON).split(TEST_SPLIT)
+        X_test, y_test = test_seqs.take()
         
         # Hold predictions for comparison
         pred_lstm = None
@@ -146,7 +140,7 @@ def main():
             try:
                 model = tf.keras.models.load_model(l_p, compile=False)
                 pred_lstm = model.predict(X_test, verbose=0)
-                evaluate(X_test[:, -1, :], pred_lstm, "LSTM")
+                evaluate(y_test, pred_lstm, "LSTM")
             except: pass
 
         # 2. Evaluate GRU (NEW)
@@ -154,7 +148,7 @@ def main():
             try:
                 model = tf.keras.models.load_model(g_p, compile=False)
                 pred_gru = model.predict(X_test, verbose=0)
-                evaluate(X_test[:, -1, :], pred_gru, "GRU")
+                evaluate(y_test, pred_gru, "GRU")
             except Exception as e: print(f"   ❌ GRU Error: {e}")
 
         # 3. Evaluate Autoencoder
@@ -168,7 +162,7 @@ def main():
 
         # 4. Visual Battle (LSTM vs GRU)
         if pred_lstm is not None and pred_gru is not None:
-            f_battle = plot_architecture_battle(X_test[:, -1, :], pred_lstm, pred_gru, run_id, scaler)
+            f_battle = plot_architecture_battle(y_test, pred_lstm, pred_gru, run_id, scaler)
             print(f"      ⚔️  Architecture Battle Saved: {os.path.basename(f_battle)}")
 
 if __name__ == "__main__":
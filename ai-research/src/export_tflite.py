@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# ==============================================================================
+# TFLITE EXPORTER v1.0.0 (GRU -> Raspberry Pi)
+# ==============================================================================
+# Author:      RW / Central Brain Project
+# Description: Converts a trained trajectory GRU (trajectory_gru_v2_<run>.h5)
+#              to TensorFlow Lite for the trajectory-guard service and writes
+#              the scaler next to it as plain JSON (no sklearn/joblib on the Pi).
+#
+#   models/trajectory_gru_v2_<run>.tflite   model (builtin ops only)
+#   models/trajectory_gru_v2_<run>.json     features, seq_len, horizon, scaler
+#
+#   --quantize none     float32 weights
+#   --quantize dynamic  int8 weights, float32 activations (~4x smaller, faster on ARM)
+#   --quantize float16  float16 weights (~2x smaller, no accuracy loss worth noting)
+#
+# Usage: python3 export_tflite.py [--run 20251202-065402] [--quantize dynamic]
+# ==============================================================================
+
+import argparse
+import glob
+import json
+import os
+import re
+from datetime import datetime
+
+import joblib
+import tensorflow as tf
+
+from dataset_io import FEATURES
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+MODEL_DIR = os.path.join(PROJECT_ROOT, "models")
+
+SEQ_LEN = 10
+HORIZON = 1  # Must match train_models.py of the exported run
+
+def log(msg):
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] {msg}")
+
+def latest_run():
+    runs = [re.search(r"trajectory_gru_v2_(.*)\.h5", f).group(1)
+            for f in glob.glob(f"{MODEL_DIR}/trajectory_gru_v2_*.h5")]
+    return max(runs) if runs else None
+
+def convert(model, quantize):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    # Builtin ops only: the Pi runs tflite-runtime, which has no Flex (TF ops) delegate
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS]
+    if quantize in ("dynamic", "float16"):
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantize == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    return converter.convert()
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the trajectory GRU to TensorFlow Lite")
+    parser.add_argument("--run", help="Run ID (default: newest trajectory_gru_v2_*.h5)")
+    parser.add_argument("--quantize", choices=["none", "dynamic", "float16"], default="dynamic")
+    parser.add_argument("--horizon", type=int, default=HORIZON, help="Prediction horizon the run was trained with")
+    args = parser.parse_args()
+
+    run_id = args.run or latest_run()
+    if not run_id:
+        return log(f"❌ No trajectory_gru_v2_*.h5 in {MODEL_DIR}")
+
+    model_path = f"{MODEL_DIR}/trajectory_gru_v2_{run_id}.h5"
+    scaler_path = f"{MODEL_DIR}/scaler_v2_{run_id}.gz"
+    log(f"📂 Loading {os.path.basename(model_path)}")
+    model = tf.keras.models.load_model(model_path, compile=False)
+    scaler = joblib.load(scaler_path)
+
+    seq_len = model.input_shape[1] or SEQ_LEN
+    log(f"🔧 Converting (quantize={args.quantize})...")
+    tflite_model = convert(model, args.quantize)
+
+    out = f"{MODEL_DIR}/trajectory_gru_v2_{run_id}"
+    with open(out + ".tflite", "wb") as f:
+        f.write(tflite_model)
+    with open(out + ".json", "w") as f:
+        json.dump({
+            "run_id": run_id,
+            "features": FEATURES,
+            "seq_len": int(seq_len),
+            "horizon": args.horizon,
+            "scaler_min": scaler.min_.tolist(),
+            "scaler_scale": scaler.scale_.tolist(),
+            "quantize": args.quantize,
+        }, f, indent=2)
+
+    log(f"✅ {os.path.basename(out)}.tflite ({len(tflite_model) / 1024:.0f} KiB) + .json")
+    log(f"   Keras model: {os.path.getsize(model_path) / 1024:.0f} KiB")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 # ==============================================================================
-# DATA HARVESTER v2.0.0
+# DATA HARVESTER v3.1.0
 # ==============================================================================
 # Author:      RW / Central Brain Project
 # Description: Extracts high-volume flight telemetry from InfluxDB for AI training.
@@ -14,17 +14,34 @@
 #         - Added 'datasets/' directory management.
 #         - Added execution timer and detailed logging.
 #         - Scaled to 7-Day window for production model training.
+#   v3.0: Columnar export.
+#         - Window fetched in 1h slices (epoch='ns', raw series -> Arrow,
+#           no per-point dicts), each slice appended to a Parquet dataset
+#           partitioned by day and ICAO bucket (see dataset_io.py).
+#         - Output: datasets/training_data_<window>_<ts>.parquet/
+#   v3.1: Parallel + resumable.
+#         - Slices are queried concurrently (--workers, default 3) with a
+#           bounded number in flight, so neither the laptop's memory nor
+#           the Pi's InfluxDB sees the whole window at once.
+#         - Every finished slice is recorded in <dataset>/_harvest.json;
+#           --resume <dataset> re-queries only the missing slices.
+#         - Failed slices are retried, then left for the next --resume.
 # ==============================================================================
 
-import pandas as pd
 from influxdb import InfluxDBClient
+import argparse
+import json
 import os
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
 
-__version__ = "2.0.0"
-__updated__ = "2025-12-02 04:15"
+from dataset_io import FEATURES, CHECKPOINT_NAME, series_to_table, write_table, dataset_info, load_dataset
+
+__version__ = "3.1.0"
+__updated__ = "2026-10-16 14:00"
 
 # ==========================================
 # ⚙️ CONFIGURATION
@@ -37,93 +54,204 @@ DB_NAME = 'readsb'
 # Training Window: "7d" for the final model, "24h" for quick tests
 TIME_WINDOW = "7d" 
 
+# Each slice is one query -> one Arrow table -> appended to the dataset
+SLICE_SECONDS = 3600
+
+# Concurrent slice queries (keep low: InfluxDB runs on the Pi)
+WORKERS = 3
+QUERY_RETRIES = 3
+QUERY_TIMEOUT = 300  # seconds per slice query
+
 # Output Configuration
 OUTPUT_DIR = "datasets"
-TIMESTAMP_STR = datetime.now().strftime("%Y%m%d_%H%M")
-OUTPUT_FILE = f"{OUTPUT_DIR}/training_data_{TIME_WINDOW}_{TIMESTAMP_STR}.csv"
+
+_local = threading.local()
 
 def log(msg):
     """Helper for timestamped logging"""
     now = datetime.now().strftime("%H:%M:%S")
     print(f"[{now}] {msg}")
 
+def window_seconds(window):
+    """InfluxQL-style duration ('7d', '24h', '90m') -> seconds."""
+    units = {'d': 86400, 'h': 3600, 'm': 60, 's': 1}
+    return int(window[:-1]) * units[window[-1]]
+
+def slice_query(t0_ns, t1_ns):
+    # Filter: Only moving planes (>50kts) to remove ground noise
+    return f"""
+        SELECT {", ".join(f'"{f}"' for f in FEATURES)}
+        FROM "local_aircraft_state"
+        WHERE time >= {t0_ns} AND time < {t1_ns}
+        AND "gs_knots" > 50
+        GROUP BY "icao24"
+    """
+
+def get_client():
+    """One InfluxDB client (HTTP session) per worker thread."""
+    if not hasattr(_local, 'client'):
+        _local.client = InfluxDBClient(host=INFLUX_HOST, port=INFLUX_PORT, database=DB_NAME, timeout=QUERY_TIMEOUT)
+    return _local.client
+
+def fetch_slice(t0, t1):
+    """Queries one slice (epoch='ns', raw series) -> Arrow table or None. Retries with backoff."""
+    for attempt in range(1, QUERY_RETRIES + 1):
+        try:
+            result = get_client().query(slice_query(t0 * 10**9, t1 * 10**9), epoch='ns')
+            return series_to_table(result.raw.get('series', []))
+        except Exception as e:
+            if attempt == QUERY_RETRIES:
+                raise
+            log(f"⚠️ Slice {datetime.fromtimestamp(t0)} failed ({e}), retry {attempt}/{QUERY_RETRIES - 1}...")
+            time.sleep(2 ** attempt)
+
+# --- Checkpoint: <dataset>/_harvest.json (ignored by the Parquet reader) ---
+
+def load_checkpoint(path):
+    with open(os.path.join(path, CHECKPOINT_NAME)) as f:
+        return json.load(f)
+
+def save_checkpoint(path, ckpt):
+    """Atomic write: a crash never leaves a half-written checkpoint."""
+    target = os.path.join(path, CHECKPOINT_NAME)
+    with open(target + ".tmp", 'w') as f:
+        json.dump(ckpt, f)
+    os.replace(target + ".tmp", target)
+
+def new_checkpoint(window, slice_seconds):
+    end_s = int(time.time())
+    return {
+        'window': window,
+        'start_s': end_s - window_seconds(window),
+        'end_s': end_s,
+        'slice_seconds': slice_seconds,
+        'done': [],
+        'rows': 0,
+        'complete': False,
+    }
+
+def harvest(path, ckpt, workers):
+    """
+    Queries all slices not yet in ckpt['done'] with at most `workers` queries
+    in flight. Slices are written (and checkpointed) in the main thread as
+    they arrive, so memory holds at most `workers` slices.
+    Returns the number of slices that failed.
+    """
+    step = ckpt['slice_seconds']
+    slices = list(enumerate(range(ckpt['start_s'], ckpt['end_s'], step)))
+    done = set(ckpt['done'])
+    todo = [(n, t0) for n, t0 in slices if n not in done]
+    log(f"📥 {len(todo)}/{len(slices)} slices to fetch ({workers} parallel)...")
+
+    failed = 0
+    pending = {}
+    queue = iter(todo)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def submit_next():
+            item = next(queue, None)
+            if item is not None:
+                n, t0 = item
+                pending[pool.submit(fetch_slice, t0, min(t0 + step, ckpt['end_s']))] = (n, t0)
+
+        for _ in range(workers):
+            submit_next()
+
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                n, t0 = pending.pop(future)
+                submit_next()
+                try:
+                    table = future.result()
+                except Exception as e:
+                    failed += 1
+                    log(f"❌ Slice {n} ({datetime.fromtimestamp(t0)}) failed: {e}")
+                    continue
+
+                rows = 0
+                if table is not None:
+                    # Deterministic file names: a slice re-run after a crash overwrites its own files
+                    write_table(table, path, f"slice{n:05d}")
+                    rows = table.num_rows
+                ckpt['done'].append(n)
+                ckpt['rows'] += rows
+                save_checkpoint(path, ckpt)
+                log(f"   Slice {len(ckpt['done'])}/{len(slices)} ({datetime.fromtimestamp(t0):%m-%d %H:%M}): {rows:,} rows (total {ckpt['rows']:,})")
+
+    ckpt['complete'] = not failed
+    save_checkpoint(path, ckpt)
+    return failed
+
 def main():
+    parser = argparse.ArgumentParser(description="Harvest flight telemetry from InfluxDB into a Parquet dataset")
+    parser.add_argument("--window", default=TIME_WINDOW, help="Time window, e.g. 7d, 24h (default: %(default)s)")
+    parser.add_argument("--slice", type=int, default=SLICE_SECONDS, help="Slice length in seconds (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Concurrent slice queries (default: %(default)s)")
+    parser.add_argument("--resume", metavar="DATASET", help="Continue an interrupted harvest into this dataset")
+    args = parser.parse_args()
+
     print("="*60)
     print(f"🦅 CENTRAL BRAIN DATA HARVESTER v{__version__}")
     print(f"📅 Last Updated: {__updated__}")
     print("="*60)
 
-    # 1. Setup Environment
-    if not os.path.exists(OUTPUT_DIR):
-        log(f"Creating output directory: {OUTPUT_DIR}/")
-        os.makedirs(OUTPUT_DIR)
+    # 1. Setup Environment (new dataset or resume)
+    if args.resume:
+        path = args.resume
+        try:
+            ckpt = load_checkpoint(path)
+        except (OSError, ValueError) as e:
+            log(f"❌ No usable checkpoint in {path}: {e}")
+            sys.exit(1)
+        if ckpt['complete']:
+            log(f"✅ {path} is already complete ({ckpt['rows']:,} rows).")
+            sys.exit(0)
+        log(f"♻️  Resuming {path}: {len(ckpt['done'])} slices already done")
+    else:
+        ckpt = new_checkpoint(args.window, args.slice)
+        stamp = datetime.fromtimestamp(ckpt['end_s']).strftime("%Y%m%d_%H%M")
+        path = f"{OUTPUT_DIR}/training_data_{args.window}_{stamp}.parquet"
+        log(f"Creating dataset: {path}/")
+        os.makedirs(path, exist_ok=True)
+        save_checkpoint(path, ckpt)
 
     # 2. Connect to Database
     log(f"🔌 Connecting to Central Brain ({INFLUX_HOST})...")
     try:
-        client = InfluxDBClient(host=INFLUX_HOST, port=INFLUX_PORT)
-        client.switch_database(DB_NAME)
+        get_client().ping()
     except Exception as e:
         log(f"❌ Connection Failed: {e}")
         sys.exit(1)
 
-    # 3. Execute Query
-    log(f"📥 Fetching last {TIME_WINDOW} of flight telemetry...")
-    log("   (This may take 1-3 minutes for large datasets...)")
-    
+    # 3. Stream the window slice by slice into Parquet
+    log(f"📥 Fetching {ckpt['window']} of flight telemetry "
+        f"({datetime.fromtimestamp(ckpt['start_s'])} -> {datetime.fromtimestamp(ckpt['end_s'])})")
     start_time = time.time()
-
-    # Filter: Only moving planes (>50kts) to remove ground noise
-    query = f"""
-        SELECT "lat", "lon", "alt_baro_ft", "gs_knots", "track", "v_rate_fpm"
-        FROM "local_aircraft_state"
-        WHERE time > now() - {TIME_WINDOW}
-        AND "gs_knots" > 50
-        GROUP BY "icao24"
-    """
-
     try:
-        result = client.query(query)
-    except Exception as e:
-        log(f"❌ Query Failed: {e}")
-        sys.exit(1)
+        failed = harvest(path, ckpt, max(1, args.workers))
+    except KeyboardInterrupt:
+        log(f"⏸️  Interrupted. Continue with: --resume {path}")
+        sys.exit(130)
 
-    # 4. Process Data
-    data_points = []
-    for (name, tags), points in result.items():
-        icao = tags.get('icao24')
-        for p in points:
-            p['icao'] = icao
-            data_points.append(p)
+    if failed:
+        log(f"❌ {failed} slices failed. Continue with: --resume {path}")
+        sys.exit(1)
 
-    if not data_points:
+    if not ckpt['rows']:
         log("⚠️ No data found! Check your time window or database connection.")
         sys.exit(0)
 
-    log(f"🔄 Processing {len(data_points)} records into DataFrame...")
-    
-    df = pd.DataFrame(data_points)
-    
-    # Fix Timestamps (Critical for LSTM sequencing)
-    # Explicitly use ISO8601 to handle the 'Z' UTC marker
-    df['time'] = pd.to_datetime(df['time'], format='ISO8601')
-    
-    # Sort: Primary by Plane (ICAO), Secondary by Time
-    df = df.sort_values(by=['icao', 'time'])
-
-    # 5. Save Output
-    log(f"💾 Saving to {OUTPUT_FILE}...")
-    df.to_csv(OUTPUT_FILE, index=False)
-
-    # 6. Summary
+    # 4. Summary
     elapsed = time.time() - start_time
+    rows, days = dataset_info(path)
     log("-" * 30)
     log(f"✅ SUCCESS")
     log(f"⏱️ Time Elapsed: {elapsed:.2f} seconds")
-    log(f"📊 Total Rows:  {len(df)}")
-    log(f"📂 File Path:   {os.path.abspath(OUTPUT_FILE)}")
+    log(f"📊 Total Rows:  {rows}")
+    log(f"📅 Days:        {', '.join(days)}")
+    log(f"📂 Dataset:     {os.path.abspath(path)}")
     print("-" * 30)
-    print(df.head())
+    print(load_dataset(path, days=days[-1:]).head())
 
 if __name__ == "__main__":
     main()
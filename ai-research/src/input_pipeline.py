@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# ==============================================================================
+# INPUT PIPELINE v1.0.0 (Streaming tf.data for the Trainer)
+# ==============================================================================
+# Author:      RW / Central Brain Project
+# Description: Feeds train_models.py without ever holding the dataset in RAM.
+#
+#   shards (date=/icao_bucket= partitions)  -> shuffled shard order
+#     -> parallel interleave: read shard columns, scale with the persisted
+#        MinMaxScaler, per-flight windows (sequences.py), yield chunks
+#     -> unbatch -> [cache] -> shuffle buffer -> batch -> prefetch
+#
+#   A shard is one Parquet partition directory (one UTC day of one ICAO
+#   bucket), so every flight of that day is complete inside one shard.
+#   The scaler is fitted with partial_fit shard by shard.
+#   Validation = the last VAL_SPLIT of the windows of every shard.
+#   A legacy CSV dataset is a single shard.
+# ==============================================================================
+
+import glob
+import os
+
+import numpy as np
+from sklearn.preprocessing import MinMaxScaler
+
+from dataset_io import FEATURES, load_dataset
+from sequences import Sequences
+
+CHUNK_WINDOWS = 1024        # Windows per generator step (unbatched in C++)
+SHUFFLE_BUFFER = 64 * 1024  # Windows in the shuffle buffer
+INTERLEAVE = 4              # Shards read concurrently
+
+def list_shards(path):
+    """Partition directories of a Parquet dataset ([path] for a legacy CSV)."""
+    if path.endswith('.csv'):
+        return [path]
+    return sorted(glob.glob(os.path.join(path, "date=*", "icao_bucket=*")))
+
+def fit_scaler(shards, features=FEATURES):
+    """MinMaxScaler fitted incrementally, one shard in memory at a time."""
+    scaler = MinMaxScaler()
+    for shard in shards:
+        scaler.partial_fit(load_dataset(shard, columns=features)[features].to_numpy())
+    return scaler
+
+def scale(values, scaler):
+    """MinMaxScaler.transform as one float32 expression."""
+    return (values * scaler.scale_ + scaler.min_).astype(np.float32)
+
+def shard_windows(path, scaler, seq_len, horizon, subset, val_split, chunk=CHUNK_WINDOWS):
+    """Yields (X, y) chunks of the train or val windows of one shard."""
+    df = load_dataset(path, columns=FEATURES)
+    seqs = Sequences.from_frame(df, scale(df[FEATURES].to_numpy(), scaler), seq_len, horizon)
+    del df
+    train, val = seqs.split(val_split)
+    yield from (val if subset == 'val' else train).batches(chunk)
+
+def make_dataset(shards, scaler, seq_len, horizon, batch_size, subset='train',
+                 val_split=0.2, shuffle=False, reconstruct=False, cache=None):
+    """
+    tf.data.Dataset of (X, y) batches (or (X, X) with reconstruct=True).
+      subset: 'train' or 'val'
+      cache:  None = off, '' = in memory, path = file cache (per subset)
+    """
+    import tensorflow as tf
+
+    n = len(FEATURES)
+    x_spec = tf.TensorSpec((None, seq_len, n), tf.float32)
+    y_spec = tf.TensorSpec((None, n), tf.float32)
+
+    def windows(path):
+        return shard_windows(path.decode(), scaler, seq_len, horizon, subset, val_split)
+
+    files = tf.data.Dataset.from_tensor_slices(shards)
+    if shuffle:
+        files = files.shuffle(len(shards), reshuffle_each_iteration=True)
+    ds = files.interleave(
+        lambda p: tf.data.Dataset.from_generator(windows, args=(p,), output_signature=(x_spec, y_spec)),
+        cycle_length=INTERLEAVE, num_parallel_calls=tf.data.AUTOTUNE, deterministic=not shuffle)
+    ds = ds.unbatch()
+    if cache is not None:
+        ds = ds.cache(f"{cache}_{subset}" if cache else '')
+    if shuffle:
+        ds = ds.shuffle(SHUFFLE_BUFFER, reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size)
+    if reconstruct:
+        ds = ds.map(lambda x, y: (x, x), num_parallel_calls=tf.data.AUTOTUNE)
+    return ds.prefetch(tf.data.AUTOTUNE)
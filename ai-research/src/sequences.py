@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# ==============================================================================
+# SEQUENCES v1.0.0 (Per-Flight Windowing)
+# ==============================================================================
+# Author:      RW / Central Brain Project
+# Description: Builds the fixed-length training windows for the LSTM/GRU and
+#              autoencoder models.
+#              - A window never crosses an ICAO boundary or a time gap larger
+#                than MAX_GAP_S: the rows (sorted by icao, time as returned by
+#                dataset_io.load_dataset) are cut into contiguous flight
+#                segments and windows are only started inside a segment.
+#              - Windows are a zero-copy sliding_window_view over one float32
+#                array plus an index of valid start rows; a batch is only
+#                materialized when it is requested (batches() / dataset()).
+#              - Target: the row `horizon` steps after the window
+#                (horizon=1 = next position; horizon=0 = last input row).
+# ==============================================================================
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+MAX_GAP_S = 60  # Larger gap between two reports = new flight segment
+
+def segment_bounds(icao_codes, times_ns, max_gap_s=MAX_GAP_S):
+    """(starts, ends) row ranges of contiguous segments: same aircraft, no gap > max_gap_s."""
+    n = len(times_ns)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    breaks = (np.diff(icao_codes) != 0) | (np.diff(times_ns) > max_gap_s * 10**9)
+    starts = np.concatenate(([0], np.flatnonzero(breaks) + 1))
+    ends = np.append(starts[1:], n)
+    return starts, ends
+
+def window_starts(starts, ends, seq_len, horizon=0):
+    """First row of every window (seq_len inputs + horizon target rows) that fits in a segment."""
+    counts = np.clip(ends - starts - seq_len - horizon + 1, 0, None)
+    offsets = np.cumsum(counts) - counts
+    return np.repeat(starts - offsets, counts) + np.arange(counts.sum())
+
+class Sequences:
+    """
+    Windows over `data` (rows x features) restricted to the valid `starts`.
+    Nothing is copied until take() / batches() / dataset() is called.
+    """
+
+    def __init__(self, data, starts, seq_len, horizon=0):
+        self.data = data
+        self.starts = starts
+        self.seq_len = seq_len
+        self.horizon = horizon
+        # (rows - seq_len + 1, seq_len, features) strided view
+        self.windows = sliding_window_view(data, seq_len, axis=0).transpose(0, 2, 1)
+
+    @classmethod
+    def from_frame(cls, df, data, seq_len, horizon=0, max_gap_s=MAX_GAP_S):
+        """df: sorted by icao, time (load_dataset output); data: its (scaled) feature matrix."""
+        icao_codes = pd.factorize(df['icao'])[0]
+        times_ns = np.asarray(df['time'].values).astype('datetime64[ns]').view('int64')
+        starts, ends = segment_bounds(icao_codes, times_ns, max_gap_s)
+        data = np.ascontiguousarray(data, dtype=np.float32)
+        return cls(data, window_starts(starts, ends, seq_len, horizon), seq_len, horizon)
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def n_features(self):
+        return self.data.shape[1]
+
+    def split(self, fraction):
+        """(head, tail) with the last `fraction` of windows in tail (same data, no copy)."""
+        cut = int(len(self) * (1 - fraction))
+        head = Sequences(self.data, self.starts[:cut], self.seq_len, self.horizon)
+        tail = Sequences(self.data, self.starts[cut:], self.seq_len, self.horizon)
+        return head, tail
+
+    def take(self, idx=slice(None)):
+        """(X, y) for the selected windows: X (n, seq_len, features), y (n, features)."""
+        rows = self.starts[idx]
+        return self.windows[rows], self.data[rows + self.seq_len - 1 + self.horizon]
+
+    def batches(self, batch_size, shuffle=False, reconstruct=False, seed=None):
+        """Yields (X, y) batches; reconstruct=True yields (X, X) for the autoencoder."""
+        order = np.arange(len(self))
+        if shuffle:
+            np.random.default_rng(seed).shuffle(order)
+        for i in range(0, len(order), batch_size):
+            X, y = self.take(order[i:i + batch_size])
+            yield (X, X) if reconstruct else (X, y)
+
+    def dataset(self, batch_size, shuffle=False, reconstruct=False):
+        """tf.data.Dataset streaming batches() (reshuffled every epoch)."""
+        import tensorflow as tf
+
+        x_spec = tf.TensorSpec((None, self.seq_len, self.n_features), tf.float32)
+        y_spec = x_spec if reconstruct else tf.TensorSpec((None, self.n_features), tf.float32)
+        return tf.data.Dataset.from_generator(
+            lambda: self.batches(batch_size, shuffle, reconstruct),
+            output_signature=(x_spec, y_spec)).prefetch(tf.data.AUTOTUNE)
@@ -1,24 +1,27 @@
 #!/usr/bin/env python3
 # ==============================================================================
-# CENTRAL BRAIN AI TRAINER v3.0.0 (Overnight Deep Learning)
+# CENTRAL BRAIN AI TRAINER v3.1.0 (Overnight Deep Learning)
 # ==============================================================================
 # Configuration:
 # - EPOCHS: 2000 (Deep Convergence)
 # - PATIENCE: 50 (Allow for long plateaus)
 # - BATCH: 4096 (Max Saturation for Apple Silicon)
+# - DATA: Parquet datasets (columnar, mmap) via dataset_io; legacy CSV still read
+# - SEQUENCES: per-flight windows (sequences.py), streamed in batches;
+#   trajectory models predict the NEXT position (horizon=1)
+# - INPUT: streaming tf.data pipeline over dataset shards (input_pipeline.py);
+#   RAM use is bounded by the shuffle buffer, not by the dataset size
 # ==============================================================================
 
-import pandas as pd
-import numpy as np
 import joblib
 import tensorflow as tf
-import glob
 import os
 from datetime import datetime
-from sklearn.preprocessing import MinMaxScaler
 from tensorflow.keras.models import Sequential, Model
 from tensorflow.keras.layers import LSTM, GRU, Dense, Input, RepeatVector, TimeDistributed
 from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau
+from dataset_io import latest_dataset
+from input_pipeline import list_shards, fit_scaler, make_dataset
 
 # === PATH CONFIGURATION ===
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -28,56 +31,47 @@ MODEL_DIR = os.path.join(PROJECT_ROOT, "models")
 
 # === OVERNIGHT HYPERPARAMETERS ===
 SEQ_LEN = 10
+HORIZON = 1        # Predict the report after the window
+VAL_SPLIT = 0.2
 EPOCHS = 2000      # Let it run as long as it needs
 BATCH_SIZE = 4096  # Maximize M4 Max throughput
 PATIENCE = 50      # Don't give up easily
+CACHE = None       # Window cache: None = off, '' = RAM, or a file path prefix (fast local disk)
 
 def log(msg):
     print(f"[{datetime.now().strftime('%H:%M:%S')}] {msg}")
 
-def get_latest_dataset():
-    files = glob.glob(f"{DATASET_DIR}/*.csv")
-    if not files: return None
-    return max(files, key=os.path.getctime)
-
-def create_sequences(data, seq_len):
-    X = []
-    for i in range(len(data) - seq_len):
-        X.append(data[i : i + seq_len])
-    return np.array(X)
-
 def main():
     run_id = datetime.now().strftime("%Y%m%d-%H%M%S")
     total_start = datetime.now()
 
     print("="*60)
-    print(f"🧠 CENTRAL BRAIN TRAINER v3.0 (Overnight Edition)")
+    print(f"🧠 CENTRAL BRAIN TRAINER v3.1 (Overnight Edition)")
     print(f"🌙 Strategy: Deep Convergence")
     print(f"🆔 Run ID: {run_id}")
     print(f"⚙️  Config: Epochs={EPOCHS} | Patience={PATIENCE} | Batch={BATCH_SIZE}")
     print("="*60)
 
-    csv_file = get_latest_dataset()
-    if not csv_file:
+    dataset = latest_dataset(DATASET_DIR)
+    if not dataset:
         log(f"❌ No datasets found in {DATASET_DIR}")
         return
 
-    log(f"📂 Loading: {os.path.basename(csv_file)}")
-    df = pd.read_csv(csv_file)
-    
-    features = ['lat', 'lon', 'alt_baro_ft', 'gs_knots', 'track', 'v_rate_fpm']
-    data = df[features].values
+    shards = list_shards(dataset)
+    log(f"📂 Dataset: {os.path.basename(dataset)} ({len(shards)} shards)")
 
-    log("🔄 Normalizing...")
-    scaler = MinMaxScaler()
-    data_scaled = scaler.fit_transform(data)
+    log("🔄 Fitting scaler (shard by shard)...")
+    scaler = fit_scaler(shards)
 
     if not os.path.exists(MODEL_DIR): os.makedirs(MODEL_DIR)
     joblib.dump(scaler, f"{MODEL_DIR}/scaler_v2_{run_id}.gz")
 
-    log("🎞️  Sequencing...")
-    X_train = create_sequences(data_scaled, SEQ_LEN)
-    y_train = X_train[:, -1, :] 
+    log("🎞️  Building input pipeline...")
+    def pipeline(subset, reconstruct=False):
+        return make_dataset(shards, scaler, SEQ_LEN, HORIZON, BATCH_SIZE, subset=subset, val_split=VAL_SPLIT,
+                            shuffle=(subset == 'train'), reconstruct=reconstruct, cache=CACHE)
+    train_ds = pipeline('train')
+    val_ds = pipeline('val')
 
     # 1. Stop if no improvement for 50 epochs
     stopper = EarlyStopping(monitor='val_loss', patience=PATIENCE, restore_best_weights=True, verbose=1)
@@ -98,7 +92,7 @@ def main():
         Dense(6)
     ])
     model_a.compile(optimizer='adam', loss='mse', metrics=['mae', rmse_metric])
-    model_a.fit(X_train, y_train, epochs=EPOCHS, batch_size=BATCH_SIZE, validation_split=0.2, callbacks=callbacks_list, verbose=1)
+    model_a.fit(train_ds, validation_data=val_ds, epochs=EPOCHS, callbacks=callbacks_list, verbose=1)
     model_a.save(f"{MODEL_DIR}/trajectory_lstm_v2_{run_id}.h5")
 
     # --- MODEL B: AUTOENCODER ---
@@ -111,7 +105,8 @@ def main():
     
     model_b = Model(inputs, output)
     model_b.compile(optimizer='adam', loss='mse', metrics=['mae', rmse_metric])
-    model_b.fit(X_train, X_train, epochs=EPOCHS, batch_size=BATCH_SIZE, validation_split=0.2, callbacks=callbacks_list, verbose=1)
+    model_b.fit(pipeline('train', reconstruct=True), validation_data=pipeline('val', reconstruct=True),
+                epochs=EPOCHS, callbacks=callbacks_list, verbose=1)
     model_b.save(f"{MODEL_DIR}/anomaly_autoencoder_v2_{run_id}.h5")
 
     # --- MODEL C: GRU (The Champion) ---
@@ -124,7 +119,7 @@ def main():
         Dense(6)
     ])
     model_c.compile(optimizer='adam', loss='mse', metrics=['mae', rmse_metric])
-    model_c.fit(X_train, y_train, epochs=EPOCHS, batch_size=BATCH_SIZE, validation_split=0.2, callbacks=callbacks_list, verbose=1)
+    model_c.fit(train_ds, validation_data=val_ds, epochs=EPOCHS, callbacks=callbacks_list, verbose=1)
     model_c.save(f"{MODEL_DIR}/trajectory_gru_v2_{run_id}.h5")
 
     log(f"✅ Overnight Training Complete. Total time: {datetime.now() - total_start}")
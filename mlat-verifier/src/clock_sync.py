@@ -0,0 +1,203 @@
+import numpy as np
+
+from mlat_solver import C
+
+# ==============================================================================
+# Module: clock_sync.py
+# Version: 2.0.0 (Kalman Clock Offset + Drift)
+# Description:
+#   Puts the Beast timestamps of every receiver on the reference receiver's
+#   clock. readsb timestamps are a free-running 12 MHz counter per node
+#   (unrelated epochs, crystal drift of a few ppm), so raw arrival times of
+#   the same frame cannot be differenced directly.
+#   - Beacons: frames whose transmitter position is known (the airborne
+#     position the frame itself reports, from aircraft mlat-verifier
+#     trusts). Subtracting the flight time to each receiver gives the
+#     transmission time in every clock; differences between nodes are
+#     differences of their clock offsets.
+#   - One Kalman filter over all nodes, state = offset (ns) + drift (ns/s)
+#     of every node vs the reference; constant-drift model with white
+#     phase noise and random-walk frequency (SYNC_OFFSET_Q / SYNC_DRIFT_Q).
+#     Updated on every beacon group: one measurement per node vs a pivot
+#     node (the reference if it heard the frame), noise correlated through
+#     the shared pivot like the TDoA residuals.
+#   - A node joins on its first beacon shared with the reference.
+#     Innovations beyond SYNC_GATE_SIGMA are rejected; a run of rejections
+#     blamed on one node is a clock jump (readsb restart): that node
+#     rejoins from scratch.
+#   - A node is synced after SYNC_MIN_UPDATES updates while its offset
+#     1-sigma stays below SYNC_MAX_SIGMA_NS (it grows while no beacons
+#     arrive).
+# ==============================================================================
+
+BEAST_CLOCK_MODES = ("12mhz", "gps")
+SYNC_BEACON_SIGMA_NS = 60.0    # Per node and beacon: timestamp noise + 83 ns ticks + ADS-B position error
+SYNC_OFFSET_Q = 10.0 ** 2      # White phase noise (ns^2 per s)
+SYNC_DRIFT_Q = 20.0 ** 2       # Random-walk frequency ((ns/s)^2 per s): crystal temperature wander
+SYNC_DRIFT_SIGMA0 = 20000.0    # Drift uncertainty when a node joins (ns/s = 20 ppm)
+SYNC_GATE_SIGMA = 5.0          # Normalized innovation gate (per measurement)
+SYNC_RESET_AFTER = 20          # Consecutive rejections of one node = clock jump, rejoin
+SYNC_MIN_UPDATES = 10
+SYNC_MAX_SIGMA_NS = 100.0      # Offset 1-sigma for a node to count as synced
+
+
+def beast_timestamp_ns(ts, mode="12mhz"):
+    """
+    48-bit Beast timestamp -> int ns.
+      '12mhz': free-running counter (readsb / dump1090 default), 83.3 ns per tick
+      'gps'  : GPS-disciplined receivers, seconds of day << 30 | nanoseconds
+    """
+    if mode == "gps":
+        return (ts >> 30) * 1_000_000_000 + (ts & 0x3FFFFFFF)
+    return ts * 1000 // 12
+
+
+class ClockSync:
+
+    def __init__(self, rx_ecef, reference):
+        """rx_ecef: {node: (3,) ECEF m}; reference: node whose clock is the common timebase."""
+        self.rx_ecef = rx_ecef
+        self.reference = reference
+        self.nodes = [n for n in rx_ecef if n != reference]
+        self.index = {n: 2 * i for i, n in enumerate(self.nodes)}   # State slot: offset, drift
+        dim = 2 * len(self.nodes)
+        self.x = np.zeros(dim)
+        self.P = np.zeros((dim, dim))
+        self.base = {}                 # node -> int ns offset the state is relative to (joined nodes)
+        self.t = None                  # Filter time, reference clock (ns)
+        self.updates = dict.fromkeys(self.nodes, 0)
+        self.misses = dict.fromkeys(self.nodes, 0)
+        self.beacons = 0
+        self.rejected = 0
+
+    def flight_ns(self, node, ecef):
+        return int(round(np.linalg.norm(ecef - self.rx_ecef[node]) / C * 1e9))
+
+    def joined(self, node):
+        return node == self.reference or node in self.base
+
+    def _offset(self, node):
+        """(int base, float estimate) of a node's current offset; the reference is (0, 0)."""
+        if node == self.reference:
+            return 0, 0.0
+        return self.base[node], self.x[self.index[node]]
+
+    def _predict(self, t_ref):
+        if self.t is None:
+            self.t = t_ref
+            return
+        dt = (t_ref - self.t) * 1e-9
+        if dt < 0:
+            if dt < -1.0:   # Reference clock jumped back (restart / GPS day rollover): re-anchor
+                self.t = t_ref
+            return
+        self.t = t_ref
+        k = len(self.nodes)
+        F = np.kron(np.eye(k), np.array([[1.0, dt], [0.0, 1.0]]))
+        Q = np.kron(np.eye(k), np.array([
+            [SYNC_OFFSET_Q * dt + SYNC_DRIFT_Q * dt**3 / 3, SYNC_DRIFT_Q * dt**2 / 2],
+            [SYNC_DRIFT_Q * dt**2 / 2, SYNC_DRIFT_Q * dt]]))
+        self.x = F @ self.x
+        self.P = F @ self.P @ F.T + Q
+
+    def _join(self, node, offset):
+        i = self.index[node]
+        self.base[node] = offset
+        self.x[i:i + 2] = 0.0
+        self.P[i:i + 2, :] = 0.0
+        self.P[:, i:i + 2] = 0.0
+        self.P[i, i] = 2 * SYNC_BEACON_SIGMA_NS ** 2
+        self.P[i + 1, i + 1] = SYNC_DRIFT_SIGMA0 ** 2
+        self.updates[node] = self.misses[node] = 0
+
+    def _leave(self, node):
+        i = self.index[node]
+        self.base.pop(node, None)
+        self.x[i:i + 2] = 0.0
+        self.P[i:i + 2, :] = 0.0
+        self.P[:, i:i + 2] = 0.0
+        self.updates[node] = self.misses[node] = 0
+
+    def observe(self, times, ecef):
+        """One beacon: times {node: ns} of a frame transmitted from ECEF position `ecef`."""
+        tx = {n: t - self.flight_ns(n, ecef) for n, t in times.items() if n in self.rx_ecef}
+        known = [n for n in tx if self.joined(n)]
+        if not known:
+            return
+        self.beacons += 1
+        pivot = self.reference if self.reference in tx else known[0]
+        base_p, off_p = self._offset(pivot)
+        self._predict(tx[pivot] - base_p - int(round(off_p)))
+
+        if pivot == self.reference:
+            for n in tx:
+                if not self.joined(n):
+                    self._join(n, tx[n] - tx[pivot])
+
+        others = [n for n in known if n != pivot]
+        if not others:
+            return
+        m = len(others)
+        H = np.zeros((m, len(self.x)))
+        z = np.empty(m)
+        for r, n in enumerate(others):
+            H[r, self.index[n]] = 1.0
+            if pivot != self.reference:
+                H[r, self.index[pivot]] = -1.0
+            z[r] = (tx[n] - self.base[n]) - (tx[pivot] - base_p)
+
+        y = z - H @ self.x
+        S = H @ self.P @ H.T + SYNC_BEACON_SIGMA_NS ** 2 * (np.eye(m) + np.ones((m, m)))
+        score = np.abs(y) / np.sqrt(np.diag(S))
+        if score.max() > SYNC_GATE_SIGMA:
+            self.rejected += 1
+            worst = others[int(np.argmax(score))]
+            self.misses[worst] += 1
+            if self.misses[worst] >= SYNC_RESET_AFTER:
+                self._leave(worst)
+            return
+
+        K = np.linalg.solve(S, H @ self.P).T            # P H^T S^-1 (S and P symmetric)
+        self.x = self.x + K @ y
+        IKH = np.eye(len(self.x)) - K @ H
+        self.P = IKH @ self.P
+        self.P = (self.P + self.P.T) / 2
+        for n in others:
+            self.updates[n] += 1
+            self.misses[n] = 0
+
+    def sigma_ns(self, nodes):
+        """Worst offset 1-sigma among nodes (0 for the reference alone)."""
+        return max([float(np.sqrt(self.P[self.index[n], self.index[n]])) for n in nodes if n in self.base] or [0.0])
+
+    def synced(self, node):
+        if node == self.reference:
+            return True
+        return bool(node in self.base and self.updates[node] >= SYNC_MIN_UPDATES
+                    and self.P[self.index[node], self.index[node]] <= SYNC_MAX_SIGMA_NS ** 2)
+
+    def to_reference(self, node, t_ns):
+        """Node timestamp -> reference clock (int ns). Only valid for synced nodes."""
+        if node == self.reference:
+            return t_ns
+        i = self.index[node]
+        base, off, drift = self.base[node], self.x[i], self.x[i + 1]
+        dt = (t_ns - base - off - self.t) * 1e-9
+        return t_ns - base - int(round(off + drift * dt))
+
+    def status(self):
+        """{node: {offset_ns, drift_ppm, sigma_ns, updates, synced}} for the non-reference nodes."""
+        out = {}
+        for node in self.nodes:
+            if node not in self.base:
+                out[node] = {"updates": 0, "synced": False}
+                continue
+            i = self.index[node]
+            out[node] = {
+                "offset_ns": self.base[node] + self.x[i],
+                "drift_ppm": self.x[i + 1] * 1e-3,
+                "sigma_ns": float(np.sqrt(self.P[i, i])),
+                "updates": self.updates[node],
+                "synced": self.synced(node),
+            }
+        return out
@@ -0,0 +1,89 @@
+from collections import OrderedDict
+
+# ==============================================================================
+# Module: frame_grouper.py
+# Version: 1.0.0 (Cross-Receiver Frame Matching)
+# Description:
+#   Matches one Mode-S transmission across receivers: the same frame bytes
+#   (dict key = hash of the bytes) seen by several nodes within a short
+#   window of local arrival time.
+#   - Arrival time is cut into BUCKET_S buckets. A frame is looked up in
+#     the buckets of the last wait_s (newest first: a slower node delivers
+#     its copy later), otherwise it opens a new group in its own bucket.
+#   - A bucket is emitted once it is older than wait_s, i.e. every node
+#     had time to deliver its copy over the network.
+#   - Memory is bounded: at most max_groups open groups; past that the
+#     oldest bucket is emitted early.
+#   - A node delivering the same bytes twice inside one group (repeated
+#     identity / velocity squitters) makes the group ambiguous: dropped.
+# ==============================================================================
+
+BUCKET_S = 0.25          # Arrival-time bucket width (seconds)
+GROUP_WAIT_S = 1.0       # Emit a bucket this long after it closed (network latency)
+MAX_GROUPS = 50000       # Open groups across all buckets
+
+
+class FrameGroup:
+    """One transmission: frame bytes + {node: timestamp_ns}."""
+    __slots__ = ("frame", "first_seen", "times", "duplicate")
+
+    def __init__(self, frame, first_seen):
+        self.frame = frame
+        self.first_seen = first_seen
+        self.times = {}
+        self.duplicate = False
+
+
+class FrameGrouper:
+
+    def __init__(self, bucket_s=BUCKET_S, wait_s=GROUP_WAIT_S, max_groups=MAX_GROUPS):
+        self.bucket_s = bucket_s
+        self.wait_s = wait_s
+        self.max_groups = max_groups
+        self.lookback = int(wait_s / bucket_s) + 1
+        self.buckets = OrderedDict()   # bucket id -> {frame bytes: FrameGroup}, oldest first
+        self.open_groups = 0
+        self.stats = {"frames": 0, "groups": 0, "duplicates": 0, "evicted": 0}
+
+    def add(self, node, frame, ts_ns, arrival):
+        """Adds one received frame (ts_ns = node timestamp, arrival = local time.time())."""
+        self.stats["frames"] += 1
+        bid = int(arrival / self.bucket_s)
+        group = None
+        for b in range(bid, bid - self.lookback - 1, -1):
+            bucket = self.buckets.get(b)
+            if bucket is not None:
+                group = bucket.get(frame)
+                if group is not None:
+                    break
+
+        if group is None:
+            bucket = self.buckets.get(bid)
+            if bucket is None:
+                bucket = self.buckets[bid] = {}
+            group = bucket[frame] = FrameGroup(frame, arrival)
+            self.open_groups += 1
+            self.stats["groups"] += 1
+
+        if node in group.times:
+            group.duplicate = True
+        group.times[node] = ts_ns
+
+    def pop_ready(self, now, min_nodes=2):
+        """Closes buckets older than wait_s (or over the memory cap). Returns groups with >= min_nodes nodes."""
+        ready = []
+        limit = int((now - self.wait_s) / self.bucket_s) - 1
+        while self.buckets:
+            bid = next(iter(self.buckets))
+            if bid > limit and self.open_groups <= self.max_groups:
+                break
+            bucket = self.buckets.pop(bid)
+            self.open_groups -= len(bucket)
+            if bid > limit:
+                self.stats["evicted"] += len(bucket)
+            for group in bucket.values():
+                if group.duplicate:
+                    self.stats["duplicates"] += 1
+                elif len(group.times) >= min_nodes:
+                    ready.append(group)
+        return ready
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# ==============================================================================
+# Service: MLAT VERIFIER
+# Version: 1.1.0 (Kalman Clock Sync on Trusted Beacons)
+# Author: Operations Team
+# Description: Multilaterates aircraft from the raw Beast streams of every
+#              receiver node and checks the fix against the position the
+#              aircraft reports over ADS-B (spoofing / bad-GPS detection).
+#                1. One reader thread per node (MLAT_RECEIVERS): DF17/DF18
+#                   frames with their 12 MHz MLAT timestamp.
+#                2. frame_grouper.py matches identical frames across nodes
+#                   (hash of the frame bytes, bounded arrival-time buckets).
+#                3. clock_sync.py tracks offset + drift of every node clock
+#                   vs the reference node (Kalman filter, updated per
+#                   group). Beacons: airborne position frames with a high
+#                   integrity type code from aircraft without a recent
+#                   MISMATCH verdict.
+#                4. Groups heard by >= MIN_RECEIVERS synced nodes are solved
+#                   in one batch per receiver set (mlat_solver.solve_mlat_fast,
+#                   reported altitude as root hint).
+#                5. Horizontal distance MLAT fix <-> ADS-B position (the
+#                   frame's own CPR position, else the live state of
+#                   'local_aircraft_state' plus gs * age allowance).
+#              One 'mlat_verification' row per aircraft and cycle:
+#                CONSISTENT          median error within the limit
+#                MISMATCH            median error beyond the limit
+#                UNTRUSTED_GEOMETRY  no fix with GDOP <= GDOP_MAX and a
+#                                    unique root
+#              Nodes must be read directly: an aggregating readsb (like the
+#              central-brain one) re-stamps forwarded frames.
+# ==============================================================================
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+
+import numpy as np
+from influxdb import InfluxDBClient
+
+from influx_writer import InfluxWriter, escape_key
+from aircraft_state import connect_state
+from beast_decoder import iter_beast_frames, decode_message, cpr_local
+from frame_grouper import FrameGrouper
+from clock_sync import ClockSync, beast_timestamp_ns, BEAST_CLOCK_MODES
+from mlat_solver import lla_to_ecef, solve_mlat_fast, TIMING_SIGMA_NS
+
+# --- CONFIGURATION ---
+INFLUX_HOST = os.getenv('INFLUX_HOST', 'influxdb')
+INFLUX_PORT = int(os.getenv('INFLUX_PORT', 8086))
+INFLUX_DB   = os.getenv('INFLUX_DB', 'readsb')
+
+# Receivers: "name=host:port@lat,lon,alt_m;..." (antenna position, AMSL)
+MLAT_RECEIVERS = os.getenv('MLAT_RECEIVERS', 'keimola=192.168.1.153:30005@60.3196,24.8295,130')
+MLAT_REFERENCE = os.getenv('MLAT_REFERENCE', '')      # Clock reference node (default: first receiver)
+BEAST_CLOCK = os.getenv('BEAST_CLOCK', '12mhz')       # '12mhz' (readsb counter) or 'gps'
+
+# Verification
+CYCLE_SECONDS = float(os.getenv('CYCLE_SECONDS', 1.0))
+MIN_RECEIVERS = 4                 # 3 range differences for 3 unknowns
+MISMATCH_MIN_M = float(os.getenv('MISMATCH_MIN_M', 1000))  # Never flag below this error
+MISMATCH_SIGMAS = float(os.getenv('MISMATCH_SIGMAS', 5))   # ... or below this many sigma_h
+ALERT_COOLDOWN = 60               # Same aircraft logged at most once per this (seconds)
+BEACON_TYPECODES = (9, 10, 11, 20, 21)   # Position containment < 0.1 NM
+BEACON_BAN_S = 600                # A MISMATCH aircraft is no clock beacon for this long
+STATS_INTERVAL = 60
+
+STATE_FIELDS = ["lat", "lon", "alt_baro_ft", "gs_knots"]
+STATE_MAX_AGE = 10
+
+FT_TO_M = 0.3048
+KT_TO_MS = 0.514444
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(name)s] %(message)s')
+logger = logging.getLogger("MlatVerifier")
+
+def parse_receivers(spec):
+    """'keimola=192.168.1.153:30005@60.3196,24.8295,130;...' -> {'keimola': ('192.168.1.153', 30005, (lat, lon, alt))}"""
+    receivers = {}
+    for entry in spec.split(';'):
+        if '=' not in entry or '@' not in entry: continue
+        name, rest = entry.split('=', 1)
+        addr, coords = rest.split('@', 1)
+        host, _, port = addr.strip().rpartition(':')
+        lat, lon, alt = (float(v) for v in coords.split(','))
+        receivers[name.strip()] = (host, int(port), (lat, lon, alt))
+    return receivers
+
+def receiver_loop(node, host, port, grouper, lock):
+    """Feeds one node's extended squitters into the grouper forever."""
+    while True:
+        try:
+            logger.info(f"Connecting to {node} ({host}:{port})...")
+            for msg, ts, _ in iter_beast_frames(host, port):
+                # ts = 0: frame without an MLAT timestamp (e.g. forwarded from the network)
+                if ts == 0 or len(msg) != 14 or (msg[0] >> 3) not in (17, 18):
+                    continue
+                t_ns = beast_timestamp_ns(ts, BEAST_CLOCK)
+                with lock:
+                    grouper.add(node, msg, t_ns, time.time())
+        except Exception as e:
+            logger.warning(f"{node} stream error: {e}. Reconnecting in 5s...")
+            time.sleep(5)
+
+class MlatVerifier:
+
+    def __init__(self, receivers, reference, writer):
+        self.nodes = list(receivers)
+        self.rx_ecef = {n: lla_to_ecef(*coords) for n, (_, _, coords) in receivers.items()}
+        self.clocks = ClockSync(self.rx_ecef, reference)
+        self.writer = writer
+        self.last_alert = {}
+        self.distrusted = {}       # icao -> time of its last MISMATCH verdict
+        self.solve_ms = deque(maxlen=STATS_INTERVAL)
+        self.counts = {"groups": 0, "fixes": 0, "CONSISTENT": 0, "MISMATCH": 0, "UNTRUSTED_GEOMETRY": 0}
+
+    def reported_position(self, frame, rec, seen):
+        """
+        ADS-B position for a frame: its own airborne CPR position (local
+        decode against the live state, exact transmission time) or else the
+        live state record. Returns dict lat, lon, alt_m, age_s, gs_ms, beacon
+        (own position with a high-integrity type code).
+        """
+        decoded = decode_message(frame)
+        if not decoded or not rec or rec.get('lat') is None or rec.get('lon') is None:
+            return None
+        alt_ft = decoded.get('alt_baro_ft', decoded.get('alt_geom_ft'))
+        cpr = decoded.get('cpr')
+        if cpr and not decoded.get('surface') and alt_ft is not None:
+            odd, lat_cpr, lon_cpr = cpr
+            lat, lon = cpr_local(lat_cpr, lon_cpr, odd, rec['lat'], rec['lon'])
+            return {"lat": lat, "lon": lon, "alt_m": alt_ft * FT_TO_M, "age_s": 0.0, "gs_ms": 0.0,
+                    "beacon": decoded['tc'] in BEACON_TYPECODES}
+
+        alt_ft = rec.get('alt_baro_ft')
+        return {"lat": rec['lat'], "lon": rec['lon'],
+                "alt_m": alt_ft * FT_TO_M if alt_ft is not None else np.nan,
+                "age_s": abs(seen - float(rec.get('ts') or seen)),
+                "gs_ms": float(rec.get('gs_knots') or 0.0) * KT_TO_MS, "beacon": False}
+
+    def solve(self, nodes, items):
+        """One batch for a receiver set. items: [(icao, group, report)] -> per-fix dicts."""
+        ts = np.array([[self.clocks.to_reference(n, g.times[n]) for n in nodes] for _, g, _ in items], dtype=np.int64)
+        alt_hint = np.array([r['alt_m'] for _, _, r in items])
+        sigma_ns = float(np.hypot(TIMING_SIGMA_NS, self.clocks.sigma_ns(nodes)))
+        fix = solve_mlat_fast(ts, rx_positions=np.array([self.rx_ecef[n] for n in nodes]),
+                              sigma_ns=sigma_ns, alt_hint=alt_hint)
+
+        # Horizontal error: the reported position is placed at the MLAT altitude
+        rep_lat = np.array([r['lat'] for _, _, r in items])
+        rep_lon = np.array([r['lon'] for _, _, r in items])
+        err = np.linalg.norm(fix['ecef'] - lla_to_ecef(rep_lat, rep_lon, fix['alt']), axis=1)
+
+        out = []
+        for k, (icao, _, report) in enumerate(items):
+            out.append({
+                "icao": icao, "error_m": float(err[k]),
+                # Untrusted includes two valid roots (4 receivers, aircraft outside the network)
+                "trusted": bool(fix['trusted'][k]),
+                "allowance_m": report['gs_ms'] * report['age_s'],
+                "gdop": float(fix['gdop'][k]), "sigma_h_m": float(fix['sigma_h_m'][k]),
+                "rms_m": float(fix['rms_m'][k]), "receivers": len(nodes),
+                "lat": float(fix['lat'][k]), "lon": float(fix['lon'][k]), "alt": float(fix['alt'][k]),
+            })
+        return out
+
+    def judge(self, icao, fixes, now):
+        """Verdict for one aircraft's fixes of this cycle -> Line Protocol row."""
+        trusted = [f for f in fixes if f['trusted']]
+        used = trusted or fixes
+        error_m = float(np.median([f['error_m'] for f in used]))
+        sigma_h = float(np.median([f['sigma_h_m'] for f in used]))
+        limit_m = max(MISMATCH_MIN_M, MISMATCH_SIGMAS * sigma_h) + float(np.median([f['allowance_m'] for f in used]))
+        if not trusted:
+            verdict = "UNTRUSTED_GEOMETRY"
+        elif error_m > limit_m:
+            verdict = "MISMATCH"
+        else:
+            verdict = "CONSISTENT"
+        self.counts[verdict] += 1
+        if verdict == "MISMATCH":
+            self.distrusted[icao] = now
+
+        last = used[-1]
+        if verdict == "MISMATCH" and now - self.last_alert.get(icao, 0) >= ALERT_COOLDOWN:
+            self.last_alert[icao] = now
+            logger.warning(f"🚨 {icao} ADS-B position {error_m:.0f} m from MLAT fix (limit {limit_m:.0f} m, "
+                           f"{len(trusted)} fixes, GDOP {last['gdop']:.1f}, {last['receivers']} receivers)")
+
+        return (f"mlat_verification,icao24={icao},verdict={verdict} "
+                f"error_m={error_m:.1f},limit_m={limit_m:.1f},gdop={last['gdop']:.2f},"
+                f"sigma_h_m={sigma_h:.1f},rms_m={last['rms_m']:.1f},receivers={last['receivers']}i,"
+                f"fixes={len(used)}i,mlat_lat={last['lat']:.6f},mlat_lon={last['lon']:.6f},"
+                f"mlat_alt_m={last['alt']:.0f} {int(now * 1e9)}")
+
+    def cycle(self, groups, snapshot, now):
+        """Solves and judges the closed groups, then feeds their beacons to the clock filter."""
+        self.counts["groups"] += len(groups)
+        jobs, beacons = {}, []
+        for g in groups:
+            icao = g.frame[1:4].hex()
+            report = self.reported_position(g.frame, snapshot.get(icao), g.first_seen)
+            if report is None:
+                continue
+            if report['beacon'] and now - self.distrusted.get(icao, -BEACON_BAN_S) >= BEACON_BAN_S:
+                beacons.append((g.first_seen, g.times, lla_to_ecef(report['lat'], report['lon'], report['alt_m'])))
+            nodes = tuple(n for n in self.nodes if n in g.times and self.clocks.synced(n))
+            if len(nodes) >= MIN_RECEIVERS:
+                jobs.setdefault(nodes, []).append((icao, g, report))
+
+        start = time.perf_counter()
+        per_aircraft = {}
+        for nodes, items in jobs.items():
+            for fix in self.solve(nodes, items):
+                per_aircraft.setdefault(fix['icao'], []).append(fix)
+        if jobs:
+            self.solve_ms.append((time.perf_counter() - start) * 1000.0)
+        self.counts["fixes"] += sum(len(items) for items in jobs.values())
+
+        lines = [self.judge(icao, fixes, now) for icao, fixes in per_aircraft.items()]
+        if lines:
+            self.writer.write_lines(lines)
+
+        # After solving: this cycle's fixes never use their own beacons. Arrival order ~ transmission order
+        beacons.sort(key=lambda b: b[0])
+        for _, times, ecef in beacons:
+            self.clocks.observe(times, ecef)
+
+    def stats(self, grouper, now):
+        lines = []
+        for node, s in self.clocks.status().items():
+            if 'offset_ns' not in s:
+                logger.info(f"Clock {node}: no beacon shared with {self.clocks.reference} yet")
+                continue
+            logger.info(f"Clock {node}: drift {s['drift_ppm']:+.3f} ppm | sigma {s['sigma_ns']:.0f} ns | "
+                        f"{s['updates']} updates | {'synced' if s['synced'] else 'NOT synced'}")
+            lines.append(f"mlat_clock_sync,host={escape_key(node)},reference={escape_key(self.clocks.reference)} "
+                         f"drift_ppm={s['drift_ppm']:.4f},sigma_ns={s['sigma_ns']:.1f},updates={s['updates']}i,"
+                         f"synced={str(s['synced']).lower()} {int(now * 1e9)}")
+        if lines:
+            self.writer.write_lines(lines)
+
+        g = grouper.stats
+        p95 = float(np.percentile(self.solve_ms, 95)) if self.solve_ms else 0.0
+        c = self.counts
+        logger.info(f"Frames {g['frames']} | groups {c['groups']} (dup {g['duplicates']}, evicted {g['evicted']}) | "
+                    f"fixes {c['fixes']} | consistent {c['CONSISTENT']} | mismatch {c['MISMATCH']} | "
+                    f"untrusted {c['UNTRUSTED_GEOMETRY']} | beacons {self.clocks.beacons} "
+                    f"(rejected {self.clocks.rejected}) | solve p95 {p95:.1f} ms")
+        for key in g:
+            g[key] = 0
+        for key in c:
+            c[key] = 0
+        self.clocks.beacons = self.clocks.rejected = 0
+        self.last_alert = {k: t for k, t in self.last_alert.items() if now - t < ALERT_COOLDOWN}
+        self.distrusted = {k: t for k, t in self.distrusted.items() if now - t < BEACON_BAN_S}
+
+def main():
+    logger.info("--- MLAT VERIFIER v1.1.0 STARTED ---")
+
+    receivers = parse_receivers(MLAT_RECEIVERS)
+    if BEAST_CLOCK not in BEAST_CLOCK_MODES:
+        raise SystemExit(f"BEAST_CLOCK must be one of {BEAST_CLOCK_MODES}, got '{BEAST_CLOCK}'")
+    reference = MLAT_REFERENCE if MLAT_REFERENCE in receivers else next(iter(receivers), None)
+    logger.info(f"Receivers: {', '.join(receivers) or 'none'} | clock reference: {reference} | timestamps: {BEAST_CLOCK}")
+    if len(receivers) < MIN_RECEIVERS:
+        logger.warning(f"{len(receivers)} receivers configured: clock sync only, MLAT needs {MIN_RECEIVERS}.")
+
+    client = InfluxDBClient(host=INFLUX_HOST, port=INFLUX_PORT, database=INFLUX_DB)
+    writer = InfluxWriter(f"http://{INFLUX_HOST}:{INFLUX_PORT}", INFLUX_DB,
+                          name="mlat-verifier", log=logger.warning)
+    state = connect_state("MlatVerifier", client, STATE_FIELDS, log=logger.info)
+    verifier = MlatVerifier(receivers, reference, writer)
+
+    grouper = FrameGrouper()
+    lock = threading.Lock()
+    for node, (host, port, _) in receivers.items():
+        threading.Thread(target=receiver_loop, args=(node, host, port, grouper, lock), daemon=True).start()
+
+    last_stats = time.time()
+    while True:
+        now = time.time()
+        try:
+            with lock:
+                groups = grouper.pop_ready(now)
+            verifier.cycle(groups, state.snapshot(max_age=STATE_MAX_AGE), now)
+        except Exception as e:
+            logger.error(f"Cycle Error: {e}")
+
+        if now - last_stats >= STATS_INTERVAL:
+            with lock:
+                verifier.stats(grouper, now)
+            last_stats = now
+
+        time.sleep(max(0.0, CYCLE_SECONDS - (time.time() - now)))
+
+if __name__ == "__main__":
+    main()
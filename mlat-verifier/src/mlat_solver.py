@@ -0,0 +1,452 @@
+import numpy as np
+import argparse
+import time
+
+# This file is shared: tools/archive_v1_v3/ holds the master copy,
+# mlat-verifier/src/ carries an identical copy in its build context.
+# Edit the master only, then run tools/sync_shared_modules.py.
+
+# ==========================================
+# 1. CONSTANTS & CONFIGURATION (REAL AMSL ALTITUDE)
+# ==========================================
+C = 299792458.0  # Speed of light in m/s
+NOMINAL_AGL_HEIGHT = 25.0 # This is now just a reference
+
+# WGS84
+WGS84_A = 6378137.0             # Semi-major axis (m)
+WGS84_F = 1 / 298.257223563     # Flattening
+WGS84_E2 = 2*WGS84_F - WGS84_F**2
+WGS84_B = WGS84_A * (1 - WGS84_F)
+
+# Batch Solver (Levenberg-Marquardt, analytic Jacobian)
+MAX_ITER = 20
+TOL_M = 1e-3              # Stop when the step is below this (m)
+MAX_STEP_M = 10000.0      # Trust region: longer steps are clipped (no flinging into space)
+LM_LAMBDA0 = 1e-3         # Initial damping (relative to diag(J^T J))
+INITIAL_ALT_M = 10000.0   # Cold-start altitude: avoids the "underground" mirror solution
+WARM_START_MAX_AGE = 10.0 # Seconds a previous fix is trusted (root choice / fallback start)
+
+# Closed-form Initializer + Gauss-Newton
+GN_STEPS = 2              # Fixed refinement steps after the algebraic estimate
+PLAUSIBLE_ALT_M = (-500.0, 20000.0)  # Root selection: aircraft altitude window
+TIMING_SIGMA_NS = 15.0    # Per-receiver timestamp noise for the covariance
+GDOP_MAX = 20.0           # Fixes with worse geometry are not trusted (spoofing verdicts)
+TRUST_RMS_SIGMA = 5.0     # Trusted fixes: residual RMS within this many timing sigmas
+
+# NOTE: The coordinates and AMSL altitudes are based on your provided site data.
+RECEIVERS = {
+    # Node 1: Jorvas (30m AMSL)
+    "RX1": {"coords": (60.1304, 24.5106, 30.0), "name": "Jorvas (Rooftop)"}, 
+    
+    # Node 2: Keimola (130m AMSL - High Floor)
+    "RX2": {"coords": (60.3196, 24.8295, 130.0), "name": "Keimola (11th Floor)"},
+    
+    # Node 3: Sipoo (60m AMSL - Rooftop)
+    "RX3": {"coords": (60.3760, 25.2710, 60.0), "name": "Sipoo (Rooftop)"}, 
+
+    # Node 4: Eira (25m AMSL - Window) - Using original Eira coords for Core-4 network spread
+    "RX4": {"coords": (60.1573, 24.9412, 25.0), "name": "Eira (Window)"}
+}
+
+# ==========================================
+# 2. MATH ENGINE
+# ==========================================
+def lla_to_ecef(lat, lon, alt):
+    """Convert Lat/Lon/Alt to Earth-Centered X,Y,Z (meters). Scalars -> (3,), arrays -> (N, 3)."""
+    lat_rad = np.radians(lat)
+    lon_rad = np.radians(lon)
+    
+    N = WGS84_A / np.sqrt(1 - WGS84_E2 * np.sin(lat_rad)**2)
+    
+    x = (N + alt) * np.cos(lat_rad) * np.cos(lon_rad)
+    y = (N + alt) * np.cos(lat_rad) * np.sin(lon_rad)
+    z = (N * (1 - WGS84_E2) + alt) * np.sin(lat_rad)
+    return np.stack([x, y, z], axis=-1)
+
+def ecef_to_lla(x, y, z):
+    """
+    Convert X,Y,Z back to Lat/Lon/Alt. Closed form (Heikkinen 1982), no
+    iteration, works on scalars or arrays. Exact to well below 1 mm for
+    any aircraft altitude.
+    """
+    x, y, z = np.asarray(x, dtype=float), np.asarray(y, dtype=float), np.asarray(z, dtype=float)
+    a, b, e2 = WGS84_A, WGS84_B, WGS84_E2
+    ep2 = (a**2 - b**2) / b**2
+
+    p = np.sqrt(x**2 + y**2)
+    F = 54 * b**2 * z**2
+    G = p**2 + (1 - e2) * z**2 - e2 * (a**2 - b**2)
+    c = e2**2 * F * p**2 / G**3
+    s = np.cbrt(1 + c + np.sqrt(c**2 + 2*c))
+    k = s + 1 + 1/s
+    P = F / (3 * k**2 * G**2)
+    Q = np.sqrt(1 + 2 * e2**2 * P)
+    r0 = -P * e2 * p / (1 + Q) + np.sqrt(
+        np.maximum(0.5 * a**2 * (1 + 1/Q) - P * (1 - e2) * z**2 / (Q * (1 + Q)) - 0.5 * P * p**2, 0))
+    U = np.sqrt((p - e2 * r0)**2 + z**2)
+    V = np.sqrt((p - e2 * r0)**2 + (1 - e2) * z**2)
+    z0 = b**2 * z / (a * V)
+
+    alt = U * (1 - b**2 / (a * V))
+    lat = np.arctan((z + ep2 * z0) / p)
+    lon = np.arctan2(y, x)
+    return np.degrees(lat), np.degrees(lon), alt
+
+# Cache Receiver Positions in ECEF
+RX_KEYS = list(RECEIVERS.keys())
+RX_LATS = np.array([RECEIVERS[k]["coords"][0] for k in RX_KEYS])
+RX_LONS = np.array([RECEIVERS[k]["coords"][1] for k in RX_KEYS])
+RX_ALTS = np.array([RECEIVERS[k]["coords"][2] for k in RX_KEYS])
+RX_POSITIONS = lla_to_ecef(RX_LATS, RX_LONS, RX_ALTS)
+
+# Calculate Network Centroid (for initial guess)
+CENTER_LAT = np.mean(RX_LATS)
+CENTER_LON = np.mean(RX_LONS)
+COLD_START_ECEF = lla_to_ecef(CENTER_LAT, CENTER_LON, INITIAL_ALT_M)
+
+
+def range_differences(timestamps_ns):
+    """
+    (N, M) arrival times (ns) -> (N, M-1) observed range differences vs the
+    first receiver (m). Differences are taken in int64 before converting,
+    so absolute epoch-ns timestamps keep their nanosecond precision.
+    """
+    t = np.asarray(timestamps_ns)
+    if t.dtype.kind in 'iu':
+        dt_ns = (t[:, 1:] - t[:, :1]).astype(float)
+    else:
+        dt_ns = t[:, 1:] - t[:, :1]
+    return dt_ns * (C / 1e9)
+
+def tdoa_residuals(pos, rx_positions, observed):
+    """
+    Residuals (m) and analytic Jacobian for a batch.
+      pos (N, 3), rx_positions (M, 3), observed (N, M-1)
+      -> r (N, M-1), J (N, M-1, 3)
+    r_i = |x - p_i| - |x - p_0| - observed_i ;  dr_i/dx = u_i - u_0
+    """
+    diff = pos[:, None, :] - rx_positions[None, :, :]      # (N, M, 3)
+    dist = np.sqrt(np.einsum('nmk,nmk->nm', diff, diff))  # (N, M)
+    unit = diff / dist[..., None]
+    r = dist[:, 1:] - dist[:, :1] - observed
+    J = unit[:, 1:, :] - unit[:, :1, :]
+    return r, J
+
+def closed_form_init(timestamps_ns, rx_positions=None, alt_hint=None):
+    """
+    Algebraic TDoA solution (Chan / Bancroft style), no iteration.
+    With the reference receiver p0 as origin and d0 = |x - p0|, every
+    receiver i gives a linear equation  2 p_i.x = |p_i|^2 - r_i^2 - 2 r_i d0,
+    so x = u + v*d0 (pseudo-inverse of the fixed receiver geometry), and
+    |x|^2 = d0^2 is a quadratic in d0. Of the (up to) two roots, the one with
+    non-negative ranges and a plausible aircraft altitude is kept - this
+    rejects the mirror solution. If both qualify (true 4-receiver
+    ambiguity, outside the network), the one nearest alt_hint (e.g. the
+    reported barometric altitude, (N,) m, NaN = none) wins, else the one
+    nearest the network.
+    Returns (ecef (N, 3), valid (N,), ambiguous (N,)).
+    """
+    rx = RX_POSITIONS if rx_positions is None else rx_positions
+    r = range_differences(timestamps_ns)                 # (N, M-1)
+    P = rx[1:] - rx[0]                                   # (M-1, 3) relative to p0
+    A_pinv = np.linalg.pinv(2.0 * P)                     # (3, M-1), same for every fix
+    u = (np.einsum('mk,mk->m', P, P)[None, :] - r**2) @ A_pinv.T
+    v = (-2.0 * r) @ A_pinv.T
+
+    a = np.einsum('ni,ni->n', v, v) - 1.0
+    b = 2.0 * np.einsum('ni,ni->n', u, v)
+    c = np.einsum('ni,ni->n', u, u)
+    disc = b**2 - 4*a*c
+    sq = np.sqrt(np.maximum(disc, 0.0))                  # Noise can push disc < 0: use the vertex
+    with np.errstate(divide='ignore', invalid='ignore'):
+        roots = np.stack([(-b - sq) / (2*a), (-b + sq) / (2*a)], axis=1)   # (N, 2)
+    roots = np.where(np.isfinite(roots), roots, (-c / b)[:, None])          # a ~ 0: linear case
+
+    cand = u[:, None, :] + v[:, None, :] * roots[..., None] + rx[0]         # (N, 2, 3)
+    _, _, alt = ecef_to_lla(cand[..., 0], cand[..., 1], cand[..., 2])
+    # Squaring admits extraneous roots: every |x - p_i| = d0 + r_i must stay >= 0
+    causal = (roots >= 0) & ((roots[..., None] + r[:, None, :]) >= 0).all(axis=2)
+    plausible = causal & (alt >= PLAUSIBLE_ALT_M[0]) & (alt <= PLAUSIBLE_ALT_M[1])
+    distance = np.linalg.norm(cand - rx.mean(axis=0), axis=2)
+    if alt_hint is not None:
+        hint = np.broadcast_to(np.asarray(alt_hint, dtype=float), (len(cand),))[:, None]
+        distance = np.where(np.isfinite(hint), np.abs(alt - hint), distance)
+    pick = np.argmin(np.where(plausible, distance, np.inf), axis=1)
+    ecef = cand[np.arange(len(cand)), pick]
+    valid = plausible.any(axis=1) & np.isfinite(ecef).all(axis=1)
+    return ecef, valid, plausible.all(axis=1)
+
+def enu_rotation(lat, lon):
+    """(N, 3, 3) ECEF -> local East/North/Up rotation for each position."""
+    phi, lam = np.radians(lat), np.radians(lon)
+    sp, cp, sl, cl = np.sin(phi), np.cos(phi), np.sin(lam), np.cos(lam)
+    zero = np.zeros_like(phi)
+    return np.stack([
+        np.stack([-sl, cl, zero], axis=-1),
+        np.stack([-sp*cl, -sp*sl, cp], axis=-1),
+        np.stack([cp*cl, cp*sl, sp], axis=-1),
+    ], axis=-2)
+
+def dop_from_jacobian(J, lat, lon):
+    """
+    Dilution of precision from the TDoA Jacobian J (N, M-1, 3).
+    Range differences share the reference receiver, so their noise is
+    correlated: Q = I + 11^T (per unit timing variance). Returns
+    (gdop, hdop, vdop, cov_enu) with cov_enu = (J^T Q^-1 J)^-1 rotated to ENU (unit sigma, m^2).
+    """
+    m = J.shape[1]
+    Q_inv = np.eye(m) - np.ones((m, m)) / (m + 1)        # (I + 11^T)^-1
+    info = np.einsum('nmi,mk,nkj->nij', J, Q_inv, J)
+    cov = np.linalg.inv(info + 1e-12 * np.eye(3))
+    R = enu_rotation(lat, lon)
+    cov_enu = R @ cov @ np.swapaxes(R, -1, -2)
+    var = np.diagonal(cov_enu, axis1=-2, axis2=-1)
+    hdop = np.sqrt(var[:, 0] + var[:, 1])
+    vdop = np.sqrt(var[:, 2])
+    return np.sqrt(var.sum(axis=1)), hdop, vdop, cov_enu
+
+def dop(ecef, rx_positions=None):
+    """(gdop, hdop, vdop) of aircraft positions (N, 3) for the receiver geometry."""
+    rx = RX_POSITIONS if rx_positions is None else rx_positions
+    ecef = np.atleast_2d(ecef)
+    _, J = tdoa_residuals(ecef, rx, np.zeros((len(ecef), len(rx) - 1)))
+    lat, lon, _ = ecef_to_lla(ecef[:, 0], ecef[:, 1], ecef[:, 2])
+    gdop, hdop, vdop, _ = dop_from_jacobian(J, lat, lon)
+    return gdop, hdop, vdop
+
+def solve_mlat_fast(timestamps_ns, rx_positions=None, gn_steps=GN_STEPS, sigma_ns=TIMING_SIGMA_NS, alt_hint=None):
+    """
+    Closed-form estimate + a fixed number of Gauss-Newton steps; a step that
+    increases the residual is rejected (like solve_mlat_batch).
+    Returns dict of arrays: lat, lon, alt, ecef, rms_m, gdop, hdop, vdop,
+    sigma_h_m / sigma_v_m (1-sigma for sigma_ns timing noise), cov_enu
+    (m^2), ambiguous (two valid roots) and trusted (a single valid root,
+    final altitude inside PLAUSIBLE_ALT_M, rms_m within TRUST_RMS_SIGMA
+    timing sigmas, GDOP <= GDOP_MAX).
+    """
+    rx = RX_POSITIONS if rx_positions is None else rx_positions
+    observed = range_differences(timestamps_ns)
+    x, valid, ambiguous = closed_form_init(timestamps_ns, rx, alt_hint)
+    x = np.where(valid[:, None], x, COLD_START_ECEF)
+
+    r, J = tdoa_residuals(x, rx, observed)
+    cost = np.einsum('nm,nm->n', r, r)
+    for _ in range(gn_steps):
+        JtJ = np.einsum('nmi,nmj->nij', J, J) + 1e-12 * np.eye(3)
+        Jtr = np.einsum('nmi,nm->ni', J, r)
+        x_new = x - np.linalg.solve(JtJ, Jtr[..., None])[..., 0]
+        r_new, J_new = tdoa_residuals(x_new, rx, observed)
+        cost_new = np.einsum('nm,nm->n', r_new, r_new)
+        better = cost_new < cost   # NaN (degenerate geometry) is never better
+        x[better], r[better], J[better], cost[better] = x_new[better], r_new[better], J_new[better], cost_new[better]
+
+    lat, lon, alt = ecef_to_lla(x[:, 0], x[:, 1], x[:, 2])
+    gdop, hdop, vdop, cov_enu = dop_from_jacobian(J, lat, lon)
+    sigma_m = sigma_ns * 1e-9 * C
+    rms_m = np.sqrt(np.einsum('nm,nm->n', r, r) / r.shape[1])
+    return {
+        "lat": lat, "lon": lon, "alt": alt, "ecef": x, "rms_m": rms_m,
+        "gdop": gdop, "hdop": hdop, "vdop": vdop,
+        "sigma_h_m": sigma_m * hdop, "sigma_v_m": sigma_m * vdop,
+        "cov_enu": cov_enu * sigma_m**2, "ambiguous": ambiguous,
+        "trusted": (valid & ~ambiguous & np.isfinite(gdop) & (gdop <= GDOP_MAX)
+                    & (alt >= PLAUSIBLE_ALT_M[0]) & (alt <= PLAUSIBLE_ALT_M[1])
+                    & (rms_m <= TRUST_RMS_SIGMA * sigma_m)),
+    }
+
+def solve_mlat_batch(timestamps_ns, x0=None, rx_positions=None, max_iter=MAX_ITER, tol=TOL_M):
+    """
+    Solves N fixes at once with a vectorized Levenberg-Marquardt.
+      timestamps_ns: (N, M) arrival times per receiver (same order as rx_positions)
+      x0:            (N, 3) ECEF starting points (default: closed_form_init)
+    Returns dict of arrays: lat, lon, alt, ecef (N, 3), cost (0.5*sum(r^2), in s^2
+    like scipy's least_squares), rms_m, iterations, converged.
+    """
+    rx = RX_POSITIONS if rx_positions is None else rx_positions
+    observed = range_differences(timestamps_ns)
+    n = len(observed)
+    if x0 is None:
+        x0, valid, _ = closed_form_init(timestamps_ns, rx)
+        x0 = np.where(valid[:, None], x0, COLD_START_ECEF)
+    x = np.array(np.broadcast_to(x0, (n, 3)), dtype=float)
+
+    r, J = tdoa_residuals(x, rx, observed)
+    cost = np.einsum('nm,nm->n', r, r)
+    lam = np.full(n, LM_LAMBDA0)
+    active = np.ones(n, dtype=bool)
+    iterations = np.zeros(n, dtype=int)
+    eye = np.eye(3)
+
+    for _ in range(max_iter):
+        idx = np.flatnonzero(active)
+        if len(idx) == 0:
+            break
+        Ja, ra = J[idx], r[idx]
+        JtJ = np.einsum('nmi,nmj->nij', Ja, Ja)
+        Jtr = np.einsum('nmi,nm->ni', Ja, ra)
+        damp = lam[idx, None, None] * (JtJ * eye) + 1e-12 * eye   # Marquardt: scale by diag(J^T J)
+        step = -np.linalg.solve(JtJ + damp, Jtr[..., None])[..., 0]
+        step_len = np.sqrt(np.einsum('ni,ni->n', step, step))
+        step *= np.minimum(1.0, MAX_STEP_M / np.maximum(step_len, 1e-12))[:, None]
+
+        x_new = x[idx] + step
+        r_new, J_new = tdoa_residuals(x_new, rx, observed[idx])
+        cost_new = np.einsum('nm,nm->n', r_new, r_new)
+        better = cost_new < cost[idx]   # NaN (degenerate geometry) is never better
+
+        ok = idx[better]
+        x[ok], r[ok], J[ok], cost[ok] = x_new[better], r_new[better], J_new[better], cost_new[better]
+        lam[ok] *= 0.1
+        lam[idx[~better]] *= 10.0
+        iterations[idx] += 1
+
+        done = (better & (step_len < tol)) | (~better & (lam[idx] > 1e8))
+        active[idx[done]] = False
+
+    lat, lon, alt = ecef_to_lla(x[:, 0], x[:, 1], x[:, 2])
+    m = observed.shape[1]
+    return {
+        "lat": lat, "lon": lon, "alt": alt, "ecef": x,
+        "cost": 0.5 * cost / C**2,
+        "rms_m": np.sqrt(cost / m),
+        "iterations": iterations,
+        "converged": ~active & np.isfinite(cost),
+    }
+
+def solve_mlat(timestamps_ns):
+    """
+    Input: List of 4 timestamps in nanoseconds [t1, t2, t3, t4]
+    Output: Lat, Lon, Alt, Error_Score
+    """
+    sol = solve_mlat_fast(np.asarray([timestamps_ns]))
+    if np.isfinite(sol["ecef"][0]).all():
+        cost = 0.5 * (len(timestamps_ns) - 1) * (sol["rms_m"][0] / C)**2   # least_squares units (s^2)
+        return float(sol["lat"][0]), float(sol["lon"][0]), float(sol["alt"][0]), float(cost)
+    return None
+
+class MlatTracker:
+    """
+    Batch solver that remembers each aircraft's last fix. Every fix starts
+    from the closed-form estimate; a previous fix younger than
+    WARM_START_MAX_AGE picks between two valid roots (via its altitude) and
+    is the starting point where the closed form has no valid root.
+    """
+
+    def __init__(self, rx_positions=None, max_age=WARM_START_MAX_AGE):
+        self.rx = RX_POSITIONS if rx_positions is None else rx_positions
+        self.max_age = max_age
+        self.last = {}  # icao -> (ecef, ts)
+
+    def solve(self, icaos, timestamps_ns, now=None):
+        now = time.time() if now is None else now
+        prev = [self.last.get(icao) for icao in icaos]
+        prev = [p if p is not None and now - p[1] <= self.max_age else None for p in prev]
+        prev_ecef = np.array([p[0] if p is not None else COLD_START_ECEF for p in prev])
+        hint = np.array([p[2] if p is not None else np.nan for p in prev])
+        x0, valid, _ = closed_form_init(timestamps_ns, self.rx, hint)
+        x0[~valid] = prev_ecef[~valid]
+        sol = solve_mlat_batch(timestamps_ns, x0, self.rx)
+        for icao, pos, alt, ok in zip(icaos, sol["ecef"], sol["alt"], sol["converged"]):
+            if ok:
+                self.last[icao] = (pos, now, alt)
+        return sol
+
+    def expire(self, now=None):
+        cutoff = (time.time() if now is None else now) - self.max_age
+        for icao in [i for i, (_, ts, _) in self.last.items() if ts < cutoff]:
+            del self.last[icao]
+
+def simulate_timestamps(target_ecef, jitter_ns=15.0, rng=np.random):
+    """(N, 3) ECEF targets -> (N, M) arrival times (ns) with Gaussian jitter."""
+    dists = np.linalg.norm(RX_POSITIONS[None, :, :] - np.atleast_2d(target_ecef)[:, None, :], axis=2)
+    return dists / C * 1e9 + rng.normal(0, jitter_ns, dists.shape)
+
+def benchmark(n, jitter_ns=15.0):
+    """Fixes/s for a batch of random aircraft around the network, cold and warm started."""
+    rng = np.random.default_rng(1)
+    lat = CENTER_LAT + rng.uniform(-0.4, 0.4, n)
+    lon = CENTER_LON + rng.uniform(-0.8, 0.8, n)
+    alt = rng.uniform(1000, 12000, n)
+    truth = lla_to_ecef(lat, lon, alt)
+    times = simulate_timestamps(truth, jitter_ns, rng)
+
+    t0 = time.perf_counter()
+    cold = solve_mlat_batch(times, COLD_START_ECEF)
+    t_cold = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    init = solve_mlat_batch(times)
+    t_init = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    fast = solve_mlat_fast(times, alt_hint=alt)
+    t_fast = time.perf_counter() - t0
+
+    err = np.linalg.norm(init["ecef"] - truth, axis=1)
+    err_fast = np.linalg.norm(fast["ecef"] - truth, axis=1)
+    trusted = fast["trusted"]
+    print(f"\n=== BATCH BENCHMARK ({n:,} fixes, {jitter_ns:.0f} ns jitter) ===")
+    print(f"❄️  LM, centroid start:    {n / t_cold:,.0f} fixes/s | mean iterations {cold['iterations'].mean():.1f} | converged {cold['converged'].mean() * 100:.1f}%")
+    print(f"📐 LM, closed-form start: {n / t_init:,.0f} fixes/s | mean iterations {init['iterations'].mean():.1f} | converged {init['converged'].mean() * 100:.1f}%")
+    print(f"⚡ Closed form + {GN_STEPS} GN:   {n / t_fast:,.0f} fixes/s (with GDOP + covariance)")
+    print(f"✅ Median 3D error {np.median(err):.1f} m | trusted (single root, GDOP <= {GDOP_MAX:.0f}): {trusted.mean() * 100:.1f}% "
+          f"with median error {np.median(err_fast[trusted]):.1f} m")
+
+# ==========================================
+# 3. TEST SIMULATION
+# ==========================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Core-4 MLAT solver self-test")
+    parser.add_argument("--bench", type=int, default=0, metavar="N", help="Also benchmark a batch of N fixes")
+    args = parser.parse_args()
+
+    print(f"📡 Loading Core-4 Configuration: {RX_KEYS}")
+    
+    # 1. Simulate a plane at 30k feet over Helsinki-Vantaa Area (9144m = 30k ft)
+    target_lla = (60.3172, 24.9633, 9144.0) 
+    target_ecef = lla_to_ecef(*target_lla)
+    
+    print(f"\n✈️  SIMULATION TARGET:  {target_lla}")
+    
+    # 2. Generate perfect timestamps + Noise
+    perfect_dists = np.linalg.norm(RX_POSITIONS - target_ecef, axis=1)
+    perfect_times_ns = (perfect_dists / C) * 1e9
+    noise_ns = np.random.normal(0, 15, 4) # 15ns jitter
+    simulated_inputs = perfect_times_ns + noise_ns
+    
+    print(f"⏱️  Simulated TDoA Jitter: +/- 15ns")
+    
+    # 3. Solve
+    solution = solve_mlat(simulated_inputs)
+    quality = solve_mlat_fast(np.asarray([simulated_inputs]))
+    
+    if solution:
+        calc_lat, calc_lon, calc_alt, cost = solution
+        
+        # Check Accuracy against the target
+        diff_h = np.linalg.norm(np.array(target_lla[:2]) - np.array([calc_lat, calc_lon])) * 111000
+        diff_v = abs(calc_alt - target_lla[2])
+        
+        # --- NEW OUTPUT BLOCK ---
+        print("\n=== SOLVER DIAGNOSTICS ===")
+        print(f"🎯 POSITION (LLA):     ({calc_lat:.4f}, {calc_lon:.4f}, {calc_alt:.1f}m)")
+        
+        # Reliability check
+        print(f"📉 RELIABILITY (Cost): {cost:.2e}  <-- Close to zero means perfect intersection.")
+        
+        # Error metrics
+        print(f"📏 HORIZ. ERROR:       {diff_h:.1f}m    <-- Positional accuracy on the map.")
+        print(f"📏 VERTICAL ERROR:     {diff_v:.1f}m    <-- Altitude accuracy (Z-axis stability).")
+        print(f"📐 GDOP / HDOP / VDOP: {quality['gdop'][0]:.1f} / {quality['hdop'][0]:.1f} / {quality['vdop'][0]:.1f}")
+        print(f"🎯 1-SIGMA (H / V):    {quality['sigma_h_m'][0]:.1f}m / {quality['sigma_v_m'][0]:.1f}m  <-- Expected for {TIMING_SIGMA_NS:.0f}ns timing noise.")
+
+        # Final Status check
+        if diff_h < 50 and diff_v < 100:
+             print("\n🟢 STATUS: 3D LOCK CONFIRMED (READY FOR LIVE DATA)")
+        else:
+             print("\n🔴 STATUS: MISMATCH / SPOOFING (Check Geometry or Timing)")
+    else:
+        print("❌ SOLVER FAILED to converge.")
+
+    if args.bench:
+        benchmark(args.bench)
@@ -0,0 +1,288 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+
+# ==============================================================================
+# Module: aircraft_state.py
+# Version: 1.0.0 (Live State Bus)
+# Description:
+#   Live per-aircraft state shared between the feeder and the detectors.
+#   - StatePublisher (feeder side): publishes every written update as a JSON
+#     batch on MQTT topic 'aviation/state/<host>'.
+#   - AircraftStateStore (detector side): subscribes to that topic and keeps
+#     the latest vector per ICAO (fused) and per (host, ICAO). Serves
+#     snapshots and change subscriptions, no InfluxDB round-trip.
+#   - InfluxStateSource: same snapshot() API backed by the old
+#     'SELECT last(...) GROUP BY icao24' query (STATE_SOURCE=influx or
+#     MQTT unavailable).
+#
+#   This file is shared: adsb-feeders/ holds the master copy, the other
+#   services carry an identical copy in their build context. Edit the
+#   master only, then run tools/sync_shared_modules.py.
+#
+#   Record format (same field names as 'local_aircraft_state'):
+#     {"icao24": "46b8a1", "callsign": "FIN7LH", "host": "keimola-office",
+#      "ts": 1765000000.5, "received": 1765000000.7,
+#      "lat": 60.3, "lon": 24.9, "alt_baro_ft": 3500, ...}
+#   ts = update time reported by the feeder, received = local arrival time.
+#   Updates carrying lat/lon also carry pos_ts = time of that position
+#   (ts counts messages of any type, e.g. a later velocity squitter).
+# ==============================================================================
+
+MQTT_HOST = os.getenv("MQTT_HOST") or os.getenv("MQTT_BROKER", "mqtt")
+MQTT_PORT = int(os.getenv("MQTT_PORT", 1883))
+STATE_SOURCE = os.getenv("STATE_SOURCE", "mqtt").lower()  # "mqtt" or "influx"
+STATE_TOPIC_PREFIX = "aviation/state"
+
+DEFAULT_MAX_AGE = 300         # Seconds before an aircraft is dropped from the store
+PUBLISH_INTERVAL = 0.25       # Seconds between publisher flushes
+PUBLISH_MAX_BATCH = 500       # Updates per MQTT message
+
+
+def lp_value(raw):
+    """Line Protocol field value string -> Python value ('12i' -> 12, '"x"' -> 'x')."""
+    if raw.startswith('"'):
+        return raw[1:-1]
+    if raw.endswith('i'):
+        return int(raw[:-1])
+    if raw in ("true", "false"):
+        return raw == "true"
+    return float(raw)
+
+
+def lp_fields_to_dict(fields):
+    """['lat=60.1', 'alt_baro_ft=3500i'] -> {'lat': 60.1, 'alt_baro_ft': 3500}"""
+    out = {}
+    for f in fields:
+        key, _, raw = f.partition('=')
+        out[key] = lp_value(raw)
+    return out
+
+
+# ==============================================================================
+# FEEDER SIDE
+# ==============================================================================
+
+class StatePublisher:
+    """Buffers per-aircraft updates and publishes them in small JSON batches."""
+
+    def __init__(self, client_id, host=MQTT_HOST, port=MQTT_PORT, interval=PUBLISH_INTERVAL, log=print):
+        import paho.mqtt.client as mqtt
+
+        self.log = log
+        self.interval = interval
+        self.pending = {}  # node -> list of updates
+        self.lock = threading.Lock()
+        self.client = mqtt.Client(client_id)
+        self.connected = False
+        try:
+            self.client.connect(host, port, 60)
+            self.client.loop_start()
+            self.connected = True
+            log(f"[STATE] Publishing live state to mqtt://{host}:{port}/{STATE_TOPIC_PREFIX}/#")
+        except Exception as e:
+            log(f"[STATE] MQTT unavailable ({e}). Live state bus disabled.")
+            return
+        threading.Thread(target=self._run, name="state-publisher", daemon=True).start()
+
+    def add(self, node, icao, callsign, ts, fields):
+        if not self.connected:
+            return
+        update = dict(fields)
+        update.update(icao24=icao, callsign=callsign, ts=ts)
+        with self.lock:
+            self.pending.setdefault(node, []).append(update)
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for node, updates in pending.items():
+            for i in range(0, len(updates), PUBLISH_MAX_BATCH):
+                payload = json.dumps({"host": node, "updates": updates[i:i + PUBLISH_MAX_BATCH]},
+                                     separators=(',', ':'))
+                self.client.publish(f"{STATE_TOPIC_PREFIX}/{node}", payload, qos=0)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                self.log(f"[STATE] Publish error: {e}")
+
+
+# ==============================================================================
+# DETECTOR SIDE
+# ==============================================================================
+
+class AircraftStateStore:
+    """
+    Latest state vector per aircraft, fed from the MQTT state bus.
+    Updates are merged field by field, so partial (delta / Beast) updates
+    build up a full vector.
+    """
+
+    def __init__(self, max_age=DEFAULT_MAX_AGE):
+        self.max_age = max_age
+        self.fused = OrderedDict()    # icao -> record (any host), oldest update first
+        self.per_host = OrderedDict() # (host, icao) -> record
+        self.callbacks = []
+        self.lock = threading.RLock()
+        self.client = None
+
+    # --- INPUT ---
+
+    def update(self, host, icao, callsign, ts, fields):
+        """Merges one update. Returns the fused record."""
+        with self.lock:
+            key = (host, icao)
+            rec = self.per_host.get(key)
+            if rec is None:
+                rec = self.per_host[key] = {"icao24": icao, "host": host}
+            else:
+                self.per_host.move_to_end(key)
+            rec.update(fields)
+            rec["callsign"] = callsign
+            rec["ts"] = ts
+            rec["received"] = received = time.time()
+
+            fused = self.fused.get(icao)
+            if fused is None:
+                fused = self.fused[icao] = {"icao24": icao}
+            else:
+                self.fused.move_to_end(icao)
+            if ts >= fused.get("ts", 0):
+                fused.update(fields)
+                fused["callsign"] = callsign
+                fused["host"] = host
+                fused["ts"] = ts
+            fused["received"] = received
+            callbacks = list(self.callbacks)
+            snapshot = dict(fused) if callbacks else None
+
+        for cb in callbacks:
+            try:
+                cb(icao, snapshot, fields, host)
+            except Exception as e:
+                print(f"[STATE] Subscriber error: {e}")
+        return fused
+
+    def apply_batch(self, payload):
+        """Applies one JSON batch from the feeder."""
+        msg = json.loads(payload)
+        host = msg.get("host", "unknown")
+        for upd in msg.get("updates", []):
+            icao = upd.pop("icao24", None)
+            if not icao:
+                continue
+            callsign = upd.pop("callsign", "N/A")
+            ts = upd.pop("ts", time.time())
+            self.update(host, icao, callsign, ts, upd)
+
+    def connect_mqtt(self, client_id, host=MQTT_HOST, port=MQTT_PORT):
+        """Subscribes to the state bus. Raises if the broker is unreachable."""
+        import paho.mqtt.client as mqtt
+
+        def on_connect(client, userdata, flags, rc):
+            client.subscribe(f"{STATE_TOPIC_PREFIX}/#")
+
+        def on_message(client, userdata, msg):
+            try:
+                self.apply_batch(msg.payload)
+            except Exception as e:
+                print(f"[STATE] Bad state message on {msg.topic}: {e}")
+
+        self.client = mqtt.Client(client_id)
+        self.client.on_connect = on_connect
+        self.client.on_message = on_message
+        self.client.connect(host, port, 60)
+        self.client.loop_start()
+        return self
+
+    # --- OUTPUT ---
+
+    def subscribe(self, callback):
+        """callback(icao, fused_record, changed_fields, host) on every update (MQTT thread)."""
+        with self.lock:
+            self.callbacks.append(callback)
+
+    def snapshot(self, max_age=None, per_host=False):
+        """
+        Copies of the current records updated within max_age seconds.
+        per_host=False -> {icao: record}; per_host=True -> {(host, icao): record}
+        """
+        self.expire()
+        source = self.per_host if per_host else self.fused
+        cutoff = time.time() - max_age if max_age else 0
+        with self.lock:
+            return {k: dict(v) for k, v in source.items() if v.get("ts", 0) >= cutoff}
+
+    def get(self, icao):
+        with self.lock:
+            rec = self.fused.get(icao)
+            return dict(rec) if rec else None
+
+    def expire(self, now=None):
+        """Drops aircraft not heard for max_age. O(expired): tables are kept in arrival order."""
+        cutoff = (now or time.time()) - self.max_age
+        with self.lock:
+            for table in (self.fused, self.per_host):
+                while table:
+                    key, rec = next(iter(table.items()))
+                    if rec["received"] >= cutoff:
+                        break
+                    table.popitem(last=False)
+
+    def __len__(self):
+        return len(self.fused)
+
+
+class InfluxStateSource:
+    """snapshot() backed by InfluxDB 'last()' queries (the pre-state-bus behaviour)."""
+
+    def __init__(self, client, fields, measurement="local_aircraft_state"):
+        self.client = client
+        self.fields = fields
+        self.measurement = measurement
+
+    def snapshot(self, max_age=60, per_host=False):
+        selects = ", ".join(f'last("{f}") AS "{f}"' for f in self.fields)
+        group = '"icao24", "host"' if per_host else '"icao24"'
+        query = f"""
+            SELECT {selects}
+            FROM "{self.measurement}"
+            WHERE time > now() - {int(max_age)}s
+            GROUP BY {group}, "callsign"
+        """
+        out = {}
+        now = time.time()
+        for (name, tags), points in self.client.query(query, epoch='s').items():
+            icao = tags.get('icao24')
+            if not icao:
+                continue
+            for p in points:
+                rec = {f: p.get(f) for f in self.fields}
+                rec.update(icao24=icao, callsign=tags.get('callsign', 'N/A'),
+                           host=tags.get('host'), ts=p.get('time') or now)
+                key = (rec['host'], icao) if per_host else icao
+                # Callsign is a tag: keep the most recent series per aircraft
+                if key not in out or rec['ts'] >= out[key]['ts']:
+                    out[key] = rec
+        return out
+
+
+def connect_state(client_id, influx_client, fields, log=print):
+    """
+    Returns the detector's state source: the MQTT-fed store (default) or,
+    with STATE_SOURCE=influx / broker down, the InfluxDB query fallback.
+    """
+    if STATE_SOURCE == "mqtt":
+        try:
+            store = AircraftStateStore().connect_mqtt(client_id)
+            log(f"[STATE] Subscribed to live state bus mqtt://{MQTT_HOST}:{MQTT_PORT}")
+            return store
+        except Exception as e:
+            log(f"[STATE] MQTT unavailable ({e}). Falling back to InfluxDB queries.")
+    return InfluxStateSource(influx_client, fields)
@@ -1,15 +1,33 @@
 #!/usr/bin/env python3
 # ==============================================================================
 # Service: PHYSICS GUARD
-# Version: 1.4.0 (QNH Compensation)
+# Version: 1.8.0 (Cached Per-Station QNH)
 # Author: Operations Team
 # Description: Validates aircraft physics, applying live weather correction.
+#              Aircraft state comes from the MQTT live state bus
+#              (aircraft_state.py); STATE_SOURCE=influx restores the query.
+#              Every new position (stamped with its own time, pos_ts) is
+#              checked against the previous reports of the same aircraft
+#              (small ring buffer per ICAO, O(1) per message): implied speed (teleports), turn rate, acceleration
+#              and vertical rate vs altitude change.
+#              QNH is cached per METAR station and refreshed when metar_feeder
+#              publishes on 'aviation/weather/<station>'; the InfluxDB lookup
+#              is only a timed fallback. Each aircraft is corrected with the
+#              QNH (and ground elevation) of its nearest station.
 # ==============================================================================
 
 import time
 import os
+import json
+import math
 import logging
+import threading
+from collections import OrderedDict, deque
 from influxdb import InfluxDBClient
+import paho.mqtt.client as mqtt
+
+from influx_writer import InfluxWriter
+from aircraft_state import connect_state
 
 # --- CONFIGURATION ---
 INFLUX_HOST = os.getenv('INFLUX_HOST', 'influxdb')
@@ -23,34 +41,292 @@ MIN_ALT_FT    = -200  # Alert if lower than this (after QNH correction)
 
 # Airport Elevation (EFHK is ~179 ft)
 # We allow some buffer below ground level for calibration errors
-AIRPORT_ELEVATION = 179 
+AIRPORT_ELEVATION = 179
+
+# METAR Stations: "ICAO=lat,lon,elev_ft;..." (must match METAR_STATIONS of metar_feeder)
+WEATHER_STATIONS = os.getenv("WEATHER_STATIONS", "EFHK=60.3172,24.9633,179")
+QNH_TTL = 3600             # A QNH older than this is not trusted (METAR is half-hourly)
+QNH_REFRESH = 900          # Timed InfluxDB refresh when no MQTT update arrived (seconds)
+STANDARD_QNH = 1013.25
+
+MQTT_HOST = os.getenv("MQTT_HOST", "mqtt")
+MQTT_PORT = int(os.getenv("MQTT_PORT", 1883))
+MQTT_TOPIC_WEATHER = "aviation/weather"
+
+# Rate-of-change Thresholds (between consecutive reports of one aircraft)
+MAX_IMPLIED_KTS    = 1200  # Position jump faster than this = teleport
+SPEED_MISMATCH_KTS = 250   # Implied vs reported ground speed
+MAX_TURN_DPS       = 10.0  # Track change (deg/s); standard rate turn is 3
+MAX_ACCEL_KTS_S    = 15.0  # Ground speed change (kt/s); takeoff roll is ~5
+VS_TOLERANCE_FT    = 300   # Altitude change vs reported vertical rate...
+VS_TOLERANCE_RATIO = 0.5   # ...plus this share of the expected change
+AIRBORNE_MIN_KTS   = 50    # Turn / vertical checks only above this speed
+
+# Ring Buffer
+RING_SIZE = 8              # Reports kept per aircraft
+MIN_DT = 1.0               # Compare against a report at least this old (seconds)
+MIN_DT_RATE = 5.0          # Speed mismatch / vertical checks need this baseline (seconds)
+MAX_DT = 30.0              # Older baseline = track gap, skip derived checks
+TRACK_TTL = 300            # Forget aircraft silent for this long (seconds)
+ALERT_COOLDOWN = 60        # Same violation for same aircraft at most once per this (seconds)
+
+# Live state fields used by the checks, and how fresh they must be (seconds)
+STATE_FIELDS = ["gs_knots", "vert_rate_fpm", "alt_baro_ft"]
+STATE_MAX_AGE = 10
+
+EARTH_RADIUS_NM = 3440.065
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(name)s] %(message)s')
 logger = logging.getLogger("PhysicsGuard")
 
-def get_qnh(client):
+def parse_stations(spec):
+    """'EFHK=60.3172,24.9633,179;EFTU=...' -> {'EFHK': (lat, lon, elev_ft)}"""
+    stations = {}
+    for entry in spec.split(';'):
+        if '=' not in entry: continue
+        name, coords = entry.split('=', 1)
+        lat, lon, elev = (float(v) for v in coords.split(','))
+        stations[name.strip().upper()] = (lat, lon, elev)
+    return stations
+
+class QnhCache:
     """
-    Fetches the latest QNH (Pressure) from the weather_local measurement.
-    Returns standard pressure (1013.25) if unavailable.
+    Latest QNH per station with an expiry. Fed by MQTT weather events;
+    refresh_from_influx() is the timed fallback (one query for all stations).
     """
-    try:
-        # Get the most recent pressure reading from the last 15 minutes
-        query = 'SELECT last("pressure_hpa") FROM "weather_local" WHERE time > now() - 15m'
-        result = client.query(query)
-        points = list(result.get_points())
-        if points:
-            return float(points[0]['last'])
-    except Exception:
-        pass
-    
-    return 1013.25 # Fallback to Standard Atmosphere
+
+    def __init__(self, stations):
+        self.stations = stations
+        self.values = {}          # station -> (qnh, expires_at)
+        self.last_update = 0.0
+        self.lock = threading.Lock()
+
+    def set(self, station, qnh, obs_ts=None):
+        obs_ts = obs_ts or time.time()
+        with self.lock:
+            self.values[station] = (float(qnh), obs_ts + QNH_TTL)
+            self.last_update = time.time()
+
+    def on_message(self, client, userdata, msg):
+        try:
+            data = json.loads(msg.payload)
+            if data.get("pressure_hpa") is not None:
+                self.set(data["station"], data["pressure_hpa"], data.get("ts"))
+                logger.info(f"QNH {data['station']}: {data['pressure_hpa']} hPa (weather event)")
+        except Exception as e:
+            logger.warning(f"Bad weather message on {msg.topic}: {e}")
+
+    def connect_mqtt(self):
+        def on_connect(client, userdata, flags, rc):
+            client.subscribe(f"{MQTT_TOPIC_WEATHER}/#")
+
+        client = mqtt.Client("PhysicsGuardWeather")
+        client.on_connect = on_connect
+        client.on_message = self.on_message
+        try:
+            client.connect(MQTT_HOST, MQTT_PORT, 60)
+            client.loop_start()
+        except Exception as e:
+            logger.warning(f"Weather events unavailable ({e}). Timed QNH refresh only.")
+
+    def refresh_from_influx(self, client):
+        """Latest pressure per station from weather_local (fallback path)."""
+        try:
+            query = 'SELECT last("pressure_hpa") FROM "weather_local" WHERE time > now() - 1h GROUP BY "station"'
+            for (name, tags), points in client.query(query, epoch='s').items():
+                station = (tags or {}).get('station', 'EFHK')
+                for p in points:
+                    if p.get('last') is not None:
+                        self.set(station, p['last'], p.get('time') or None)
+        except Exception as e:
+            logger.warning(f"QNH query failed: {e}")
+        with self.lock:
+            self.last_update = time.time()
+
+    def lookup(self, lat=None, lon=None):
+        """
+        (station, qnh, elevation_ft) of the nearest station with a valid QNH.
+        Falls back to standard pressure and the EFHK elevation.
+        """
+        now = time.time()
+        best = None
+        with self.lock:
+            valid = [(st, v[0]) for st, v in self.values.items() if v[1] > now and st in self.stations]
+        for station, qnh in valid:
+            s_lat, s_lon, elev = self.stations[station]
+            d = distance_nm(lat, lon, s_lat, s_lon) if lat is not None and lon is not None else 0.0
+            if best is None or d < best[0]:
+                best = (d, station, qnh, elev)
+        if best is None:
+            return None, STANDARD_QNH, AIRPORT_ELEVATION
+        return best[1:]
+
+def distance_nm(lat1, lon1, lat2, lon2):
+    dLat = math.radians(lat2 - lat1)
+    dLon = math.radians(lon2 - lon1)
+    a = math.sin(dLat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dLon/2)**2
+    return 2 * EARTH_RADIUS_NM * math.asin(math.sqrt(min(1.0, a)))
+
+def angle_diff(a, b):
+    """Smallest signed difference b - a in degrees (-180..180)."""
+    return (b - a + 180.0) % 360.0 - 180.0
+
+class PhysicsEngine:
+    """
+    Streaming checks. on_update() is subscribed to the state store and runs
+    on the MQTT thread; each call touches one aircraft's ring buffer only.
+    """
+
+    def __init__(self, writer, qnh_cache):
+        self.writer = writer
+        self.qnh_cache = qnh_cache
+        self.tracks = OrderedDict()  # icao -> {'ring': deque, 'alerted': {kind: ts}}
+        self.lock = threading.Lock()
+        self.stats = {"updates": 0, "alerts": 0}
+
+    # --- ENTRY POINTS ---
+
+    def on_update(self, icao, rec, fields, host):
+        """State store subscriber: only updates carrying a new position are checked."""
+        if 'lat' not in fields or 'lon' not in fields:
+            return
+        with self.lock:
+            self.stats["updates"] += 1
+            self.check_absolute(icao, rec)
+            self.check_derived(icao, rec, float(fields['lat']), float(fields['lon']),
+                               float(fields.get('pos_ts') or rec['ts']))
+
+    def check_absolute(self, icao, rec):
+        speed = float(rec.get('gs_knots') or 0)
+        vsi   = abs(float(rec.get('vert_rate_fpm') or 0))
+        raw_alt = float(rec.get('alt_baro_ft') or 0)
+
+        # Apply QNH Correction (nearest station)
+        # Calculate Correction Factor (approx 30ft per hPa)
+        # If QNH is 1033 (High), diff is +20. Correction is +600ft.
+        station, qnh, elevation = self.qnh_cache.lookup(rec.get('lat'), rec.get('lon'))
+        true_alt = raw_alt + (qnh - STANDARD_QNH) * 30
+
+        if speed > MAX_SPEED_KTS:
+            self.alert(icao, rec, "kinematic", "OVERSPEED", f"OVERSPEED: {speed} kts", speed, qnh)
+        elif vsi > MAX_VSI_FPM:
+            self.alert(icao, rec, "kinematic", "VERTICAL", f"VERTICAL: {vsi} fpm", speed, qnh)
+        # Check against Ground Level (station elevation) minus buffer
+        # If True Alt is significantly below the runway, IT IS underground.
+        elif true_alt < (elevation - 200):
+            self.alert(icao, rec, "kinematic", "UNDERGROUND",
+                       f"UNDERGROUND: {int(true_alt)} ft (QNH {int(qnh)} {station or 'STD'})", true_alt, qnh, station)
+
+    def check_derived(self, icao, rec, lat, lon, ts):
+        sample = (ts, lat, lon,
+                  float(rec.get('alt_baro_ft') or 0),
+                  float(rec.get('gs_knots') or 0),
+                  rec.get('track'),
+                  float(rec.get('vert_rate_fpm') or 0))
+
+        track = self.tracks.get(icao)
+        if track is None:
+            track = self.tracks[icao] = {'ring': deque(maxlen=RING_SIZE), 'alerted': {}}
+        else:
+            self.tracks.move_to_end(icao)
+        ring = track['ring']
+
+        if ring and ts <= ring[-1][0]:
+            return  # Duplicate or late report from a second receiver
+        if ring and lat == ring[-1][1] and lon == ring[-1][2]:
+            return  # Position not refreshed (full snapshot row repeating the last fix)
+        # Baseline: newest report at least MIN_DT older (bounded walk over RING_SIZE)
+        base = next((s for s in reversed(ring) if ts - s[0] >= MIN_DT), None)
+        ring.append(sample)
+        if base is None or ts - base[0] > MAX_DT:
+            return
+
+        t0, lat0, lon0, alt0, gs0, trk0, vs0 = base
+        _, _, _, alt1, gs1, trk1, vs1 = sample
+        dt = ts - t0
+
+        # 1. Implied speed from the position delta (teleport / spoofed jump)
+        implied = distance_nm(lat0, lon0, lat, lon) / (dt / 3600.0)
+        if implied > MAX_IMPLIED_KTS:
+            self.alert(icao, rec, "rate_of_change", "TELEPORT",
+                       f"TELEPORT: {implied:.0f} kts implied over {dt:.1f}s", implied)
+            return  # Remaining checks are meaningless across a jump
+        if dt >= MIN_DT_RATE and abs(implied - (gs0 + gs1) / 2) > SPEED_MISMATCH_KTS:
+            self.alert(icao, rec, "rate_of_change", "SPEED_MISMATCH",
+                       f"SPEED_MISMATCH: {implied:.0f} kts implied vs {gs1:.0f} kts reported", implied)
+
+        # 2. Acceleration (reported ground speed)
+        accel = abs(gs1 - gs0) / dt
+        if accel > MAX_ACCEL_KTS_S:
+            self.alert(icao, rec, "rate_of_change", "ACCELERATION",
+                       f"ACCELERATION: {accel:.1f} kt/s ({gs0:.0f} -> {gs1:.0f} kts)", accel)
+
+        if min(gs0, gs1) < AIRBORNE_MIN_KTS or alt1 <= 0:
+            return  # Taxiing: tracks swing freely, altitude is 'ground'
+
+        # 3. Turn rate
+        if trk0 is not None and trk1 is not None:
+            turn = abs(angle_diff(float(trk0), float(trk1))) / dt
+            if turn > MAX_TURN_DPS:
+                self.alert(icao, rec, "rate_of_change", "TURN_RATE",
+                           f"TURN_RATE: {turn:.1f} deg/s", turn)
+
+        # 4. Vertical rate vs altitude change
+        if dt >= MIN_DT_RATE:
+            expected = (vs0 + vs1) / 2 * dt / 60.0
+            observed = alt1 - alt0
+            if abs(observed - expected) > VS_TOLERANCE_FT + VS_TOLERANCE_RATIO * abs(expected):
+                self.alert(icao, rec, "rate_of_change", "VS_MISMATCH",
+                           f"VS_MISMATCH: {observed:+.0f} ft observed vs {expected:+.0f} ft expected over {dt:.0f}s",
+                           observed - expected)
+
+    # --- OUTPUT ---
+
+    def alert(self, icao, rec, alert_type, kind, violation, value, qnh=None, station=None):
+        track = self.tracks.get(icao)
+        if track is None:
+            track = self.tracks[icao] = {'ring': deque(maxlen=RING_SIZE), 'alerted': {}}
+        now = time.time()
+        if now - track['alerted'].get(kind, 0) < ALERT_COOLDOWN:
+            return
+        track['alerted'][kind] = now
+        self.stats["alerts"] += 1
+
+        callsign = rec.get('callsign') or icao
+        logger.warning(f"🚨 PHYSICS ALERT: {callsign} ({icao}) -> {violation}")
+
+        json_body = [{
+            "measurement": "physics_alerts",
+            "tags": { "icao24": icao, "type": alert_type },
+            "fields": {
+                "callsign": str(callsign),
+                "violation": violation,
+                "value": float(value),
+                "qnh_used": float(qnh or STANDARD_QNH),
+                "qnh_station": station or "STD",
+                "severity": 1.0
+            }
+        }]
+        self.writer.write_points(json_body)
+
+    def expire(self, now):
+        """Drops silent aircraft. O(expired): tracks are kept in update order."""
+        with self.lock:
+            while self.tracks:
+                icao, track = next(iter(self.tracks.items()))
+                last = track['ring'][-1][0] if track['ring'] else 0
+                if now - last < TRACK_TTL:
+                    break
+                self.tracks.popitem(last=False)
 
 def main():
-    logger.info(f"--- PHYSICS GUARD v1.4.0 (QNH FIXED) STARTED ---")
+    logger.info(f"--- PHYSICS GUARD v1.8.0 (CACHED PER-STATION QNH) STARTED ---")
     logger.info(f"    Target: {INFLUX_HOST}:{INFLUX_PORT}")
-    
+
     client = InfluxDBClient(host=INFLUX_HOST, port=INFLUX_PORT)
-    
+    writer = InfluxWriter(f"http://{INFLUX_HOST}:{INFLUX_PORT}", INFLUX_DB,
+                          name="physics-guard", log=logger.warning)
+
     while True:
         try:
             client.switch_database(INFLUX_DB)
@@ -60,69 +336,44 @@ def main():
             logger.warning(f"Waiting for Database... ({e})")
             time.sleep(5)
 
+    qnh_cache = QnhCache(parse_stations(WEATHER_STATIONS))
+    qnh_cache.connect_mqtt()
+    qnh_cache.refresh_from_influx(client)
+    engine = PhysicsEngine(writer, qnh_cache)
+    state = connect_state("PhysicsGuard", client, STATE_FIELDS, log=logger.info)
+
+    # Streaming when the state bus is up; the InfluxDB fallback has no
+    # per-report timestamps, so it only gets the absolute checks.
+    streaming = hasattr(state, "subscribe")
+    if streaming:
+        state.subscribe(engine.on_update)
+    else:
+        logger.warning("No live state bus: rate-of-change checks disabled, polling absolute limits.")
+
+    last_log = time.time()
     while True:
         try:
-            # 1. Get current Air Pressure
-            current_qnh = get_qnh(client)
-            
-            # Calculate Correction Factor (approx 30ft per hPa)
-            # If QNH is 1033 (High), diff is +20. Correction is +600ft.
-            alt_correction = (current_qnh - 1013.25) * 30
-
-            # 2. Get Aircraft State
-            query = f"""
-                SELECT last("gs_knots") as speed, last("vert_rate") as vsi, 
-                       last("alt_baro_ft") as alt, last("callsign") as call
-                FROM "local_aircraft_state" 
-                WHERE time > now() - 10s 
-                GROUP BY "icao24"
-            """
-            
-            results = client.query(query)
-            
-            for (name, tags), points in results.items():
-                p = list(points)[0]
-                icao = tags.get('icao24', 'unknown')
-                callsign = p.get('call', icao)
-                
-                speed = float(p.get('speed') or 0)
-                vsi   = abs(float(p.get('vsi') or 0))
-                raw_alt = float(p.get('alt') or 0)
-
-                # 3. Apply QNH Correction
-                true_alt = raw_alt + alt_correction
-
-                violation = None
-                
-                if speed > MAX_SPEED_KTS:
-                    violation = f"OVERSPEED: {speed} kts"
-                elif vsi > MAX_VSI_FPM:
-                    violation = f"VERTICAL: {vsi} fpm"
-                
-                # Check against Ground Level (Elev 179ft) minus buffer
-                # If True Alt is significantly below the runway, IT IS underground.
-                elif true_alt < (AIRPORT_ELEVATION - 200):
-                    violation = f"UNDERGROUND: {int(true_alt)} ft (QNH {int(current_qnh)})"
-
-                if violation:
-                    logger.warning(f"🚨 PHYSICS ALERT: {callsign} ({icao}) -> {violation}")
-                    
-                    json_body = [{
-                        "measurement": "physics_alerts",
-                        "tags": { "icao24": icao, "type": "kinematic" },
-                        "fields": {
-                            "callsign": str(callsign),
-                            "violation": violation,
-                            "value": float(true_alt if "UNDERGROUND" in violation else speed),
-                            "qnh_used": float(current_qnh),
-                            "severity": 1.0
-                        }
-                    }]
-                    client.write_points(json_body)
+            now = time.time()
+
+            # 1. Air Pressure: only query when no weather event arrived for QNH_REFRESH
+            if now - qnh_cache.last_update >= QNH_REFRESH:
+                qnh_cache.refresh_from_influx(client)
+
+            if streaming:
+                engine.expire(now)
+                if now - last_log >= 60:
+                    logger.info(f"Tracking {len(engine.tracks)} aircraft. "
+                                f"Updates: {engine.stats['updates']}, Alerts: {engine.stats['alerts']}")
+                    last_log = now
+            else:
+                # 2. Poll Aircraft State
+                for icao, p in state.snapshot(max_age=STATE_MAX_AGE).items():
+                    with engine.lock:
+                        engine.check_absolute(icao, p)
 
         except Exception as e:
             logger.error(f"Loop Error: {e}")
-            
+
         time.sleep(5)
 
 if __name__ == "__main__":
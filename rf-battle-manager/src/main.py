@@ -1,19 +1,25 @@
 #!/usr/bin/env python3
 """
 Component: RF Battle Manager (Central Brain)
-Revision: 1.0.1 (2025-12-04)
+Revision: 1.2.0 (Batched Writer)
 Author: System Architect (Gemini)
 Description: Headless version of the 'Live Battle' script.
              Polls Keimola Nodes -> Calculates Metrics -> Pushes to InfluxDB.
+             Nodes are fetched concurrently over keep-alive sessions
+             (node_poller.py, shared with adsb-feeders). Writes go through
+             the shared batched InfluxDB writer (influx_writer.py).
 """
 
-import requests
 import time
 import math
 import os
 import sys
 import logging
 from datetime import datetime
+from urllib.parse import urlsplit, parse_qs
+
+from node_poller import NodePoller
+from influx_writer import InfluxWriter
 
 # --- Configuration via Environment Variables ---
 # Defaults set to your known Keimola IP addresses
@@ -51,64 +57,79 @@ def haversine_distance(lat1, lon1, lat2, lon2):
     c = 2 * math.asin(math.sqrt(a))
     return R * c
 
-def get_node_metrics(name, config):
-    """Fetches stats and aircraft lists from a node."""
+STATS_PATH = "/data/stats.json"
+AIRCRAFT_PATH = "/data/aircraft.json"
+NODE_DEADLINE = float(os.getenv("NODE_DEADLINE", 2))  # Max wait per node (seconds)
+
+def get_node_metrics(name, responses):
+    """Calculates metrics from a node's stats and aircraft responses."""
     result = {
         "status": "OK", "rssi": -99.9, "msgs": 0, 
         "total_ac": 0, "ground_ac": 0, "max_range": 0.0,
-        "alt_dist": {"Low": 0, "Mid": 0, "High": 0}
+        "alt_dist": {"Low": 0, "Mid": 0, "High": 0},
+        "latency_ms": 0.0
     }
-    base_url = config['url']
+    stats_res = responses[STATS_PATH]
+    aircraft_res = responses[AIRCRAFT_PATH]
+    result['latency_ms'] = max(stats_res.latency_ms or 0.0, aircraft_res.latency_ms or 0.0)
 
-    # 1. Fetch Hardware Stats
+    # 1. Hardware Stats
     try:
-        r = requests.get(f"{base_url}/data/stats.json", timeout=2)
-        if r.status_code == 200:
-            d = r.json()
-            # Logic to find the best non-zero message count
-            block = d.get('last1min', d.get('total', {}))
-            local = block.get('local', {})
-            
-            result['rssi'] = local.get('signal', -99.9)
-            
-            raw_msgs = block.get('messages', local.get('messages', 0))
-            # Convert to per-second if using last1min
-            result['msgs'] = int(raw_msgs / 60) if 'last1min' in d else int(raw_msgs)
+        if not stats_res.ok:
+            raise RuntimeError(stats_res.error)
+
+        d = stats_res.data
+        # Logic to find the best non-zero message count
+        block = d.get('last1min', d.get('total', {}))
+        local = block.get('local', {})
+        
+        result['rssi'] = local.get('signal', -99.9)
+        
+        raw_msgs = block.get('messages', local.get('messages', 0))
+        # Convert to per-second if using last1min
+        result['msgs'] = int(raw_msgs / 60) if 'last1min' in d else int(raw_msgs)
     except Exception as e:
         result['status'] = f"Stats Fail: {e}"
 
-    # 2. Fetch Aircraft positions
+    # 2. Aircraft positions
     try:
-        r = requests.get(f"{base_url}/data/aircraft.json", timeout=2)
-        if r.status_code == 200:
-            ac_list = r.json().get('aircraft', [])
-            result['total_ac'] = len(ac_list)
-            
-            max_dist = 0.0
-            
-            for ac in ac_list:
-                # Ground Check
-                alt = ac.get('alt_baro')
-                if str(alt).lower() == "ground":
-                    result['ground_ac'] += 1
-                elif isinstance(alt, (int, float)):
-                    if alt < 10000: result['alt_dist']['Low'] += 1
-                    elif alt < 30000: result['alt_dist']['Mid'] += 1
-                    else: result['alt_dist']['High'] += 1
-
-                # Range Calculation
-                if 'lat' in ac and 'lon' in ac:
-                    dist = haversine_distance(REF_LAT, REF_LON, ac['lat'], ac['lon'])
-                    if dist > max_dist:
-                        max_dist = dist
-            
-            result['max_range'] = max_dist
+        if not aircraft_res.ok:
+            raise RuntimeError(aircraft_res.error)
+
+        ac_list = aircraft_res.data.get('aircraft', [])
+        result['total_ac'] = len(ac_list)
+        
+        max_dist = 0.0
+        
+        for ac in ac_list:
+            # Ground Check
+            alt = ac.get('alt_baro')
+            if str(alt).lower() == "ground":
+                result['ground_ac'] += 1
+            elif isinstance(alt, (int, float)):
+                if alt < 10000: result['alt_dist']['Low'] += 1
+                elif alt < 30000: result['alt_dist']['Mid'] += 1
+                else: result['alt_dist']['High'] += 1
+
+            # Range Calculation
+            if 'lat' in ac and 'lon' in ac:
+                dist = haversine_distance(REF_LAT, REF_LON, ac['lat'], ac['lon'])
+                if dist > max_dist:
+                    max_dist = dist
+        
+        result['max_range'] = max_dist
     except Exception as e:
         result['status'] = f"Aircraft Fail: {e}"
         
     return result
 
-def push_metrics(name, config, data):
+def make_writer(write_url):
+    """Builds the shared writer from a legacy 'http://host:8086/write?db=readsb' URL."""
+    parts = urlsplit(write_url)
+    db = parse_qs(parts.query).get('db', ['readsb'])[0]
+    return InfluxWriter(f"{parts.scheme}://{parts.netloc}", db, name="rf-battle-manager", log=logger.error)
+
+def push_metrics(writer, name, config, data):
     """Writes metrics to InfluxDB."""
     if "Fail" in data['status']: 
         return
@@ -127,33 +148,31 @@ def push_metrics(name, config, data):
         f"msg_rate={data['msgs']}i",
         f"alt_low={data['alt_dist']['Low']}i",
         f"alt_mid={data['alt_dist']['Mid']}i",
-        f"alt_high={data['alt_dist']['High']}i"
+        f"alt_high={data['alt_dist']['High']}i",
+        f"fetch_latency_ms={round(data['latency_ms'], 1)}"
     ]
     
     line = f"rf_battle_stats,{tags} {','.join(fields)} {timestamp}"
-    
-    try:
-        r = requests.post(INFLUX_URL, data=line, timeout=2)
-        if r.status_code not in [200, 204]:
-            logger.error(f"Influx Write Error {r.status_code}: {r.text}")
-    except Exception as e:
-        logger.error(f"Influx Connection Error: {e}")
+    writer.write(line)
 
 def main():
-    logger.info("--- RF Battle Manager v1.0 Started ---")
+    logger.info("--- RF Battle Manager v1.2 Started ---")
     logger.info(f"Target DB: {INFLUX_URL}")
+    writer = make_writer(INFLUX_URL)
+    poller = NodePoller({name: cfg['url'] for name, cfg in NODES.items()}, deadline=NODE_DEADLINE)
     
     while True:
-        # Loop through nodes
+        # Fetch all nodes at once, then compute per node
+        responses = poller.fetch_all([STATS_PATH, AIRCRAFT_PATH])
         for name, config in NODES.items():
-            metrics = get_node_metrics(name, config)
+            metrics = get_node_metrics(name, responses[name])
             
             if "Fail" in metrics['status']:
                 # Only log errors every now and then to avoid spamming logs
                 if int(time.time()) % 60 == 0: 
                     logger.warning(f"{name}: {metrics['status']}")
             else:
-                push_metrics(name, config, metrics)
+                push_metrics(writer, name, config, metrics)
                 
         # Wait 5 seconds
         time.sleep(5)
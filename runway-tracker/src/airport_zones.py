@@ -0,0 +1,196 @@
+import math
+
+# ==============================================================================
+# Module: airport_zones.py
+# Version: 1.0.0 (Spatial Grid Index)
+# Description:
+#   Approach zones and runway geometry for the Runway Tracker.
+#   - ZoneIndex: equirectangular grid (CELL_DEG cells) mapping each cell to
+#     the airports whose approach circle touches it. A lookup is one dict
+#     access; aircraft far from every airport are rejected before any
+#     distance math.
+#   - Airport: local flat-earth projection (metres, centred on the airport)
+#     used for the exact radius test and the runway geometry.
+#   - Runway: centerline between the two thresholds plus a rectangle of the
+#     runway width ("polygon"), loaded once from the gazetteer GeoJSON.
+#
+#   Gazetteer runway features (any of):
+#     - LineString centerline with properties le_ident / he_ident
+#       (first coordinate = le threshold), optional width_ft
+#     - OurAirports-style properties le_latitude_deg, le_longitude_deg,
+#       he_latitude_deg, he_longitude_deg (+ le_ident, he_ident, width_ft)
+#   and an 'airport_ident' / 'gps_code' property naming the airport.
+# ==============================================================================
+
+CELL_DEG = 0.1                 # Grid cell size (latitude degrees; longitude scaled)
+M_PER_DEG_LAT = 110540.0
+M_PER_DEG_LON = 111320.0
+DEFAULT_WIDTH_M = 45.0
+FINAL_APPROACH_M = 8000        # Extended centerline length used to catch finals
+CORRIDOR_HALF_WIDTH_M = 300    # Lateral tolerance on the extended centerline
+MAX_ALIGN_DEG = 20             # Track vs runway heading tolerance
+
+
+def bearing_deg(x0, y0, x1, y1):
+    """Bearing of the vector (x0,y0)->(x1,y1) in a local east/north frame."""
+    return math.degrees(math.atan2(x1 - x0, y1 - y0)) % 360.0
+
+
+def angle_diff(a, b):
+    return abs((b - a + 180.0) % 360.0 - 180.0)
+
+
+class Runway:
+    """One physical runway: two thresholds projected into the airport frame."""
+
+    def __init__(self, le_ident, he_ident, le_xy, he_xy, width_m=DEFAULT_WIDTH_M):
+        self.le_ident = le_ident
+        self.he_ident = he_ident
+        self.x0, self.y0 = le_xy
+        self.x1, self.y1 = he_xy
+        self.length = math.hypot(self.x1 - self.x0, self.y1 - self.y0)
+        self.ux = (self.x1 - self.x0) / self.length   # Unit vector le -> he
+        self.uy = (self.y1 - self.y0) / self.length
+        self.half_width = width_m / 2.0
+        self.heading = bearing_deg(self.x0, self.y0, self.x1, self.y1)  # Landing on 'le' end
+
+    def locate(self, x, y):
+        """(along, cross) in metres: along from the le threshold, cross = signed offset."""
+        dx, dy = x - self.x0, y - self.y0
+        return dx * self.ux + dy * self.uy, dx * self.uy - dy * self.ux
+
+    def on_runway(self, x, y):
+        """Inside the runway rectangle (polygon)."""
+        along, cross = self.locate(x, y)
+        return 0 <= along <= self.length and abs(cross) <= self.half_width
+
+    def match(self, x, y, track):
+        """
+        Ident of the runway end the aircraft is aligned with, or None.
+        Checked on the runway itself and on the extended centerline both ways.
+        """
+        along, cross = self.locate(x, y)
+        if not (-FINAL_APPROACH_M <= along <= self.length + FINAL_APPROACH_M):
+            return None
+        if abs(cross) > max(self.half_width, CORRIDOR_HALF_WIDTH_M):
+            return None
+        return self.ident_for(track)
+
+    def ident_for(self, track, tolerance=MAX_ALIGN_DEG):
+        if track is None:
+            return None
+        if angle_diff(track, self.heading) <= tolerance:
+            return self.le_ident
+        if angle_diff(track, (self.heading + 180.0) % 360.0) <= tolerance:
+            return self.he_ident
+        return None
+
+
+class Airport:
+    def __init__(self, code, lat, lon, radius_km):
+        self.code = code
+        self.lat = lat
+        self.lon = lon
+        self.radius_m = radius_km * 1000.0
+        self.cos_lat = math.cos(math.radians(lat))
+        self.runways = []
+
+    def project(self, lat, lon):
+        """Equirectangular projection to metres east/north of the airport."""
+        return (lon - self.lon) * M_PER_DEG_LON * self.cos_lat, (lat - self.lat) * M_PER_DEG_LAT
+
+    def distance_m(self, lat, lon):
+        x, y = self.project(lat, lon)
+        return math.hypot(x, y)
+
+    def runway_for(self, lat, lon, track):
+        """Runway ident from geometry (aligned + on centerline), else by heading only."""
+        x, y = self.project(lat, lon)
+        for rwy in self.runways:
+            ident = rwy.match(x, y, track)
+            if ident:
+                return ident
+        # Not on a centerline (e.g. taxiing): best heading match among this airport's runways
+        best = None
+        for rwy in self.runways:
+            ident = rwy.ident_for(track)
+            if ident:
+                along, cross = rwy.locate(x, y)
+                if best is None or abs(cross) < best[0]:
+                    best = (abs(cross), ident)
+        return best[1] if best else None
+
+
+class ZoneIndex:
+    """Grid cell -> airports whose approach circle overlaps the cell."""
+
+    def __init__(self, airports):
+        self.airports = airports
+        self.cells = {}
+        for ap in airports:
+            d_lat = ap.radius_m / M_PER_DEG_LAT
+            d_lon = ap.radius_m / (M_PER_DEG_LON * ap.cos_lat)
+            for ci in range(self._row(ap.lat - d_lat), self._row(ap.lat + d_lat) + 1):
+                for cj in range(self._col(ap.lon - d_lon), self._col(ap.lon + d_lon) + 1):
+                    self.cells.setdefault((ci, cj), []).append(ap)
+
+    @staticmethod
+    def _row(lat):
+        return int(math.floor(lat / CELL_DEG))
+
+    @staticmethod
+    def _col(lon):
+        return int(math.floor(lon / (2 * CELL_DEG)))  # ~square cells at 60N
+
+    def candidates(self, lat, lon):
+        return self.cells.get((self._row(lat), self._col(lon)), ())
+
+    def find(self, lat, lon):
+        """(airport, distance_m) of the nearest airport whose zone contains the point, else None."""
+        best = None
+        for ap in self.candidates(lat, lon):
+            d = ap.distance_m(lat, lon)
+            if d <= ap.radius_m and (best is None or d < best[1]):
+                best = (ap, d)
+        return best
+
+
+def load_airports(geojson, codes, radius_km, defaults=None):
+    """
+    Builds Airport objects (with runways) for the requested ICAO codes from
+    the gazetteer. Codes missing from the gazetteer use 'defaults' centers.
+    """
+    defaults = defaults or {}
+    centers = {}
+    runway_feats = []
+    for feature in (geojson or {}).get('features', []):
+        props = feature.get('properties', {}) or {}
+        geom = feature.get('geometry') or {}
+        if 'le_ident' in props or geom.get('type') == 'LineString':
+            runway_feats.append((props, geom))
+        elif geom.get('type') == 'Point' and props.get('gps_code') in codes:
+            lon, lat = geom['coordinates'][:2]
+            centers[props['gps_code']] = (lat, lon)
+
+    airports = {}
+    for code in codes:
+        center = centers.get(code) or defaults.get(code)
+        if center:
+            airports[code] = Airport(code, center[0], center[1], radius_km)
+
+    for props, geom in runway_feats:
+        ap = airports.get(props.get('airport_ident') or props.get('gps_code'))
+        if ap is None:
+            continue
+        if geom.get('type') == 'LineString' and len(geom.get('coordinates', [])) >= 2:
+            (le_lon, le_lat), (he_lon, he_lat) = geom['coordinates'][0][:2], geom['coordinates'][-1][:2]
+        elif props.get('le_latitude_deg') is not None and props.get('he_latitude_deg') is not None:
+            le_lat, le_lon = float(props['le_latitude_deg']), float(props['le_longitude_deg'])
+            he_lat, he_lon = float(props['he_latitude_deg']), float(props['he_longitude_deg'])
+        else:
+            continue
+        width_ft = props.get('width_ft')
+        width_m = float(width_ft) * 0.3048 if width_ft else DEFAULT_WIDTH_M
+        ap.runways.append(Runway(str(props.get('le_ident', '??')), str(props.get('he_ident', '??')),
+                                 ap.project(le_lat, le_lon), ap.project(he_lat, he_lon), width_m))
+    return list(airports.values())
@@ -0,0 +1,174 @@
+from collections import OrderedDict
+
+# ==============================================================================
+# Module: flight_phase.py
+# Version: 1.0.0 (Flight Phase State Machine)
+# Description:
+#   Per-flight phase tracking for the Runway Tracker, updated incrementally
+#   on every report of an aircraft:
+#
+#     PARKED -> TAXI -> TAKEOFF_ROLL -> CLIMB -> AIRBORNE
+#     AIRBORNE -> APPROACH -> ROLLOUT -> TAXI -> PARKED
+#     APPROACH -> CLIMB (go-around)
+#
+#   A transition needs CONFIRM_REPORTS consecutive reports agreeing with it,
+#   so an aircraft flickering around a threshold does not re-emit events.
+#   Only strictly newer reports count: the state store calls back once per
+#   receiver for the same fused record, and those copies are not new evidence.
+#   Lift-off / touchdown timestamps are taken from the FIRST report of the
+#   confirmed condition, not from the confirming one.
+#   Flights live in an OrderedDict in last-seen order: expiry pops from the
+#   front and stops at the first live flight (O(1) per expired flight).
+# ==============================================================================
+
+PARKED = "parked"
+TAXI = "taxi"
+TAKEOFF_ROLL = "takeoff_roll"
+CLIMB = "climb"
+AIRBORNE = "airborne"
+APPROACH = "approach"
+ROLLOUT = "rollout"
+
+# Events written on these transitions (old event names kept for the dashboard)
+EVENTS = {
+    (PARKED, TAXI): "taxiing",
+    (ROLLOUT, TAXI): "taxiing",
+    (TAXI, TAKEOFF_ROLL): "takeoff_roll",
+    (TAKEOFF_ROLL, CLIMB): "takeoff",
+    (TAXI, CLIMB): "takeoff",        # Take-off roll shorter than the confirmation
+    (ROLLOUT, CLIMB): "takeoff",     # Touch-and-go: the landing was already emitted
+    (AIRBORNE, APPROACH): "approach",
+    (CLIMB, APPROACH): "approach",
+    (APPROACH, ROLLOUT): "landing",
+    (APPROACH, CLIMB): "go_around",
+}
+
+CONFIRM_REPORTS = 2     # Consecutive reports needed for a transition
+FLIGHT_TTL = 300        # Seconds without reports before a flight is forgotten
+
+
+class Flight:
+    __slots__ = ("icao", "phase", "last_seen", "candidate", "candidate_since",
+                 "candidate_count", "liftoff_ts", "touchdown_ts", "runway", "airport")
+
+    def __init__(self, icao, phase, ts):
+        self.icao = icao
+        self.phase = phase
+        self.last_seen = ts
+        self.candidate = None
+        self.candidate_since = None
+        self.candidate_count = 0
+        self.liftoff_ts = None
+        self.touchdown_ts = None
+        self.runway = None
+        self.airport = None
+
+
+class FlightPhaseTracker:
+    """
+    thresholds: dict with ground_alt_ft, taxi_min_kts, taxi_max_kts,
+    rolling_kts, climb_fpm, descend_fpm, ceiling_ft.
+    update() returns (flight, event, event_ts) on an emitting transition, else None.
+    """
+
+    def __init__(self, thresholds, ttl=FLIGHT_TTL, confirm=CONFIRM_REPORTS):
+        self.t = thresholds
+        self.ttl = ttl
+        self.confirm = confirm
+        self.flights = OrderedDict()
+
+    def initial_phase(self, on_ground, speed, vsi, alt):
+        t = self.t
+        if on_ground:
+            if speed < t['taxi_min_kts']: return PARKED
+            if speed < t['taxi_max_kts']: return TAXI
+            return ROLLOUT if vsi <= 0 else TAKEOFF_ROLL
+        if vsi < t['descend_fpm'] and alt < t['ceiling_ft']: return APPROACH
+        if vsi > t['climb_fpm'] and alt < t['ceiling_ft']: return CLIMB
+        return AIRBORNE
+
+    def next_phase(self, phase, on_ground, speed, vsi, alt):
+        """Target phase for this report (may equal the current phase)."""
+        t = self.t
+        if phase == PARKED:
+            return TAXI if on_ground and speed >= t['taxi_min_kts'] else phase
+        if phase == TAXI:
+            if not on_ground: return CLIMB
+            if speed >= t['rolling_kts']: return TAKEOFF_ROLL
+            if speed < t['taxi_min_kts']: return PARKED
+            return phase
+        if phase == TAKEOFF_ROLL:
+            if not on_ground: return CLIMB
+            if speed < t['taxi_max_kts']: return TAXI  # Rejected takeoff
+            return phase
+        if phase == CLIMB:
+            if on_ground: return ROLLOUT
+            if vsi < t['descend_fpm']: return APPROACH
+            if alt >= t['ceiling_ft']: return AIRBORNE
+            return phase
+        if phase == AIRBORNE:
+            if on_ground: return ROLLOUT
+            if vsi < t['descend_fpm'] and alt < t['ceiling_ft']: return APPROACH
+            return phase
+        if phase == APPROACH:
+            if on_ground: return ROLLOUT
+            if vsi > t['climb_fpm']: return CLIMB
+            return phase
+        if phase == ROLLOUT:
+            if not on_ground: return CLIMB  # Touch-and-go
+            if speed < t['taxi_max_kts']: return TAXI
+            return phase
+        return phase
+
+    def update(self, icao, ts, alt, speed, vsi):
+        on_ground = alt < self.t['ground_alt_ft']
+        flight = self.flights.get(icao)
+        if flight is None:
+            self.flights[icao] = Flight(icao, self.initial_phase(on_ground, speed, vsi, alt), ts)
+            return None
+
+        self.flights.move_to_end(icao)
+        if ts <= flight.last_seen:
+            return None  # Late report, or the same report again via another receiver
+        flight.last_seen = ts
+
+        target = self.next_phase(flight.phase, on_ground, speed, vsi, alt)
+        if target == flight.phase:
+            flight.candidate = None
+            flight.candidate_count = 0
+            return None
+
+        if target != flight.candidate:
+            flight.candidate = target
+            flight.candidate_since = ts
+            flight.candidate_count = 0
+        flight.candidate_count += 1
+        if flight.candidate_count < self.confirm:
+            return None
+
+        # Confirmed transition
+        previous, flight.phase = flight.phase, target
+        event_ts = flight.candidate_since
+        flight.candidate = None
+        flight.candidate_count = 0
+        if target == CLIMB and previous in (TAKEOFF_ROLL, TAXI, ROLLOUT):
+            flight.liftoff_ts = event_ts
+        if target == ROLLOUT:
+            flight.touchdown_ts = event_ts
+
+        event = EVENTS.get((previous, target))
+        return (flight, event, event_ts) if event else None
+
+    def expire(self, now):
+        """Drops flights not seen for ttl seconds. Returns how many were dropped."""
+        dropped = 0
+        while self.flights:
+            icao, flight = next(iter(self.flights.items()))
+            if now - flight.last_seen < self.ttl:
+                break
+            self.flights.popitem(last=False)
+            dropped += 1
+        return dropped
+
+    def __len__(self):
+        return len(self.flights)
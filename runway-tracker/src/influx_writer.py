@@ -0,0 +1,273 @@
+import os
+import time
+import gzip
+import atexit
+import threading
+from datetime import datetime, timezone
+
+import requests
+
+# ==============================================================================
+# Module: influx_writer.py
+# Version: 1.0.0 (Batched Writer)
+# Description:
+#   One InfluxDB 1.8 writer for every Central Brain service.
+#   - Accumulates Line Protocol rows across the loop, flushes by size or time.
+#   - gzip-compressed POST bodies.
+#   - Retries with exponential backoff on 5xx / 429 / connection errors.
+#   - Spools batches to local disk while InfluxDB is down and replays them
+#     (oldest first) once it is back.
+#
+#   This file is shared: adsb-feeders/ holds the master copy, the other
+#   services carry an identical copy in their build context. Edit the
+#   master only, then run tools/sync_shared_modules.py.
+# ==============================================================================
+
+DEFAULT_BATCH_SIZE = 5000       # Rows per POST
+DEFAULT_FLUSH_INTERVAL = 1.0    # Seconds
+DEFAULT_MAX_BUFFER = 100000     # Rows held in memory before spilling to disk
+DEFAULT_MAX_SPOOL_MB = 200      # Oldest spool files are dropped beyond this
+SPOOL_ROOT = os.getenv("INFLUX_SPOOL_DIR", "/tmp/influx-spool")  # docker-compose mounts the influx-spool volume here
+
+RETRIES = 3
+BACKOFF_BASE = 0.5              # Seconds, doubled per attempt
+BACKOFF_MAX = 60.0              # Seconds between probes while InfluxDB is down
+REPLAY_FILES_PER_FLUSH = 20
+
+
+def escape_key(value):
+    """Escapes measurement names, tag keys/values and field keys."""
+    return str(value).replace('\\', '\\\\').replace(',', '\\,').replace('=', '\\=').replace(' ', '\\ ')
+
+
+def format_field_value(value):
+    """Python value -> Line Protocol field value (same typing as influxdb-python)."""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return f"{value}i"
+    if isinstance(value, float):
+        return repr(value)
+    text = str(value).replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{text}"'
+
+
+def to_ns(ts):
+    """Accepts epoch ns (int), epoch seconds (float) or an ISO8601 string."""
+    if ts is None:
+        return time.time_ns()
+    if isinstance(ts, int):
+        return ts
+    if isinstance(ts, float):
+        return int(ts * 1e9)
+    dt = datetime.fromisoformat(str(ts).replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1e9)
+
+
+def point_to_line(measurement, tags, fields, ts=None):
+    """Builds one Line Protocol row. Tags with empty values and None fields are dropped."""
+    tag_str = "".join(
+        f",{escape_key(k)}={escape_key(v)}"
+        for k, v in sorted((tags or {}).items()) if v is not None and str(v) != ""
+    )
+    field_str = ",".join(
+        f"{escape_key(k)}={format_field_value(v)}"
+        for k, v in fields.items() if v is not None
+    )
+    if not field_str:
+        return None
+    return f"{escape_key(measurement)}{tag_str} {field_str} {to_ns(ts)}"
+
+
+class InfluxWriter:
+    """
+    Usage:
+        writer = InfluxWriter("http://influxdb:8086", "readsb", name="physics-guard")
+        writer.write_point("physics_alerts", {"icao24": icao}, {"severity": 1.0})
+        writer.write(line)              # complete Line Protocol row (with timestamp)
+        writer.write_points(json_body)  # influxdb-python style dicts
+    Rows are flushed by a background thread; call flush() to force a send.
+    """
+
+    def __init__(self, url, db, name="writer", batch_size=DEFAULT_BATCH_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, max_buffer=DEFAULT_MAX_BUFFER,
+                 spool_dir=None, max_spool_mb=DEFAULT_MAX_SPOOL_MB, log=print):
+        self.write_url = f"{url.rstrip('/')}/write"
+        self.params = {"db": db, "precision": "ns"}
+        self.name = name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.spool_dir = spool_dir or os.path.join(SPOOL_ROOT, name)
+        self.max_spool_bytes = max_spool_mb * 1024 * 1024
+        self.log = log
+
+        self.session = requests.Session()
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.send_lock = threading.Lock()
+        self.down_until = 0.0
+        self.down_backoff = BACKOFF_BASE
+        self.spool_seq = 0
+        self.stats = {"written": 0, "spooled": 0, "dropped": 0, "replayed": 0}
+        self.running = True
+
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self.thread = threading.Thread(target=self._run, name=f"influx-writer-{name}", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    # --- PUBLIC API ---
+
+    def write(self, line):
+        """Queues one complete Line Protocol row."""
+        if line:
+            self.write_lines([line])
+
+    def write_lines(self, lines):
+        """Queues several complete Line Protocol rows."""
+        with self.lock:
+            self.buffer.extend(lines)
+            if len(self.buffer) >= self.batch_size:
+                self.wakeup.notify()
+
+    def write_point(self, measurement, tags, fields, ts=None):
+        """Queues one point; ts defaults to now (stamped on accept, not on send)."""
+        self.write(point_to_line(measurement, tags, fields, ts))
+
+    def write_points(self, points):
+        """Drop-in for InfluxDBClient.write_points(json_body)."""
+        self.write_lines([
+            line for line in (
+                point_to_line(p["measurement"], p.get("tags"), p["fields"], p.get("time"))
+                for p in points
+            ) if line
+        ])
+        return True
+
+    def flush(self):
+        """Sends everything buffered now (blocking)."""
+        with self.lock:
+            batch, self.buffer = self.buffer, []
+        for i in range(0, len(batch), self.batch_size):
+            self._send_or_spool(batch[i:i + self.batch_size])
+
+    def close(self):
+        if self.running:
+            self.running = False
+            with self.lock:
+                self.wakeup.notify()
+            self.flush()
+
+    # --- BACKGROUND FLUSHER ---
+
+    def _run(self):
+        while self.running:
+            with self.lock:
+                if len(self.buffer) < self.batch_size:
+                    self.wakeup.wait(self.flush_interval)
+                batch, self.buffer = self.buffer[:self.batch_size], self.buffer[self.batch_size:]
+                overflow = []
+                if len(self.buffer) > self.max_buffer:
+                    overflow, self.buffer = self.buffer, []
+            try:
+                if batch:
+                    self._send_or_spool(batch)
+                if overflow:
+                    self._spool(overflow)
+                if time.time() >= self.down_until:
+                    self._replay_spool()
+            except Exception as e:
+                self.log(f"[InfluxWriter:{self.name}] Flush error: {e}")
+
+    def _send_or_spool(self, lines):
+        body = gzip.compress("\n".join(lines).encode("utf-8"), compresslevel=3)
+        if time.time() < self.down_until:
+            # InfluxDB known down: skip the retry ladder, go straight to disk
+            self._spool_body(body, len(lines))
+            return
+        if self._post(body, len(lines)):
+            return
+        self._spool_body(body, len(lines))
+
+    def _post(self, body, count, retries=RETRIES):
+        """POSTs a gzipped body. True when InfluxDB accepted (or permanently rejected) it."""
+        headers = {"Content-Encoding": "gzip", "Content-Type": "text/plain; charset=utf-8"}
+        delay = BACKOFF_BASE
+        with self.send_lock:
+            for attempt in range(retries):
+                try:
+                    r = self.session.post(self.write_url, params=self.params, data=body,
+                                          headers=headers, timeout=5)
+                    if r.status_code < 300:
+                        self.stats["written"] += count
+                        self.down_until = 0.0
+                        self.down_backoff = BACKOFF_BASE
+                        return True
+                    if 400 <= r.status_code < 500 and r.status_code != 429:
+                        # Bad data (type conflict, parse error): retrying will never help
+                        self.stats["dropped"] += count
+                        self.log(f"[InfluxWriter:{self.name}] Rejected {count} rows: {r.status_code} {r.text.strip()[:200]}")
+                        return True
+                except requests.RequestException:
+                    pass
+                if attempt < retries - 1:
+                    time.sleep(delay)
+                    delay *= 2
+
+            self.down_until = time.time() + self.down_backoff
+            self.down_backoff = min(self.down_backoff * 2, BACKOFF_MAX)
+            return False
+
+    # --- DISK SPOOL ---
+
+    def _spool(self, lines):
+        self._spool_body(gzip.compress("\n".join(lines).encode("utf-8"), compresslevel=3), len(lines))
+
+    def _spool_body(self, body, count):
+        self.spool_seq += 1
+        path = os.path.join(self.spool_dir, f"{time.time_ns()}-{self.spool_seq:06d}-{count}.lp.gz")
+        try:
+            with open(path, "wb") as f:
+                f.write(body)
+            self.stats["spooled"] += count
+        except OSError as e:
+            self.stats["dropped"] += count
+            self.log(f"[InfluxWriter:{self.name}] Spool write failed, dropped {count} rows: {e}")
+            return
+        self._trim_spool()
+
+    def _spool_files(self):
+        try:
+            return sorted(f for f in os.listdir(self.spool_dir) if f.endswith(".lp.gz"))
+        except OSError:
+            return []
+
+    def _trim_spool(self):
+        files = self._spool_files()
+        sizes = {f: os.path.getsize(os.path.join(self.spool_dir, f)) for f in files}
+        total = sum(sizes.values())
+        for f in files:
+            if total <= self.max_spool_bytes:
+                break
+            total -= sizes[f]
+            os.remove(os.path.join(self.spool_dir, f))
+            self.stats["dropped"] += int(f.split("-")[-1].split(".")[0])
+            self.log(f"[InfluxWriter:{self.name}] Spool full, dropped oldest batch {f}")
+
+    def _replay_spool(self):
+        files = self._spool_files()[:REPLAY_FILES_PER_FLUSH]
+        for f in files:
+            path = os.path.join(self.spool_dir, f)
+            with open(path, "rb") as fh:
+                body = fh.read()
+            count = int(f.split("-")[-1].split(".")[0])
+            if not self._post(body, count, retries=1):
+                return
+            os.remove(path)
+            self.stats["replayed"] += count
+        if files:
+            self.log(f"[InfluxWriter:{self.name}] Replayed {len(files)} spooled batches.")
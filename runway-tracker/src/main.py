@@ -1,18 +1,23 @@
 #!/usr/bin/env python3
 # ==============================================================================
-# RUNWAY TRACKER v3.1.0 (Network Fix)
+# RUNWAY TRACKER v3.5.0 (Flight Phase State Machine)
 # ==============================================================================
 
 import time
 import os
 import logging
+import threading
 import requests
 from datetime import datetime
 from influxdb import InfluxDBClient
-from geopy.distance import geodesic
 
-__version__ = "3.1.0"
-__updated__ = "2025-12-05"
+from influx_writer import InfluxWriter
+from aircraft_state import connect_state
+from airport_zones import ZoneIndex, load_airports
+from flight_phase import FlightPhaseTracker
+
+__version__ = "3.5.0"
+__updated__ = "2026-10-16"
 
 # ==========================================
 # ⚙️ CONFIGURATION
@@ -24,13 +29,16 @@ INFLUX_HOST = os.getenv('INFLUX_HOST', 'influxdb')
 INFLUX_PORT = int(os.getenv('INFLUX_PORT', 8086))
 INFLUX_DB   = os.getenv('INFLUX_DB', 'readsb')
 
-# 2. Data Source
+# 2. Data Source (live state bus via MQTT; STATE_SOURCE=influx queries this measurement)
 SOURCE_MEASUREMENT = "local_aircraft_state"
+STATE_FIELDS = ["lat", "lon", "alt_baro_ft", "gs_knots", "vert_rate_fpm", "track", "squawk"]
+STATE_MAX_AGE = 15
 
-# 3. Airport Geometry
+# 3. Airport Geometry (airports + runway centerlines from the gazetteer)
 GAZETTEER_URL = os.getenv('GAZETTEER_URL', 'http://central-brain:80/public/gazetteer/airports.geojson')
-TARGET_AIRPORT_CODE = os.getenv('TARGET_AIRPORT', 'EFHK')
-DEFAULT_CENTER = (60.3172, 24.9633) 
+TARGET_AIRPORTS = [c.strip().upper() for c in
+                   os.getenv('TARGET_AIRPORTS', os.getenv('TARGET_AIRPORT', 'EFHK')).split(',') if c.strip()]
+DEFAULT_CENTERS = {'EFHK': (60.3172, 24.9633)}
 
 # 4. Spatial Filters
 APPROACH_RADIUS_KM = 15.0   
@@ -42,27 +50,44 @@ DESCEND_THRESH_FPM = -400
 TAXI_MIN_SPEED = 5          
 TAXI_MAX_SPEED = 60         
 ROLLING_SPEED = 80          
+GROUND_ALT_FT = 100         # Below this (or 'ground' = 0) the aircraft is on the surface
+
+PHASE_THRESHOLDS = {
+    'ground_alt_ft': GROUND_ALT_FT, 'taxi_min_kts': TAXI_MIN_SPEED, 'taxi_max_kts': TAXI_MAX_SPEED,
+    'rolling_kts': ROLLING_SPEED, 'climb_fpm': CLIMB_THRESH_FPM, 'descend_fpm': DESCEND_THRESH_FPM,
+    'ceiling_ft': ALTITUDE_CEILING_FT,
+}
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(name)s] %(message)s')
 logger = logging.getLogger("RunwayTracker")
 
-def get_airport_coordinates():
+def build_zone_index():
+    """Loads the gazetteer once and indexes the approach zone of every target airport."""
+    data = None
     try:
         logger.info(f"Fetching airport data from {GAZETTEER_URL}...")
         resp = requests.get(GAZETTEER_URL, timeout=5)
         if resp.status_code == 200:
             data = resp.json()
-            for feature in data.get('features', []):
-                props = feature.get('properties', {})
-                if props.get('gps_code') == TARGET_AIRPORT_CODE:
-                    coords = feature['geometry']['coordinates']
-                    logger.info(f"✅ Found {TARGET_AIRPORT_CODE}: {coords[1]}, {coords[0]}")
-                    return (coords[1], coords[0])
-            logger.warning(f"Airport {TARGET_AIRPORT_CODE} not found.")
     except Exception as e:
         logger.warning(f"Gazetteer lookup failed: {e}")
-    
-    return DEFAULT_CENTER
+
+    airports = load_airports(data, TARGET_AIRPORTS, APPROACH_RADIUS_KM, DEFAULT_CENTERS)
+    for ap in airports:
+        rwys = ', '.join(f"{r.le_ident}/{r.he_ident}" for r in ap.runways) or "none (heading table)"
+        logger.info(f"✅ {ap.code}: {ap.lat:.4f}, {ap.lon:.4f} | Runways: {rwys}")
+    missing = set(TARGET_AIRPORTS) - {ap.code for ap in airports}
+    if missing:
+        logger.warning(f"Airports not found: {', '.join(sorted(missing))}")
+    return ZoneIndex(airports)
+
+def assign_runway(airport, lat, lon, heading):
+    """Runway geometry when the gazetteer has it, else the EFHK heading table."""
+    if airport.runways:
+        return airport.runway_for(lat, lon, heading) or "??"
+    if airport.code == 'EFHK':
+        return get_runway(heading)
+    return "??"
 
 def get_runway(heading):
     if heading is None: return None
@@ -72,12 +97,86 @@ def get_runway(heading):
     if 10 <= heading <= 70:   return "04" 
     return "??" 
 
+class RunwayTracker:
+    """Feeds every aircraft report near a tracked airport into the phase state machine."""
+
+    def __init__(self, zones, writer):
+        self.zones = zones
+        self.writer = writer
+        self.phases = FlightPhaseTracker(PHASE_THRESHOLDS)
+        self.lock = threading.Lock()
+
+    def on_update(self, icao, rec, fields, host):
+        """State store subscriber (MQTT thread)."""
+        with self.lock:
+            self.process(icao, rec)
+
+    def process(self, icao, point):
+        lat = point.get('lat')
+        lon = point.get('lon')
+        if lat is None or lon is None: return
+
+        # Grid lookup rejects aircraft far from every airport before any distance math
+        zone = self.zones.find(lat, lon)
+        if zone is None and icao not in self.phases.flights:
+            return
+
+        alt = float(point.get('alt_baro_ft') or 0.0)
+        speed = float(point.get('gs_knots') or 0.0)
+        vsi = float(point.get('vert_rate_fpm') or 0)
+        ts = float(point.get('ts') or time.time())
+
+        result = self.phases.update(icao, ts, alt, speed, vsi)
+        flight = self.phases.flights.get(icao)
+        if zone and flight:
+            flight.airport = zone[0]
+        if not result or flight.airport is None:
+            return
+
+        flight, event_type, event_ts = result
+        airport = flight.airport
+        heading = float(point.get('track') or 0.0)
+        rwy = assign_runway(airport, lat, lon, heading)
+        flight.runway = rwy
+        callsign = point.get('callsign') or icao.upper()
+        squawk = point.get('squawk') or "----"
+
+        time_str = datetime.fromtimestamp(event_ts).strftime("%H:%M:%S")
+        logger.info(f"[{time_str}] ✈️ {event_type.upper()}: {callsign} ({airport.code} RWY {rwy})")
+
+        fields = {
+            "callsign": str(callsign),
+            "altitude": float(alt),
+            "speed": float(speed),
+            "squawk": str(squawk),
+            "phase": flight.phase,
+            "value": 1.0
+        }
+        if event_type == "takeoff" and flight.liftoff_ts:
+            fields["liftoff_ts"] = float(flight.liftoff_ts)
+        if event_type == "landing" and flight.touchdown_ts:
+            fields["touchdown_ts"] = float(flight.touchdown_ts)
+
+        json_body = [{
+            "measurement": "runway_events",
+            "tags": { "event": event_type, "runway": rwy, "airport": airport.code },
+            "time": event_ts,
+            "fields": fields
+        }]
+        self.writer.write_points(json_body)
+
+    def expire(self, now):
+        with self.lock:
+            return self.phases.expire(now)
+
 def main():
     logger.info(f"--- RUNWAY TRACKER v{__version__} STARTED ---")
-    airport_center = get_airport_coordinates()
+    zones = build_zone_index()
     
     logger.info(f"Connecting to InfluxDB at {INFLUX_HOST}:{INFLUX_PORT}...")
     client = InfluxDBClient(host=INFLUX_HOST, port=INFLUX_PORT)
+    writer = InfluxWriter(f"http://{INFLUX_HOST}:{INFLUX_PORT}", INFLUX_DB,
+                          name="runway-tracker", log=logger.warning)
     
     while True:
         try:
@@ -88,82 +187,34 @@ def main():
             logger.warning("Waiting for InfluxDB...")
             time.sleep(5)
 
-    flight_cache = {}
+    tracker = RunwayTracker(zones, writer)
+    state = connect_state("RunwayTracker", client, STATE_FIELDS, log=logger.info)
+
+    # Every report drives the state machine when the state bus is up;
+    # the InfluxDB fallback feeds it one snapshot per loop instead.
+    streaming = hasattr(state, "subscribe")
+    if streaming:
+        state.subscribe(tracker.on_update)
 
+    last_log = time.time()
     while True:
         try:
             now = time.time()
-            time_str = datetime.now().strftime("%H:%M:%S")
-            flight_cache = {k:v for k,v in flight_cache.items() if now - v['last_seen'] < 300}
-
-            query = f"""
-                SELECT last("lat") as lat, last("lon") as lon, 
-                       last("alt_baro_ft") as alt, last("gs_knots") as speed, 
-                       last("vert_rate") as vsi, last("track") as heading, 
-                       last("squawk") as squawk, last("callsign") as callsign
-                FROM "{SOURCE_MEASUREMENT}" 
-                WHERE time > now() - 15s 
-                AND "alt_baro_ft" < {ALTITUDE_CEILING_FT}
-                GROUP BY *
-            """
-            
-            try:
-                results = client.query(query)
-            except Exception as e:
-                logger.error(f"Query Failed: {e}")
-                time.sleep(5)
-                continue
-            
-            for (name, tags), points in results.items():
-                point = list(points)[0]
-                icao = tags.get('icao') or tags.get('icao24')
-                if not icao: continue
-                
-                callsign = tags.get('callsign') or point.get('callsign') or icao.upper()
-                squawk = point.get('squawk', "----")
-                lat = point.get('lat')
-                lon = point.get('lon')
-                alt = float(point.get('alt') or 0.0)
-                speed = float(point.get('speed') or 0.0)
-                heading = float(point.get('heading') or 0.0)
-                
-                if lat is None or lon is None: continue
-
-                dist = geodesic((lat, lon), airport_center).km
-                if dist < APPROACH_RADIUS_KM:
-                    
-                    event_type = None
-                    # Logic: Taxi vs Takeoff vs Landing
-                    if alt < 100 and speed < 60 and speed > TAXI_MIN_SPEED:
-                        event_type = "taxiing"
-                    elif float(point.get('vsi') or 0) > CLIMB_THRESH_FPM and speed > 100:
-                        event_type = "takeoff"
-                    elif float(point.get('vsi') or 0) < DESCEND_THRESH_FPM:
-                        event_type = "landing"
-
-                    if event_type:
-                        last_event = flight_cache.get(icao, {}).get('last_event')
-                        if last_event != event_type:
-                            rwy = get_runway(heading)
-                            logger.info(f"[{time_str}] ✈️ {event_type.upper()}: {callsign} (RWY {rwy})")
-                            
-                            json_body = [{
-                                "measurement": "runway_events",
-                                "tags": { "event": event_type, "runway": rwy },
-                                "fields": {
-                                    "callsign": str(callsign),
-                                    "altitude": float(alt),
-                                    "speed": float(speed),
-                                    "squawk": str(squawk),
-                                    "value": 1.0
-                                }
-                            }]
-                            client.write_points(json_body)
-                            
-                            flight_cache[icao] = {
-                                'last_seen': now, 'last_event': event_type,
-                                'runway': rwy, 'callsign': callsign
-                            }
+            tracker.expire(now)
+
+            if not streaming:
+                try:
+                    snapshot = state.snapshot(max_age=STATE_MAX_AGE)
+                except Exception as e:
+                    logger.error(f"State Snapshot Failed: {e}")
+                    snapshot = {}
+                with tracker.lock:
+                    for icao, point in snapshot.items():
+                        tracker.process(icao, point)
+
+            if now - last_log >= 300:
+                logger.info(f"Tracking {len(tracker.phases)} flights.")
+                last_log = now
 
         except Exception as e:
             logger.error(f"Loop Error: {e}")
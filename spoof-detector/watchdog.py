@@ -2,10 +2,16 @@ import time
 import os
 import json
 import logging
+import threading
+from bisect import bisect_left
+from collections import deque
+import numpy as np
 from influxdb import InfluxDBClient
-from geopy.distance import geodesic
 import paho.mqtt.client as mqtt
 
+from influx_writer import InfluxWriter
+from aircraft_state import AircraftStateStore, STATE_SOURCE
+
 # ==========================================
 # CONFIGURATION
 # ==========================================
@@ -14,11 +20,25 @@ INFLUX_PORT = int(os.getenv('INFLUX_PORT', 8086))
 INFLUX_DB   = os.getenv('INFLUX_DB', 'readsb')
 
 MEASUREMENT_TRUTH = "global_aircraft_state" 
-MEASUREMENT_LOCAL = os.getenv('MEASUREMENT_LOCAL', 'aircraft') 
+MEASUREMENT_LOCAL = os.getenv('MEASUREMENT_LOCAL', 'aircraft') # Only used with STATE_SOURCE=influx
 
 DIST_THRESHOLD_KM = 2.0 
 
-MQTT_BROKER = os.getenv("MQTT_BROKER", "127.0.0.1")
+# Time alignment: both sources keep short position histories; each truth sample
+# is compared with the local track interpolated to the truth timestamp.
+SCAN_INTERVAL = float(os.getenv("SCAN_INTERVAL", 1.0))   # Seconds (local feed rate)
+HISTORY_SECONDS = 120      # Per-aircraft history kept for both sources
+TRUTH_REFRESH_S = 5        # How often to pull new truth samples
+TRUTH_WINDOW_S = 60        # Raw truth points fetched per pull (deduplicated)
+LOCAL_WINDOW_S = 10        # Raw local points per scan (STATE_SOURCE=influx only)
+MAX_INTERP_GAP_S = 10      # Don't interpolate across longer local gaps
+EXTRAPOLATE_S = 1.0        # Hold the edge sample this far past the history
+
+# Distance accuracy: "vincenty" (WGS-84 ellipsoid, same as geopy geodesic to <1 m)
+# or "haversine" (sphere, ~0.5% error, cheapest)
+DISTANCE_MODE = os.getenv("DISTANCE_MODE", "vincenty").lower()
+
+MQTT_BROKER = os.getenv("MQTT_HOST") or os.getenv("MQTT_BROKER", "127.0.0.1")
 MQTT_PORT = int(os.getenv("MQTT_PORT", 1883))
 MQTT_TOPIC_ALERTS = "aviation/alerts"
 
@@ -42,15 +62,13 @@ def setup_mqtt():
         logger.warning(f"MQTT Failed ({e}). Running in Console-Only mode.")
         mqtt_enabled = False
 
-def report_to_influx(client, measurement, tags, fields):
+# Batched writer: rows from one scan go out in a single gzipped POST
+influx_writer = InfluxWriter(f"http://{INFLUX_HOST}:{INFLUX_PORT}", INFLUX_DB,
+                             name="spoof-detector", log=logger.warning)
+
+def report_to_influx(client, measurement, tags, fields, ts=None):
     try:
-        json_body = [{
-            "measurement": measurement,
-            "tags": tags,
-            "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-            "fields": fields
-        }]
-        client.write_points(json_body)
+        influx_writer.write_point(measurement, tags, fields, ts)
     except Exception as e:
         logger.error(f"Failed to write to Influx: {e}")
 
@@ -87,39 +105,207 @@ def send_alert(client, alert_type, details, icao, diff_km, local_pos, truth_pos)
                          "local_lon": float(local_pos['lon'])
                      })
 
+# ==========================================
+# VECTORIZED GEOMETRY
+# ==========================================
+EARTH_RADIUS_KM = 6371.0088
+WGS84_A = 6378.137               # km
+WGS84_F = 1 / 298.257223563
+WGS84_B = WGS84_A * (1 - WGS84_F)
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance for whole arrays (degrees in, km out)."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def vincenty_km(lat1, lon1, lat2, lon2, max_iter=20, tol=1e-12):
+    """
+    Vincenty inverse formula on WGS-84 for whole arrays.
+    All pairs iterate together; pairs that fail to converge (near-antipodal)
+    fall back to haversine.
+    """
+    f = WGS84_F
+    L = np.radians(np.asarray(lon2, dtype=float) - np.asarray(lon1, dtype=float))
+    U1 = np.arctan((1 - f) * np.tan(np.radians(lat1)))
+    U2 = np.arctan((1 - f) * np.tan(np.radians(lat2)))
+    sinU1, cosU1, sinU2, cosU2 = np.sin(U1), np.cos(U1), np.sin(U2), np.cos(U2)
+
+    lam = L.copy()
+    converged = np.zeros(L.shape, dtype=bool)
+    for _ in range(max_iter):
+        sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+        sin_sigma = np.hypot(cosU2 * sin_lam, cosU1 * sinU2 - sinU1 * cosU2 * cos_lam)
+        cos_sigma = sinU1 * sinU2 + cosU1 * cosU2 * cos_lam
+        sigma = np.arctan2(sin_sigma, cos_sigma)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sin_alpha = np.where(sin_sigma > 0, cosU1 * cosU2 * sin_lam / sin_sigma, 0.0)
+            cos2_alpha = 1 - sin_alpha ** 2
+            # Equatorial lines: cos2_alpha = 0 -> cos_2sm = 0
+            cos_2sm = np.where(cos2_alpha > 0, cos_sigma - 2 * sinU1 * sinU2 / cos2_alpha, 0.0)
+        C = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+        lam_prev = lam
+        lam = L + (1 - C) * f * sin_alpha * (
+            sigma + C * sin_sigma * (cos_2sm + C * cos_sigma * (-1 + 2 * cos_2sm ** 2)))
+        converged = np.abs(lam - lam_prev) < tol
+        if converged.all():
+            break
+
+    u2 = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+    A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+    B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+    delta_sigma = B * sin_sigma * (cos_2sm + B / 4 * (
+        cos_sigma * (-1 + 2 * cos_2sm ** 2) - B / 6 * cos_2sm * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sm ** 2)))
+    dist = WGS84_B * A * (sigma - delta_sigma)
+    if not converged.all():
+        dist = np.where(converged, dist, haversine_km(lat1, lon1, lat2, lon2))
+    return dist
+
+def distance_km(lat1, lon1, lat2, lon2):
+    if DISTANCE_MODE == "haversine":
+        return haversine_km(lat1, lon1, lat2, lon2)
+    return vincenty_km(lat1, lon1, lat2, lon2)
+
+# ==========================================
+# POSITION HISTORY
+# ==========================================
+class TrackHistory:
+    """
+    Short per-aircraft position history: icao -> deque of (t, lat, lon), t in
+    epoch seconds, strictly increasing. Written from the MQTT thread, read by
+    the scan loop.
+    """
+
+    def __init__(self, horizon_s):
+        self.horizon = horizon_s
+        self.tracks = {}
+        self.lock = threading.Lock()
+
+    def add(self, icao, t, lat, lon):
+        """Appends a sample. Returns False for duplicates / out-of-order samples."""
+        with self.lock:
+            track = self.tracks.get(icao)
+            if track is None:
+                track = self.tracks[icao] = deque()
+            elif t <= track[-1][0]:
+                return False
+            track.append((t, lat, lon))
+            while track[0][0] < t - self.horizon:
+                track.popleft()
+            return True
+
+    def position_at(self, icao, t):
+        """
+        Linear interpolation at time t between the bracketing samples.
+        Returns (lat, lon), "wait" if the history does not reach t yet, or
+        None if t cannot be covered (gap too long / older than the history).
+        """
+        with self.lock:
+            track = self.tracks.get(icao)
+            if not track:
+                return "wait"
+            track = list(track)
+        times = [p[0] for p in track]
+        if t > times[-1]:
+            # Hold the newest sample for a little clock jitter, else wait for more data
+            return track[-1][1:] if t - times[-1] <= EXTRAPOLATE_S else "wait"
+        i = bisect_left(times, t)
+        if i == 0:
+            return track[0][1:] if times[0] - t <= EXTRAPOLATE_S else None
+        t0, lat0, lon0 = track[i - 1]
+        t1, lat1, lon1 = track[i]
+        if t1 - t0 > MAX_INTERP_GAP_S:
+            return None
+        w = (t - t0) / (t1 - t0)
+        return lat0 + w * (lat1 - lat0), lon0 + w * (lon1 - lon0)
+
+    def prune(self, now):
+        with self.lock:
+            for icao in [i for i, tr in self.tracks.items() if tr[-1][0] < now - self.horizon]:
+                del self.tracks[icao]
+
 # ==========================================
 # DATABASE FUNCTIONS
 # ==========================================
-def get_latest_positions(client, measurement):
-    data = {}
+def load_raw_positions(client, measurement, window_s, history):
+    """
+    Adds raw (lat, lon) points from the last window_s seconds to history.
+    Returns the newly added samples as (icao, t, lat, lon).
+    """
+    added = []
     try:
         query = f"""
-            SELECT last("lat") as lat, last("lon") as lon, last("alt") as alt, last("baro_alt_m") as alt_m
+            SELECT "lat", "lon"
             FROM "{measurement}" 
-            WHERE time > now() - 60s 
+            WHERE time > now() - {int(window_s)}s 
             GROUP BY *
         """
-        results = client.query(query)
+        results = client.query(query, epoch='ms')
         for (name, tags), points in results.items():
             icao = tags.get('icao24') or tags.get('icao') or tags.get('hex') or tags.get('addr')
-            if icao:
-                point = list(points)[0]
-                alt = point.get('alt_m') if point.get('alt_m') is not None else point.get('alt')
-                if point['lat'] is not None and point['lon'] is not None:
-                    data[icao.lower()] = {
-                        'lat': float(point['lat']),
-                        'lon': float(point['lon']),
-                        'alt': float(alt) if alt else 0.0
-                    }
+            if not icao:
+                continue
+            icao = icao.lower()
+            for p in points:
+                if p['lat'] is None or p['lon'] is None:
+                    continue
+                t = p['time'] / 1000.0
+                if history.add(icao, t, float(p['lat']), float(p['lon'])):
+                    added.append((icao, t, float(p['lat']), float(p['lon'])))
     except Exception as e:
         logger.error(f"Query Error ({measurement}): {e}")
-    return data
+    return added
+
+def connect_local_state(local_history):
+    """Feeds local_history from the MQTT state bus. False -> poll MEASUREMENT_LOCAL instead."""
+    if STATE_SOURCE != "mqtt":
+        return False
+    try:
+        store = AircraftStateStore().connect_mqtt("SpoofDetectorState", MQTT_BROKER, MQTT_PORT)
+    except Exception as e:
+        logger.warning(f"State bus unavailable ({e}). Local positions from '{MEASUREMENT_LOCAL}'.")
+        return False
+
+    def on_update(icao, rec, fields, host):
+        if 'lat' in fields and 'lon' in fields:
+            # pos_ts: time of this position ('ts' moves on any message type)
+            t = float(fields.get('pos_ts') or rec['ts'])
+            local_history.add(icao.lower(), t, float(fields['lat']), float(fields['lon']))
+
+    store.subscribe(on_update)
+    logger.info("Local positions: live state bus")
+    return True
+
+# ==========================================
+# TIME-ALIGNED MATCHING
+# ==========================================
+def align_pending(pending, local_history, now):
+    """
+    Interpolates the local track of every pending truth sample to the truth
+    timestamp. Returns (ready arrays, samples still waiting for local data).
+    """
+    icaos, ts, l_lat, l_lon, t_lat, t_lon = [], [], [], [], [], []
+    waiting = []
+    for sample in pending:
+        icao, t, lat, lon = sample
+        pos = local_history.position_at(icao, t)
+        if pos == "wait":
+            if now - t < HISTORY_SECONDS:
+                waiting.append(sample)
+            continue
+        if pos is None:
+            continue
+        icaos.append(icao); ts.append(t)
+        l_lat.append(pos[0]); l_lon.append(pos[1])
+        t_lat.append(lat); t_lon.append(lon)
+    ready = (icaos, np.array(ts), np.array(l_lat), np.array(l_lon), np.array(t_lat), np.array(t_lon))
+    return ready, waiting
 
 # ==========================================
 # MAIN LOOP
 # ==========================================
 def main():
-    logger.info("--- SPOOF DETECTOR v2.1 (Expanded Logging) STARTING ---")
+    logger.info("--- SPOOF DETECTOR v2.5 (Time-Aligned Matching) STARTING ---")
     setup_mqtt()
     
     db_client = InfluxDBClient(host=INFLUX_HOST, port=INFLUX_PORT)
@@ -132,42 +318,60 @@ def main():
             logger.warning(f"Waiting for InfluxDB... ({e})")
             time.sleep(5)
 
+    local_history = TrackHistory(HISTORY_SECONDS)
+    truth_history = TrackHistory(HISTORY_SECONDS)
+    live_local = connect_local_state(local_history)
+
+    pending = []        # Truth samples not yet compared: (icao, t, lat, lon)
+    last_truth_poll = 0
+    last_log = 0
+    matches = 0
+
     while True:
         try:
-            truth_data = get_latest_positions(db_client, MEASUREMENT_TRUTH)
-            local_data = get_latest_positions(db_client, MEASUREMENT_LOCAL)
-            
-            if not truth_data:
-                logger.info("Waiting for OpenSky/FR24 data...")
-            
-            matches = 0
-            
-            for icao, local_pos in local_data.items():
-                if icao in truth_data:
-                    matches += 1
-                    truth_pos = truth_data[icao]
-                    
-                    p1 = (local_pos['lat'], local_pos['lon'])
-                    p2 = (truth_pos['lat'], truth_pos['lon'])
-                    distance = geodesic(p1, p2).km
-                    
-                    # Drift Metric
-                    report_to_influx(db_client, "gps_drift", 
-                                     {"icao": icao}, 
-                                     {"drift_km": float(distance)})
-                    
-                    if distance > DIST_THRESHOLD_KM:
-                        details = f"ICAO: {icao} | Diff: {distance:.2f}km"
-                        # UPDATED CALL: Passing positions
-                        send_alert(db_client, "GPS SPOOFING DETECTED", details, icao, distance, local_pos, truth_pos)
+            now = time.time()
+
+            if not live_local:
+                load_raw_positions(db_client, MEASUREMENT_LOCAL, LOCAL_WINDOW_S, local_history)
+
+            if now - last_truth_poll >= TRUTH_REFRESH_S:
+                pending.extend(load_raw_positions(db_client, MEASUREMENT_TRUTH, TRUTH_WINDOW_S, truth_history))
+                last_truth_poll = now
+                local_history.prune(now)
+                truth_history.prune(now)
+                if not truth_history.tracks:
+                    logger.info("Waiting for OpenSky/FR24 data...")
+
+            # Compare every new truth sample against the local track at the same instant
+            (icaos, ts, l_lat, l_lon, t_lat, t_lon), pending = align_pending(pending, local_history, now)
+            if icaos:
+                dist = distance_km(l_lat, l_lon, t_lat, t_lon)
+                matches += len(icaos)
+                
+                # Drift Metric, stamped at the common (truth) timestamp
+                for icao, t, d in zip(icaos, ts.tolist(), dist.tolist()):
+                    report_to_influx(db_client, "gps_drift", {"icao": icao}, {"drift_km": d}, ts=t)
+                
+                # Alerts only for the rows over threshold
+                for i in np.flatnonzero(dist > DIST_THRESHOLD_KM):
+                    icao = icaos[i]
+                    details = f"ICAO: {icao} | Diff: {dist[i]:.2f}km"
+                    local_pos = {'lat': l_lat[i], 'lon': l_lon[i]}
+                    truth_pos = {'lat': t_lat[i], 'lon': t_lon[i]}
+                    send_alert(db_client, "GPS SPOOFING DETECTED", details, icao, dist[i], local_pos, truth_pos)
+
+                influx_writer.flush()
             
-            if matches > 0:
-                logger.info(f"Scanned {len(local_data)} aircraft. Matches: {matches}.")
+            if now - last_log > 60 and matches > 0:
+                logger.info(f"Tracking {len(local_history.tracks)} local / {len(truth_history.tracks)} truth aircraft. "
+                            f"Matches (60s): {matches}. Pending: {len(pending)}.")
+                matches = 0
+                last_log = now
                 
         except Exception as e:
             logger.error(f"Loop Error: {e}")
 
-        time.sleep(15)
+        time.sleep(SCAN_INTERVAL)
 
 if __name__ == "__main__":
     main()
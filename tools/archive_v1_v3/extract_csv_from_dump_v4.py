@@ -9,19 +9,27 @@ Description: A standalone utility for the AI Team to regenerate training data
              
              Usage:
              1. Ensure 'central_brain_full_dump.lp' is in the same folder.
-             2. Run: python3 extract_csv_from_dump_v4.py
+             2. Run: python3 extract_csv_from_dump_v4.py [--workers N]
              3. Output: 3 CSV files (Local, Global, Alerts).
 
-Version: 4.0.0
+             Parsing is done by lp_parser.py (byte-level, escape-aware,
+             measurement/time pre-filtered, columnar chunks).
+             The dump is split into newline-aligned byte ranges processed
+             by a process pool; each shard writes CSV parts that are
+             concatenated in file order at the end.
+
+Version: 4.2.0
 Author: RW (Lead Solution Architect)
-Date: 2025-12-18
+Date: 2026-10-16
 """
 
 import sys
-import datetime
 import csv
-import re
 import os
+import shutil
+import argparse
+
+from lp_parser import LineProtocolReader, date_bounds_ns, shard_ranges, shard_count, map_shards
 
 # ================= Configuration =================
 # The massive raw text file containing all sensor data
@@ -51,154 +59,129 @@ FEATURE_MAP = {
     'callsign': 'Callsign'          # Flight Number (e.g. FIN511)
 }
 
-# ================= Helper Functions =================
+# Measurements routed to the CSV files (everything else is skipped by the
+# parser's prefix filter before any decoding)
+ALERT_TABLES = ['physics_alerts', 'security_alerts', 'runway_events']
+MEASUREMENTS = ['local_aircraft_state', 'global_aircraft_state'] + ALERT_TABLES
 
-def get_date_from_ns(ns_str):
-    """
-    Converts a nanosecond timestamp string (e.g., '1764108014000000000') 
-    into a readable date string (e.g., '2025-11-26').
-    """
-    try:
-        ts_val = int(ns_str)
-        # Convert nanoseconds (19 digits) to seconds (10 digits) if needed
-        if len(ns_str) > 10: 
-            ts_val = ts_val // 1_000_000_000
-        return datetime.datetime.fromtimestamp(ts_val).strftime('%Y-%m-%d')
-    except:
-        return None
-
-def parse_line(line):
+# Clean CSV Column -> Raw Influx Field
+RAW_NAME = {clean: raw for raw, clean in FEATURE_MAP.items()}
+RAW_NAME['Timestamp'] = 'time'
+
+# Define Column Headers (Schema)
+COLS_LOCAL = ['Timestamp', 'ICAO24', 'Callsign', 'Latitude', 'Longitude', 
+              'Baro_Altitude', 'Velocity', 'Heading', 'Vertical_Rate', 
+              'Signal_Strength', 'Message_Rate']
+
+COLS_GLOBAL = ['Timestamp', 'ICAO24', 'Latitude', 'Longitude', 'Baro_Altitude', 
+               'Velocity', 'Heading', 'Vertical_Rate']
+
+COLS_ALERTS = ['Timestamp', 'Alert_Type', 'Description', 'Raw_Message']
+
+# ================= Shard Worker =================
+
+def part_name(out_file, byte_range):
+    return f"{out_file}.{byte_range[0]:015d}.part"
+
+def extract_shard(path, byte_range, start_ns, end_ns):
     """
-    Parses a single line of InfluxDB Line Protocol.
-    Format: measurement,tags fields timestamp
-    Example: local_aircraft_state icao24="4aca89",lat=60.3353 1764108014000000000
+    Writes the rows of one byte range to headerless CSV parts (one per
+    output file). Runs in a worker process; returns (stats, lines scanned).
     """
-    try:
-        parts = line.strip().split(' ')
-        # We need at least Measurement+Fields and Timestamp
-        if len(parts) < 2: return None, None, None
-        
-        # 1. Extract Metadata
-        measurement = parts[0].split(',')[0] # Remove tags attached to name
-        timestamp_ns = parts[-1]
-        
-        # 2. Date Filter check
-        date_str = get_date_from_ns(timestamp_ns)
-        if not date_str or not (START_DATE <= date_str <= END_DATE):
-            return None, None, None
-
-        # 3. Data Extraction
-        data = {'Timestamp': timestamp_ns}
-        
-        # Regex Magic: Finds 'key=value' pairs.
-        # Handles:
-        #  - Quoted strings: callsign="FIN511"
-        #  - Integers with suffix: alt_baro_ft=3500i
-        #  - Floats: lat=60.3353
-        matches = re.findall(r'([a-zA-Z0-9_]+)=(".*?"|[0-9\.\-]+i?)', line)
-        
-        for key, val in matches:
-            # Clean up the value (remove quotes and 'i' suffix)
-            val_clean = val.replace('"', '').replace('i', '')
-            
-            # Map raw field name to clean CSV column name
-            if key in FEATURE_MAP:
-                data[FEATURE_MAP[key]] = val_clean
-            else:
-                # Preserve unmapped fields just in case
-                data[key] = val_clean
-                
-        return measurement, data, date_str
-        
-    except Exception:
-        return None, None, None
+    stats = {'local': 0, 'global': 0, 'alerts': 0}
+    raw_local = [RAW_NAME.get(c, c) for c in COLS_LOCAL]
+    raw_global = [RAW_NAME.get(c, c) for c in COLS_GLOBAL]
+
+    reader = LineProtocolReader(path, measurements=MEASUREMENTS,
+                                start_ns=start_ns, end_ns=end_ns, byte_range=byte_range)
+
+    with open(part_name(OUT_LOCAL, byte_range), 'w', newline='') as f_local, \
+         open(part_name(OUT_GLOBAL, byte_range), 'w', newline='') as f_global, \
+         open(part_name(OUT_ALERTS, byte_range), 'w', newline='') as f_alerts:
+        w_local = csv.writer(f_local)
+        w_global = csv.writer(f_global)
+        w_alerts = csv.writer(f_alerts)
+
+        for chunk in reader.chunks():
+            # Route to correct CSV based on Measurement Name
+            if chunk.measurement == 'local_aircraft_state':
+                w_local.writerows(chunk.rows(raw_local))
+                stats['local'] += len(chunk)
+
+            elif chunk.measurement == 'global_aircraft_state':
+                w_global.writerows(chunk.rows(raw_global))
+                stats['global'] += len(chunk)
+
+            elif chunk.measurement in ALERT_TABLES:
+                names = list(chunk.columns)
+                for ts, *values in chunk.rows(['time'] + names):
+                    data = {FEATURE_MAP.get(k, k): v for k, v in zip(names, values) if v is not None}
+                    data['Timestamp'] = ts
+                    desc = data.get('message', data.get('description', 'Unknown'))
+                    w_alerts.writerow([ts, chunk.measurement, desc, str(data)])
+                stats['alerts'] += len(chunk)
+
+    return stats, reader.lines
+
+def merge_parts(out_file, header, ranges):
+    """Header + parts in file order -> out_file. Parts are deleted."""
+    with open(out_file, 'w', newline='') as out:
+        csv.writer(out).writerow(header)
+        for r in ranges:
+            name = part_name(out_file, r)
+            with open(name, 'r', newline='') as part:
+                shutil.copyfileobj(part, out, 16 * 1024 * 1024)
+            os.remove(name)
 
 # ================= Main Execution Flow =================
 
 def main():
+    parser = argparse.ArgumentParser(description="Regenerate the training CSVs from the raw .lp dump")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes (byte-range shards of the dump); 1 = single process")
+    args = parser.parse_args()
+
     print("="*60)
-    print(f" SECURE SKIES: DATA EXTRACTOR (v4.0)")
+    print(f" SECURE SKIES: DATA EXTRACTOR (v4.2)")
     print("="*60)
     print(f"[INFO] Input Source:  {INPUT_FILE}")
     print(f"[INFO] Date Window:   {START_DATE} to {END_DATE}")
+    print(f"[INFO] Workers:       {args.workers}")
     
     if not os.path.exists(INPUT_FILE):
         print(f"[ERROR] Raw dump file '{INPUT_FILE}' not found!")
         print("        Please ensure the .lp file is in this directory.")
         sys.exit(1)
 
-    # 1. Setup CSV Writers
-    print("[STEP 1] Initializing Output Files...")
-    
-    # Define Column Headers (Schema)
-    cols_local = ['Timestamp', 'ICAO24', 'Callsign', 'Latitude', 'Longitude', 
-                  'Baro_Altitude', 'Velocity', 'Heading', 'Vertical_Rate', 
-                  'Signal_Strength', 'Message_Rate']
-    
-    cols_global = ['Timestamp', 'ICAO24', 'Latitude', 'Longitude', 'Baro_Altitude', 
-                   'Velocity', 'Heading', 'Vertical_Rate']
-    
-    cols_alerts = ['Timestamp', 'Alert_Type', 'Description', 'Raw_Message']
+    # 1. Shard the dump (newline-aligned byte ranges)
+    ranges = shard_ranges(INPUT_FILE, shard_count(args.workers))
+    print(f"[STEP 1] Split input into {len(ranges)} shard(s)...")
 
-    # Open Files
+    # 2. Process the Dump File (one CSV part per shard and output)
+    print("[STEP 2] Processing Raw Data (This may take a moment)...")
+    start_ns, end_ns = date_bounds_ns(START_DATE, END_DATE)
     try:
-        f_local = open(OUT_LOCAL, 'w', newline='')
-        f_global = open(OUT_GLOBAL, 'w', newline='')
-        f_alerts = open(OUT_ALERTS, 'w', newline='')
-
-        # Create Writers
-        w_local = csv.DictWriter(f_local, fieldnames=cols_local, extrasaction='ignore')
-        w_global = csv.DictWriter(f_global, fieldnames=cols_global, extrasaction='ignore')
-        w_alerts = csv.writer(f_alerts)
-
-        # Write Headers
-        w_local.writeheader()
-        w_global.writeheader()
-        w_alerts.writerow(cols_alerts)
-        
+        results = map_shards(extract_shard, INPUT_FILE, ranges, args.workers, start_ns, end_ns)
     except IOError as e:
-        print(f"[ERROR] Could not open output files: {e}")
+        print(f"[ERROR] Could not write output files: {e}")
         sys.exit(1)
 
-    # 2. Process the Dump File
-    print("[STEP 2] Processing Raw Data (This may take a moment)...")
-    
     stats = {'local': 0, 'global': 0, 'alerts': 0}
-    line_count = 0
-
-    with open(INPUT_FILE, 'r', encoding='utf-8') as f:
-        for line in f:
-            line_count += 1
-            
-            # Progress Indicator (every 1M lines)
-            if line_count % 1_000_000 == 0:
-                print(f"  > Scanned {line_count // 1_000_000} Million lines...", end='\r')
-
-            # Parse Line
-            meas, data, _ = parse_line(line)
-            if not meas: continue
-
-            # Route to correct CSV based on Measurement Name
-            if meas == 'local_aircraft_state':
-                w_local.writerow(data)
-                stats['local'] += 1
-            
-            elif meas == 'global_aircraft_state':
-                w_global.writerow(data)
-                stats['global'] += 1
-            
-            elif meas in ['physics_alerts', 'security_alerts', 'runway_events']:
-                desc = data.get('message', data.get('description', 'Unknown'))
-                w_alerts.writerow([data['Timestamp'], meas, desc, str(data)])
-                stats['alerts'] += 1
-
-    # Close Files
-    f_local.close()
-    f_global.close()
-    f_alerts.close()
-
-    # 3. Final Report
-    print(f"\n\n[SUCCESS] Extraction Complete!")
+    lines = 0
+    for shard_stats, shard_lines in results:
+        lines += shard_lines
+        for k, v in shard_stats.items():
+            stats[k] += v
+    print(f"  > Scanned {lines:,} lines.")
+
+    # 3. Merge the parts in file order
+    print("[STEP 3] Merging shard outputs...")
+    merge_parts(OUT_LOCAL, COLS_LOCAL, ranges)
+    merge_parts(OUT_GLOBAL, COLS_GLOBAL, ranges)
+    merge_parts(OUT_ALERTS, COLS_ALERTS, ranges)
+
+    # 4. Final Report
+    print(f"\n[SUCCESS] Extraction Complete!")
     print("-" * 40)
     print(f"  Local Tracks (Input X):   {stats['local']} rows -> {OUT_LOCAL}")
     print(f"  Global Ref (Target Y):    {stats['global']} rows -> {OUT_GLOBAL}")
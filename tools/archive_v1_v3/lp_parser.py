@@ -0,0 +1,529 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+System: Secure Skies - Line Protocol Parser
+Script: lp_parser.py
+Description: Shared streaming parser for InfluxDB Line Protocol (.lp) dumps,
+             used by the dump tools (extract_csv_from_dump_v4.py,
+             scan_best_week.py, visualize_physics_v2.py).
+
+             - Works on raw bytes; only kept string values are decoded.
+             - Cheap pre-filters run BEFORE any field decoding:
+               measurement (bytes prefix test) and time range (integer
+               compare on the trailing timestamp).
+             - Per-day/per-measurement counting (counts()) never leaves
+               numpy: whole 16 MB blocks are scanned vectorized.
+             - Correct escaping: '\\,' '\\ ' '\\=' in measurement/tags/keys,
+               quoted string fields with '\\"' and commas/spaces inside.
+             - Field values typed: 12i/12u -> int, 1.5 -> float,
+               t/true/F/false -> bool, "text" -> str.
+             - Rows are batched into columnar chunks (one per measurement);
+               values are decoded a whole column at a time.
+             - Timestamp -> local date via a bucket cache (DateCache),
+               not datetime.fromtimestamp() per line.
+             - Sharding: shard_ranges() cuts the file into newline-aligned
+               byte ranges; map_shards() runs a worker per range on a
+               process pool (LineProtocolReader(byte_range=...)).
+
+             Usage:
+               reader = LineProtocolReader('central_brain_full_dump.lp',
+                                           measurements=['local_aircraft_state'],
+                                           start_ns=start, end_ns=end)
+               for chunk in reader.chunks():
+                   chunk.measurement, chunk.time, chunk.columns['lat']
+
+Version: 1.0.0
+Author: RW (Lead Solution Architect)
+Date: 2026-10-16
+"""
+
+import re
+import time
+import datetime
+import os
+import collections
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# ================= Configuration =================
+CHUNK_ROWS = 100_000                # Rows per columnar chunk
+BLOCK_BYTES = 16 * 1024 * 1024      # Read block size (whole lines per block)
+NAME_BYTES = 64                     # Longest measurement name the vector path handles
+TS_BYTES = 20                       # Tail window for the timestamp (19 digits + space)
+DATE_BUCKET_NS = 900 * 10**9        # 15 min: every UTC offset is a multiple of this
+SHARDS_PER_WORKER = 4               # Smaller shards even out uneven line density
+
+_POW10 = np.array([10**p for p in range(TS_BYTES - 2, -1, -1)], dtype=np.int64)
+
+_FIELD_RE = re.compile(rb'((?:[^,=\\]|\\.)+)=("(?:[^"\\]|\\.)*"|[^,]*)', re.S)
+_FIELD_PLAIN_RE = re.compile(rb'([^,=]+)=("[^"]*"|[^,]*)')   # No backslashes in the field set
+_KEY_PART_RE = re.compile(rb'(?:[^,\\]|\\.)+', re.S)
+_TAG_RE = re.compile(rb'((?:[^=\\]|\\.)+)=(.*)', re.S)
+_SERIES_END_RE = re.compile(rb'(?:[^ \\]|\\.)*', re.S)
+_UNESCAPE_RE = re.compile(rb'\\([,= "\\])')
+
+# ================= Helper Functions =================
+
+_NAMES = {}   # Raw tag/field key bytes -> str (keys repeat on every line)
+
+def name_of(b):
+    s = _NAMES.get(b)
+    if s is None:
+        s = _NAMES[b] = unescape(b)
+    return s
+
+def unescape(b):
+    """Removes line-protocol escapes and decodes to str."""
+    if b'\\' in b:
+        b = _UNESCAPE_RE.sub(rb'\1', b)
+    return b.decode('utf-8', 'replace')
+
+def escape_measurement(name):
+    """Measurement name as it appears on disk (for the prefix filter)."""
+    return name.replace('\\', '\\\\').replace(',', '\\,').replace(' ', '\\ ').encode('utf-8')
+
+def decode_value(v):
+    """Typed field value from its raw bytes."""
+    if not v:
+        return None
+    c = v[0]
+    if c == 0x22:   # '"'
+        return unescape(v[1:-1])
+    last = v[-1]
+    if last == 0x69 or last == 0x75:   # 'i' / 'u'
+        return int(v[:-1])
+    if c in b'tTfF':
+        return c in b'tT'
+    return float(v)
+
+def split_line(line):
+    """
+    (series_key, field_set, timestamp) as bytes/bytes/int-or-None.
+    Returns None for blank, comment and malformed lines.
+    """
+    line = line.rstrip(b'\r\n')
+    if not line or line[0] == 0x23:   # '#'
+        return None
+    if b'\\' in line:
+        key = _SERIES_END_RE.match(line).group(0)
+        rest = line[len(key) + 1:]
+    else:
+        key, _, rest = line.partition(b' ')
+    if not rest:
+        return None
+
+    # Timestamp = trailing token, only if it is an integer (strings may hold spaces)
+    ts = None
+    head, sep, tail = rest.rpartition(b' ')
+    if sep and tail and (tail.isdigit() or (tail[0] == 0x2d and tail[1:].isdigit())):
+        rest, ts = head, int(tail)
+    return key, rest, ts
+
+def parse_series_key(key):
+    """b'meas,tag=a,tag2=b' -> ('meas', {'tag': 'a', 'tag2': 'b'})"""
+    if b'\\' not in key:
+        parts = key.split(b',')
+        tags = {}
+        for p in parts[1:]:
+            k, _, v = p.partition(b'=')
+            tags[name_of(k)] = v.decode('utf-8', 'replace')
+        return name_of(parts[0]), tags
+
+    parts = _KEY_PART_RE.findall(key)
+    tags = {}
+    for p in parts[1:]:
+        m = _TAG_RE.match(p)
+        if m:
+            tags[unescape(m.group(1))] = unescape(m.group(2))
+    return unescape(parts[0]), tags
+
+def parse_fields(field_set, keys=None):
+    """
+    b'a=1i,b="x, y",c=2.5' -> {'a': 1, 'b': 'x, y', 'c': 2.5}
+    keys: optional set of field names; other fields are not decoded.
+    """
+    out = {}
+    if b'\\' in field_set:
+        pairs = _FIELD_RE.findall(field_set)
+    elif b'"' in field_set:
+        pairs = _FIELD_PLAIN_RE.findall(field_set)
+    else:
+        pairs = [kv.partition(b'=')[::2] for kv in field_set.split(b',')]
+    names = _NAMES
+    for k, v in pairs:
+        k = names.get(k) or name_of(k)
+        if keys is None or k in keys:
+            out[k] = decode_value(v)
+    return out
+
+def parse_line(line):
+    """Full decode of one line: (measurement, tags, fields, timestamp) or None."""
+    parts = split_line(line)
+    if parts is None:
+        return None
+    key, field_set, ts = parts
+    measurement, tags = parse_series_key(key)
+    return measurement, tags, parse_fields(field_set), ts
+
+def to_ns(ts):
+    """Dumps are in ns; second-precision timestamps (<= 10 digits) are scaled up."""
+    return ts * 1_000_000_000 if ts is not None and -10**11 < ts < 10**11 else ts
+
+def to_ns_array(ts):
+    ts = ts.copy()
+    short = np.abs(ts) < 10**11
+    ts[short] *= 1_000_000_000
+    return ts
+
+def date_bounds_ns(start_date, end_date):
+    """Local-time [start_date 00:00, end_date+1 00:00) as ns integers (dates 'YYYY-MM-DD')."""
+    start = datetime.datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.datetime.strptime(end_date, '%Y-%m-%d') + datetime.timedelta(days=1)
+    return int(time.mktime(start.timetuple())) * 10**9, int(time.mktime(end.timetuple())) * 10**9
+
+class DateCache:
+    """ns timestamp -> local 'YYYY-MM-DD', computed once per 15 min bucket."""
+
+    def __init__(self, fmt='%Y-%m-%d'):
+        self.fmt = fmt
+        self.cache = {}
+
+    def date(self, ts_ns):
+        bucket = ts_ns // DATE_BUCKET_NS
+        d = self.cache.get(bucket)
+        if d is None:
+            d = datetime.datetime.fromtimestamp(bucket * (DATE_BUCKET_NS // 10**9)).strftime(self.fmt)
+            self.cache[bucket] = d
+        return d
+
+def decode_column(raw):
+    """
+    Typed column from raw value bytes. InfluxDB keeps one type per field, so
+    the type is taken from the first value and converted in one pass; values
+    of another type (e.g. a field retyped between shards) fall back to
+    decode_value().
+    """
+    sample = next((v for v in raw if v is not None), None)
+    if sample is None:
+        return raw
+    try:
+        if sample[:1] == b'"':
+            return [unescape(v[1:-1]) if v and v[0] == 0x22 else decode_value(v) for v in raw]
+        if sample[-1:] in (b'i', b'u'):
+            return [int(v[:-1]) if v and v[-1] in b'iu' else decode_value(v) for v in raw]
+        if sample[:1] not in (b't', b'T', b'f', b'F'):
+            return [float(v) if v is not None else None for v in raw]
+    except ValueError:
+        pass
+    return [decode_value(v) if v is not None else None for v in raw]
+
+class ColumnChunk:
+    """
+    Rows of one measurement as columns. Missing values are None.
+    Field sets are buffered raw and decoded column by column in close().
+    """
+
+    def __init__(self, measurement, keys=None):
+        self.measurement = measurement
+        self.keys = keys
+        self.time = []
+        self.columns = {}
+        self._tags = []
+        self._fields = []
+
+    def append(self, ts, tags, field_set):
+        self.time.append(ts)
+        self._tags.append(tags)
+        self._fields.append(field_set)
+
+    def close(self):
+        """Decodes the buffered rows into columns (tags and fields; fields win on name clash)."""
+        keys = self.keys
+        columns = {}
+        tag_names = dict.fromkeys(itertools.chain.from_iterable(self._tags))
+        for name in tag_names:
+            if keys is None or name in keys:
+                columns[name] = [t.get(name) for t in self._tags]
+
+        plain = _FIELD_PLAIN_RE.findall
+        rows = [dict(plain(fs)) if b'\\' not in fs else dict(_FIELD_RE.findall(fs)) for fs in self._fields]
+        for raw_name in dict.fromkeys(itertools.chain.from_iterable(rows)):
+            name = name_of(raw_name)
+            if keys is None or name in keys:
+                columns[name] = decode_column([r.get(raw_name) for r in rows])
+
+        self.columns = columns
+        self._tags = []
+        self._fields = []
+        return self
+
+    def rows(self, names):
+        """Row tuples for the given column names (None where absent)."""
+        n = len(self.time)
+        cols = [self.time if name == 'time' else self.columns.get(name, [None] * n) for name in names]
+        return zip(*cols)
+
+    def __len__(self):
+        return len(self.time)
+
+# ================= Block Pre-Filter (numpy) =================
+
+def _next_at(positions, at, default):
+    """First entry of sorted 'positions' >= each 'at' (default if none)."""
+    positions = np.append(positions, default)
+    return positions[np.searchsorted(positions, at)]
+
+def scan_block(buf):
+    """
+    Vectorized pass over a block of whole lines (bytes ending in '\\n').
+    Returns (starts, ends, measurement, ts, fast):
+      starts/ends - line byte offsets (end = index of the '\\n')
+      measurement - escaped measurement name per line ('S' array)
+      ts          - trailing integer timestamp (int64, as written)
+      fast        - False where the vector path cannot vouch for the line
+                    (escapes in the name, comments, no/odd timestamp, '\\r\\n');
+                    those lines go through split_line() instead.
+    """
+    arr = np.frombuffer(buf, dtype=np.uint8)
+    size = len(arr)
+    ends = np.flatnonzero(arr == 0x0A)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    spaces = np.flatnonzero(arr == 0x20)
+
+    # Measurement: bytes up to the first ',' or ' '
+    name_end = np.minimum(_next_at(spaces, starts, size), _next_at(np.flatnonzero(arr == 0x2C), starts, size))
+    name_len = name_end - starts
+    fast = (name_end < ends) & (name_len > 0) & (name_len <= NAME_BYTES)
+    fast &= arr[np.minimum(starts, size - 1)] != 0x23        # '#' comment
+    fast &= _next_at(np.flatnonzero(arr == 0x5C), starts, size) > name_end
+
+    width = int(name_len[fast].max()) if fast.any() else 1
+    cols = np.arange(width)
+    head = arr[np.minimum(starts[:, None] + cols, size - 1)].copy()
+    head[cols >= name_len[:, None]] = 0
+    measurement = np.ascontiguousarray(head).view(f'S{width}').ravel()
+
+    # Timestamp: digits between the last space and the newline
+    pos = np.searchsorted(spaces, ends) - 1
+    last_space = spaces[np.maximum(pos, 0)] if len(spaces) else np.zeros_like(ends)
+    n_digits = ends - last_space - 1
+    fast &= (pos >= 0) & (last_space > name_end) & (n_digits > 0) & (n_digits < TS_BYTES)
+    cols = np.arange(TS_BYTES - 1)
+    tail = arr[np.maximum(ends[:, None] - (TS_BYTES - 1) + cols, 0)].astype(np.int64) - 0x30
+    use = cols >= (TS_BYTES - 1) - n_digits[:, None]
+    fast &= ~(use & ((tail < 0) | (tail > 9))).any(axis=1)
+    ts = (tail * use) @ _POW10
+    return starts, ends, measurement, ts, fast
+
+# ================= Sharding =================
+
+def shard_ranges(path, shards):
+    """
+    Splits the file into up to 'shards' (start, end) byte ranges. Every
+    boundary sits just after a newline, so each line belongs to exactly one
+    range. Tiny files give fewer ranges.
+    """
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as f:
+        for k in range(1, shards):
+            f.seek(size * k // shards)
+            f.readline()
+            pos = f.tell()
+            if bounds[-1] < pos < size:
+                bounds.append(pos)
+    bounds.append(size)
+    return [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+def shard_count(workers):
+    """Shards to cut for a pool of 'workers' processes (1 = no sharding)."""
+    return workers * SHARDS_PER_WORKER if workers > 1 else 1
+
+def map_shards(worker, path, ranges, workers, *args):
+    """
+    Runs worker(path, byte_range, *args) for every range on a process pool
+    and returns the results in file order. workers <= 1 runs in-process.
+    The worker must be a module-level function (it is pickled).
+    """
+    if workers <= 1:
+        return [worker(path, r, *args) for r in ranges]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(worker, path, r, *args) for r in ranges]
+        return [f.result() for f in futures]
+
+# ================= Reader =================
+
+class LineProtocolReader:
+    """
+    Streams an .lp file with pre-filters.
+      measurements: names to keep (None = all)
+      start_ns / end_ns: keep start_ns <= ts < end_ns (lines without a timestamp are dropped)
+      keys: tag/field names to decode (None = all)
+      byte_range: (start, end) offsets from shard_ranges() (None = whole file)
+    Lines are rejected on a bytes prefix test (measurement) and an int()
+    of the trailing token (time) before anything is split or decoded.
+    counts() runs scan_block() on whole blocks instead.
+    Counters after a pass: lines, matched.
+    """
+
+    def __init__(self, path, measurements=None, start_ns=None, end_ns=None, keys=None,
+                 chunk_rows=CHUNK_ROWS, byte_range=None):
+        self.path = path
+        self.byte_range = byte_range
+        self.start_ns = start_ns
+        self.end_ns = end_ns
+        self.keys = set(keys) if keys is not None else None
+        self.chunk_rows = chunk_rows
+        self.names = None
+        self.prefixes = None
+        if measurements is not None:
+            names = [escape_measurement(m) for m in measurements]
+            self.names = np.array(names, dtype=f'S{NAME_BYTES}')
+            self.prefixes = tuple(n + b',' for n in names) + tuple(n + b' ' for n in names)
+        self.lines = 0
+        self.matched = 0
+
+    def _blocks(self):
+        """Blocks of whole lines (each ends with '\\n') within byte_range."""
+        start, end = self.byte_range or (0, None)
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            left = end - start if end is not None else None
+            rest = b''
+            while True:
+                data = f.read(BLOCK_BYTES if left is None else min(BLOCK_BYTES, left))
+                if not data:
+                    break
+                if left is not None:
+                    left -= len(data)
+                data = rest + data
+                cut = data.rfind(b'\n') + 1
+                if cut == 0:
+                    rest = data
+                    continue
+                rest = data[cut:]
+                yield data[:cut]
+            if rest:
+                yield rest + b'\n'
+
+    def _in_range(self, ts):
+        if ts is None:
+            return self.start_ns is None and self.end_ns is None
+        ts = to_ns(ts)
+        if self.start_ns is not None and ts < self.start_ns:
+            return False
+        if self.end_ns is not None and ts >= self.end_ns:
+            return False
+        return True
+
+    def _keep(self, measurement, ts):
+        """Vectorized pre-filter for the fast lines of a block."""
+        keep = np.ones(len(ts), dtype=bool)
+        if self.names is not None:
+            keep &= np.isin(measurement, self.names)
+        if self.start_ns is not None or self.end_ns is not None:
+            ts_ns = to_ns_array(ts)
+            if self.start_ns is not None:
+                keep &= ts_ns >= self.start_ns
+            if self.end_ns is not None:
+                keep &= ts_ns < self.end_ns
+        return keep
+
+    def _split(self):
+        """(series_key, field_set, ts_ns) for lines passing both pre-filters, in file order."""
+        prefixes = self.prefixes
+        start_ns, end_ns = self.start_ns, self.end_ns
+        timed = start_ns is not None or end_ns is not None
+        for block in self._blocks():
+            lines = block.split(b'\n')
+            lines.pop()
+            self.lines += len(lines)
+            for line in lines:
+                if prefixes is not None and not line.startswith(prefixes):
+                    continue
+                if timed:
+                    # Trailing token only; lines where it is not an integer take the full path
+                    try:
+                        ts = to_ns(int(line[line.rfind(b' ') + 1:]))
+                        if (start_ns is not None and ts < start_ns) or (end_ns is not None and ts >= end_ns):
+                            continue
+                    except ValueError:
+                        pass
+                parts = split_line(line)
+                if parts is None or (timed and not self._in_range(parts[2])):
+                    continue
+                self.matched += 1
+                yield parts[0], parts[1], to_ns(parts[2])
+
+    def counts(self, bucket_ns, progress=None):
+        """
+        Counter {(measurement, ts_ns // bucket_ns): lines} without decoding
+        any tags or fields. progress(lines) is called after every block.
+        """
+        totals = collections.Counter()
+        for buf in self._blocks():
+            starts, ends, measurement, ts, fast = scan_block(buf)
+            self.lines += len(ends)
+            keep = fast & self._keep(measurement, ts)
+            if keep.any():
+                ts_ns = to_ns_array(ts[keep])
+                names, name_idx = np.unique(measurement[keep], return_inverse=True)
+                buckets = ts_ns // bucket_ns
+                b0 = int(buckets.min())
+                width = int(buckets.max()) - b0 + 1
+                combined = name_idx.astype(np.int64) * width + (buckets - b0)
+                uniq, n = np.unique(combined, return_counts=True)
+                for c, k in zip(uniq.tolist(), n.tolist()):
+                    totals[(name_of(names[c // width]), b0 + c % width)] += k
+                self.matched += int(keep.sum())
+
+            # Lines the vector path could not vouch for
+            for i in np.flatnonzero(~fast).tolist():
+                parts = split_line(buf[starts[i]:ends[i]])
+                if parts is None or parts[2] is None or not self._in_range(parts[2]):
+                    continue
+                measurement_i, _ = parse_series_key(parts[0])
+                if self.names is not None and escape_measurement(measurement_i) not in self.names.tolist():
+                    continue
+                totals[(measurement_i, to_ns(parts[2]) // bucket_ns)] += 1
+                self.matched += 1
+            if progress:
+                progress(self.lines)
+        return totals
+
+    def records(self):
+        """(measurement, tags, fields, ts_ns) for every matching line."""
+        keys = self.keys
+        for key, field_set, ts in self._split():
+            measurement, tags = parse_series_key(key)
+            if keys is not None:
+                tags = {k: v for k, v in tags.items() if k in keys}
+            yield measurement, tags, parse_fields(field_set, keys), ts
+
+    def chunks(self):
+        """
+        ColumnChunk batches per measurement. Series keys are parsed once per
+        distinct series; field values are decoded per column.
+        """
+        buffers = {}
+        series = {}
+        for key, field_set, ts in self._split():
+            parsed = series.get(key)
+            if parsed is None:
+                parsed = series[key] = parse_series_key(key)
+            measurement, tags = parsed
+            chunk = buffers.get(measurement)
+            if chunk is None:
+                chunk = buffers[measurement] = ColumnChunk(measurement, self.keys)
+            chunk.append(ts, tags, field_set)
+            if len(chunk) >= self.chunk_rows:
+                yield chunk.close()
+                buffers[measurement] = ColumnChunk(measurement, self.keys)
+        for chunk in buffers.values():
+            if len(chunk):
+                yield chunk.close()
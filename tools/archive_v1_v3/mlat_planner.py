@@ -1,7 +1,14 @@
 import folium
 from folium import plugins
+import argparse
+import hashlib
 import math
 import os
+import time
+
+import numpy as np
+
+from mlat_solver import lla_to_ecef, dop, GDOP_MAX
 
 # ==========================================
 # 1. CONFIGURATION: EDIT YOUR NODES HERE
@@ -9,14 +16,21 @@ import os
 target_name = "Helsinki-Vantaa (HEL)"
 target_coords = [60.3172, 24.9633]
 
-# The "Core 4" Receivers (West -> North -> East -> South)
+# The "Core 4" Receivers (West -> North -> East -> South), antenna altitude AMSL (m)
 receivers = [
-    {"id": "RX1", "name": "Jorvas (West)",    "coords": [60.1304, 24.5106], "color": "#e74c3c"}, 
-    {"id": "RX2", "name": "Keimola (North)",  "coords": [60.3196, 24.8295], "color": "#3498db"}, 
-    {"id": "RX3", "name": "Sipoo (East)",     "coords": [60.3760, 25.2710], "color": "#2ecc71"},
-    {"id": "RX4", "name": "Eira (South)",     "coords": [60.1573, 24.9412], "color": "#2c3e50"},
+    {"id": "RX1", "name": "Jorvas (West)",    "coords": [60.1304, 24.5106], "alt": 30.0,  "color": "#e74c3c"}, 
+    {"id": "RX2", "name": "Keimola (North)",  "coords": [60.3196, 24.8295], "alt": 130.0, "color": "#3498db"}, 
+    {"id": "RX3", "name": "Sipoo (East)",     "coords": [60.3760, 25.2710], "alt": 60.0,  "color": "#2ecc71"},
+    {"id": "RX4", "name": "Eira (South)",     "coords": [60.1573, 24.9412], "alt": 25.0,  "color": "#2c3e50"},
 ]
 
+# Site-selection what-ifs, drawn next to the Core 4 (edit freely, or use --move / --add)
+what_ifs = {
+    "Eira -> Suomenlinna": {"move": {"RX4": [60.1454, 24.9881, 20.0]}},
+    "Core 4 + Kerava":     {"add": [{"id": "RX5", "name": "Kerava (North-East)", "coords": [60.4035, 25.1050],
+                                     "alt": 40.0, "color": "#9b59b6"}]},
+}
+
 # ==========================================
 # 2. GEOMETRY ENGINE
 # ==========================================
@@ -31,9 +45,78 @@ def get_dist(c1, c2):
     return round(R * c, 2)
 
 # ==========================================
-# 3. MAP GENERATION
+# 3. GDOP COVERAGE ENGINE
+# ==========================================
+GRID_BOUNDS = ((59.90, 24.20), (60.60, 25.70))  # (south, west), (north, east)
+GRID_SHAPE = (140, 160)                         # lat x lon cells (~0.5 km)
+ALTITUDES_M = [1000.0, 3000.0, 10000.0]         # Approach, climb-out, cruise
+CACHE_DIR = os.path.expanduser("~/.cache/mlat_planner")
+
+# GDOP colour ramp (green = good geometry); cells above GDOP_MAX are greyed out
+GDOP_STOPS = [(1.0, (39, 174, 96)), (3.0, (46, 204, 113)), (6.0, (241, 196, 15)),
+              (10.0, (230, 126, 34)), (GDOP_MAX, (231, 76, 60))]
+
+_grid_cache = {}
+
+def apply_what_if(base, move=None, add=None):
+    """Copy of a receiver list with some nodes moved ({id: [lat, lon, alt]}) and/or added."""
+    out = []
+    for rx in base:
+        rx = dict(rx)
+        if move and rx["id"] in move:
+            lat, lon, alt = move[rx["id"]]
+            rx["coords"], rx["alt"] = [lat, lon], alt
+        out.append(rx)
+    return out + [dict(rx) for rx in (add or [])]
+
+def gdop_grid(rx_list, altitudes=None, bounds=GRID_BOUNDS, shape=GRID_SHAPE):
+    """
+    GDOP raster (len(altitudes), lat, lon) for a receiver set: every cell of
+    every altitude in one vectorized mlat_solver.dop() call. Cached by
+    receiver positions + grid, in memory and as .npy in CACHE_DIR (order
+    of the receivers does not matter, GDOP does not depend on the reference).
+    """
+    altitudes = ALTITUDES_M if altitudes is None else altitudes
+    sites = tuple(sorted((round(r["coords"][0], 5), round(r["coords"][1], 5), round(r["alt"], 1)) for r in rx_list))
+    key = (sites, tuple(altitudes), bounds, shape)
+    if key in _grid_cache:
+        return _grid_cache[key]
+
+    path = os.path.join(CACHE_DIR, hashlib.sha1(repr(key).encode()).hexdigest()[:16] + ".npy")
+    if os.path.exists(path):
+        grid = np.load(path)
+    else:
+        (south, west), (north, east) = bounds
+        alt, lat, lon = np.meshgrid(altitudes, np.linspace(south, north, shape[0]),
+                                    np.linspace(west, east, shape[1]), indexing="ij")
+        rx_ecef = lla_to_ecef(*np.array(sites).T)
+        gdop, _, _ = dop(lla_to_ecef(lat.ravel(), lon.ravel(), alt.ravel()), rx_ecef)
+        grid = np.where(np.isfinite(gdop), gdop, np.inf).reshape(alt.shape)
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        np.save(path, grid)
+    _grid_cache[key] = grid
+    return grid
+
+def gdop_image(layer):
+    """(lat, lon) GDOP -> RGBA image, north up."""
+    values = np.minimum(layer, GDOP_MAX)
+    stops = [s[0] for s in GDOP_STOPS]
+    rgba = np.empty(layer.shape + (4,), dtype=np.uint8)
+    for ch in range(3):
+        rgba[..., ch] = np.interp(values, stops, [s[1][ch] for s in GDOP_STOPS])
+    rgba[..., 3] = 150
+    bad = layer > GDOP_MAX
+    rgba[bad] = (127, 140, 141, 60)
+    return rgba[::-1]
+
+def coverage(layer, limit=GDOP_MAX):
+    """Share of the grid (%) with GDOP <= limit (default: what mlat-verifier trusts)."""
+    return 100.0 * np.mean(layer <= limit)
+
+# ==========================================
+# 4. MAP GENERATION
 # ==========================================
-def generate_map():
+def generate_map(scenarios):
     print(f"Generating Network Map for {target_name}...")
     
     m = folium.Map(
@@ -85,6 +168,39 @@ def generate_map():
         
         link_html += f"<div style='display:flex; justify-content:space-between; font-size:0.8em; border-bottom:1px solid #eee;'><span>{r1['id']} ↔ {r2['id']}</span><b>{dist}km</b></div>"
 
+    # GDOP heatmaps: one toggleable layer per scenario and altitude
+    (south, west), (north, east) = GRID_BOUNDS
+    coverage_html = ""
+    core = {rx["id"]: rx["coords"] for rx in receivers}
+    for i, (name, rx_list) in enumerate(scenarios.items()):
+        start = time.perf_counter()
+        grid = gdop_grid(rx_list)
+        print(f"   GDOP grid '{name}': {len(rx_list)} receivers, {grid.size} cells in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        for k, alt in enumerate(ALTITUDES_M):
+            folium.raster_layers.ImageOverlay(
+                image=gdop_image(grid[k]),
+                bounds=[[south, west], [north, east]],
+                mercator_project=True,
+                name=f"GDOP {name} @ {alt:.0f} m",
+                overlay=True,
+                show=(i == 0 and k == len(ALTITUDES_M) - 1)
+            ).add_to(m)
+
+        # Nodes that are not part of the Core 4
+        for rx in rx_list:
+            if core.get(rx["id"]) != rx["coords"]:
+                folium.CircleMarker(
+                    location=rx["coords"], radius=7, color=rx["color"], fill=True,
+                    tooltip=f"<b>{rx['id']}</b> ({name}): {rx['name']}"
+                ).add_to(m)
+
+        cells = " / ".join(f"{coverage(grid[k]):.0f}%" for k in range(len(ALTITUDES_M)))
+        coverage_html += f"<div style='display:flex; justify-content:space-between; font-size:0.8em; border-bottom:1px solid #eee;'><span>{name}</span><b>{cells}</b></div>"
+
+    folium.LayerControl(collapsed=False).add_to(m)
+    alts = " / ".join(f"{a / 1000:g} km" for a in ALTITUDES_M)
+
     # Inject Dashboard
     custom_html = f"""
     <style>
@@ -99,6 +215,10 @@ rgba(0,0,0,0.1); }}
             4 synchronized nodes surrounding the target enable full 3D position verification.
         </div>
         {link_html}
+        <div style="font-size: 0.8em; color: #555; margin: 10px 0 4px 0;">
+            <b>GDOP &le; {GDOP_MAX:g} coverage</b> ({alts}):
+        </div>
+        {coverage_html}
     </div>
     """
     m.get_root().html.add_child(folium.Element(custom_html))
@@ -108,5 +228,32 @@ rgba(0,0,0,0.1); }}
     m.save(filename)
     print(f"✅ Success! Map saved to: {os.path.abspath(filename)}")
 
+def parse_site(spec):
+    """'RX4=60.1454,24.9881,20' -> ('RX4', [60.1454, 24.9881, 20.0])"""
+    rx_id, coords = spec.split("=", 1)
+    lat, lon, alt = (float(v) for v in coords.split(","))
+    return rx_id.strip(), [lat, lon, alt]
+
+def build_scenarios(args):
+    scenarios = {"Core 4": receivers}
+    for name, change in what_ifs.items():
+        scenarios[name] = apply_what_if(receivers, **change)
+
+    if args.move or args.add:
+        move = dict(parse_site(s) for s in args.move)
+        add = [{"id": rx_id, "name": f"{rx_id} (candidate)", "coords": [lat, lon], "alt": alt, "color": "#8e44ad"}
+               for rx_id, (lat, lon, alt) in (parse_site(s) for s in args.add)]
+        scenarios["What-if"] = apply_what_if(receivers, move=move, add=add)
+    return scenarios
+
 if __name__ == "__main__":
-    generate_map()
+    parser = argparse.ArgumentParser(description="MLAT network map with GDOP coverage layers")
+    parser.add_argument("--move", action="append", default=[], metavar="RX4=LAT,LON,ALT",
+                        help="Move an existing node (repeatable)")
+    parser.add_argument("--add", action="append", default=[], metavar="RX5=LAT,LON,ALT",
+                        help="Add a candidate node (repeatable)")
+    parser.add_argument("--alt", help="Altitudes in m, comma separated (default: %(default)s)",
+                        default=",".join(f"{a:g}" for a in ALTITUDES_M))
+    args = parser.parse_args()
+    ALTITUDES_M = [float(a) for a in args.alt.split(",")]
+    generate_map(build_scenarios(args))
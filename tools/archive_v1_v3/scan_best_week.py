@@ -5,56 +5,54 @@ Script: scan_best_week.py
 Description: Scans a massive InfluxDB Line Protocol (.lp) dump line-by-line.
              Aggregates record counts per Day + Table to find the 'Golden Week'
              for AI training.
+             Only the measurement name and timestamp of each line are read
+             (lp_parser counts(), vectorized, no field decoding); lines are
+             counted per 15-minute bucket and buckets are mapped to dates
+             at the end.
+             With --workers N the file is split into newline-aligned byte
+             ranges counted on a process pool; the per-shard counters are
+             summed.
 """
 
+import os
 import sys
-import datetime
+import argparse
 import collections
 
+from lp_parser import LineProtocolReader, DateCache, DATE_BUCKET_NS, shard_ranges, shard_count, map_shards
+
 # Update this filename to match your exact .lp file path
 INPUT_FILE = 'central_brain_full_dump.lp'
 
+def count_shard(path, byte_range):
+    """Worker: (measurement, bucket) counts of one byte range."""
+    return LineProtocolReader(path, byte_range=byte_range).counts(DATE_BUCKET_NS)
+
 def main():
-    print(f"[INFO] Scanning {INPUT_FILE}... this may take a minute.")
+    parser = argparse.ArgumentParser(description="Records per day and table in the raw .lp dump")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes (byte-range shards of the dump); 1 = single process")
+    args = parser.parse_args()
+
+    print(f"[INFO] Scanning {INPUT_FILE} with {args.workers} worker(s)... this may take a minute.")
     
     # Structure: stats[date_string][table_name] = count
     stats = collections.defaultdict(lambda: collections.defaultdict(int))
-    total_lines = 0
+    buckets = collections.Counter()
     
     try:
-        with open(INPUT_FILE, 'r', encoding='utf-8') as f:
-            for line in f:
-                total_lines += 1
-                if total_lines % 500000 == 0:
-                    print(f"  > Processed {total_lines // 1000000}M lines...", end='\r')
-
-                parts = line.split(' ')
-                if len(parts) < 3:
-                    continue
-                
-                # Influx LP format: measurement tagset fieldset timestamp
-                # Timestamp is the last part
-                measurement = parts[0].replace(',', ' ').split(' ')[0] # Handle cases with/without tags
-                timestamp_str = parts[-1].strip()
-                
-                try:
-                    # Influx timestamps are usually nanoseconds (19 digits)
-                    # Convert to seconds
-                    ts_val = int(timestamp_str)
-                    if len(timestamp_str) > 10: 
-                        ts_val = ts_val // 1_000_000_000
-                    
-                    dt = datetime.datetime.fromtimestamp(ts_val)
-                    date_key = dt.strftime('%Y-%m-%d')
-                    
-                    stats[date_key][measurement] += 1
-                except:
-                    continue
+        ranges = shard_ranges(INPUT_FILE, shard_count(args.workers))
+        for shard in map_shards(count_shard, INPUT_FILE, ranges, args.workers):
+            buckets.update(shard)
 
     except FileNotFoundError:
         print(f"[ERROR] File {INPUT_FILE} not found. Check the name.")
         sys.exit(1)
 
+    dates = DateCache()
+    for (measurement, bucket), count in buckets.items():
+        stats[dates.date(bucket * DATE_BUCKET_NS)][measurement] += count
+
     print("\n\n" + "="*80)
     print(f"DATA HEATMAP (Records per Day)")
     print("="*80)
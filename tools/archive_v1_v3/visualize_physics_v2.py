@@ -10,66 +10,23 @@ Description: Generates a Physics Distribution Plot (Speed vs Altitude)
              - alt_geom -> alt_baro_ft (Barometric Altitude)
              - ver_rate -> v_rate_fpm (Vertical Rate)
 
-Version: 2.0.0
+             Parsing via lp_parser.py: only 'local_aircraft_state' lines of
+             TARGET_DATE are decoded, and only the four fields below.
+
+Version: 2.1.0
 Author: RW
-Date: 2025-12-18
+Date: 2026-10-16
 """
 
 import sys
-import datetime
 import matplotlib.pyplot as plt
-import re
+
+from lp_parser import LineProtocolReader, date_bounds_ns
 
 # ================= Configuration =================
 INPUT_FILE = 'central_brain_full_dump.lp'
 TARGET_DATE = '2025-11-30'
-
-def parse_physics_data(line):
-    """
-    Extracts Speed, Altitude, and Vertical Rate using the VALIDATED schema.
-    Handles 'i' integer suffixes from InfluxDB Line Protocol.
-    """
-    try:
-        parts = line.strip().split(' ')
-        if len(parts) < 3: return None
-        
-        measurement = parts[0]
-        if measurement != 'local_aircraft_state': return None
-
-        # Parse Timestamp
-        ts_str = parts[-1]
-        ts_val = int(ts_str)
-        if len(ts_str) > 10: ts_val = ts_val // 1_000_000_000
-        dt = datetime.datetime.fromtimestamp(ts_val)
-        date_str = dt.strftime('%Y-%m-%d')
-        
-        if date_str != TARGET_DATE: return None
-
-        # Regex Extraction (Updated for actual schema)
-        # Matches numbers like: 192.3, 179i, -576i
-        
-        # gs_knots (Ground Speed)
-        speed_match = re.search(r'gs_knots=([0-9\.-]+)(i?)', line)
-        
-        # alt_baro_ft (Altitude)
-        alt_match = re.search(r'alt_baro_ft=([0-9\.-]+)(i?)', line)
-        
-        # v_rate_fpm (Vertical Rate)
-        vr_match = re.search(r'v_rate_fpm=([0-9\.-]+)(i?)', line)
-        
-        # icao24
-        icao_match = re.search(r'icao24="?([a-zA-Z0-9]+)"?', line)
-
-        if speed_match and alt_match and icao_match:
-            return {
-                'vel': float(speed_match.group(1)),
-                'alt': float(alt_match.group(1)),
-                'v_rate': float(vr_match.group(1)) if vr_match else 0.0,
-                'icao': icao_match.group(1)
-            }
-    except Exception:
-        pass
-    return None
+KEYS = ['gs_knots', 'alt_baro_ft', 'v_rate_fpm', 'icao24']
 
 def main():
     print(f"[INFO] Mining Physics Data for {TARGET_DATE}...")
@@ -78,21 +35,20 @@ def main():
     altitudes = []
     climb_rates = []
     
-    line_count = 0
+    start_ns, end_ns = date_bounds_ns(TARGET_DATE, TARGET_DATE)
+    reader = LineProtocolReader(INPUT_FILE, measurements=['local_aircraft_state'],
+                                start_ns=start_ns, end_ns=end_ns, keys=KEYS)
     try:
-        with open(INPUT_FILE, 'r', encoding='utf-8') as f:
-            for line in f:
-                line_count += 1
-                if line_count % 500000 == 0:
-                    print(f"  > Scanned {line_count // 1000000}M lines...", end='\r')
-                
-                data = parse_physics_data(line)
-                if data:
-                    # Filter out ground noise (stopped planes or bad data)
-                    if data['vel'] > 10 or data['alt'] > 100:
-                        velocities.append(data['vel'])
-                        altitudes.append(data['alt'])
-                        climb_rates.append(data['v_rate'])
+        for chunk in reader.chunks():
+            print(f"  > Scanned {reader.lines // 1000000}M lines...", end='\r')
+            for vel, alt, v_rate, icao in chunk.rows(KEYS):
+                if vel is None or alt is None or icao is None:
+                    continue
+                # Filter out ground noise (stopped planes or bad data)
+                if vel > 10 or alt > 100:
+                    velocities.append(float(vel))
+                    altitudes.append(float(alt))
+                    climb_rates.append(float(v_rate) if v_rate is not None else 0.0)
                         
     except FileNotFoundError:
         print(f"[ERROR] File {INPUT_FILE} not found.")
@@ -1,11 +1,21 @@
 import requests
 import time
 import sys
+from collections import deque
+import numpy as np
 
 # ==============================================================================
 # Script: live_labeler.py
 # Purpose: Auto-labels data for AI (e.g., "TAKEOFF", "LANDING", "HOLDING")
 # Logic: Analyzes Physics (Vertical Rate + Altitude + Turn Rate)
+#        Rules are evaluated on whole columns (classify_batch), one pass per
+#        refresh instead of one Python call per aircraft.
+#        Every raw sample since the previous refresh is pushed into a
+#        per-aircraft sliding window. Windows keep running aggregates
+#        (net/absolute heading change, min/max altitude via monotonic deques),
+#        so a new sample costs O(1) amortized and nothing is recomputed.
+#        History-aware labels (TURNING, ORBIT, HOLDING, GO-AROUND) override
+#        the single-point rules.
 # ==============================================================================
 
 INFLUX_HOST = "http://192.168.1.134:8086"
@@ -17,62 +27,217 @@ CLIMB_RATE = 500        # fpm
 DESCENT_RATE = -500     # fpm
 TURN_THRESHOLD = 3.0    # degrees per second (Standard Rate Turn)
 
-def get_active_flights():
-    """Fetches the last minute of physics data."""
-    q = 'SELECT last("alt_baro_ft"), last("vert_rate_fpm"), last("track"), last("gs_knots") FROM "local_aircraft_state" WHERE time > now() - 1m GROUP BY "icao24", "callsign"'
+# History (sliding windows)
+TURN_WINDOW_S = 20      # Window for the turn rate
+PATTERN_WINDOW_S = 480  # Window for orbit / holding (~2 holding laps)
+ORBIT_TURN_DEG = 360    # Net heading change for a full orbit
+HOLD_TURN_DEG = 540     # Net heading change for a holding pattern...
+HOLD_ALT_BAND = 500     # ...flown level (ft between min and max altitude)
+GO_AROUND_S = 120       # Climb this soon after a final approach = go-around
+MAX_GAP_S = 30          # Longer gap between samples resets the windows
+AIRCRAFT_TTL = 300      # Forget aircraft not seen for this long (s)
+DISPLAY_AGE_S = 60      # Only print aircraft seen recently
+
+def get_active_flights(since_ms=None):
+    """Fetches every physics sample newer than since_ms (first call: the last minute)."""
+    where = f'time > {since_ms}ms' if since_ms else 'time > now() - 1m'
+    q = f'SELECT "alt_baro_ft", "vert_rate_fpm", "track", "gs_knots" FROM "local_aircraft_state" WHERE {where} GROUP BY "icao24", "callsign"'
     try:
-        r = requests.get(f"{INFLUX_HOST}/query", params={'db': DB_NAME, 'q': q})
+        r = requests.get(f"{INFLUX_HOST}/query", params={'db': DB_NAME, 'q': q, 'epoch': 'ms'})
         return r.json()
     except:
         return None
 
+def classify_batch(alt, vs, speed):
+    """The 'Teacher' Logic - Rules to label the data (arrays in, labels out, first match wins)."""
+    alt = np.asarray(alt, dtype=float)
+    vs = np.asarray(vs, dtype=float)
+    speed = np.asarray(speed, dtype=float)
+    low = alt < LANDING_ALT
+    conditions = [
+        (speed < 50) & (alt < 100),
+        low & (vs < DESCENT_RATE),
+        low & (vs > CLIMB_RATE),
+        (alt > 30000) & (vs > -100) & (vs < 100),
+    ]
+    choices = ["TAXI / PARKED", "FINAL APPROACH", "TAKEOFF / GO-AROUND", "CRUISE"]
+    return np.select(conditions, choices, default="EN_ROUTE")
+
 def classify_maneuver(alt, vs, speed):
-    """The 'Teacher' Logic - Rules to label the data."""
-    if speed < 50 and alt < 100:
-        return "TAXI / PARKED"
-    
-    if alt < LANDING_ALT:
-        if vs < DESCENT_RATE:
-            return "FINAL APPROACH"
-        elif vs > CLIMB_RATE:
-            return "TAKEOFF / GO-AROUND"
-    
-    if alt > 30000 and -100 < vs < 100:
-        return "CRUISE"
-        
-    return "EN_ROUTE" # Default
+    return str(classify_batch([alt], [vs], [speed])[0])
+
+class SlidingWindow:
+    """
+    Time window of (ts, heading change, altitude) with running aggregates.
+    push() adds one sample and evicts expired ones; each sample enters and
+    leaves every structure once.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.samples = deque()
+        self.net_turn = 0.0     # Signed sum of heading changes (deg, + = right)
+        self.abs_turn = 0.0
+        self._min = deque()     # Monotonic (ts, alt): increasing alt
+        self._max = deque()     # Monotonic (ts, alt): decreasing alt
+
+    def push(self, ts, d_track, alt):
+        self.samples.append((ts, d_track))
+        self.net_turn += d_track
+        self.abs_turn += abs(d_track)
+        while self._min and self._min[-1][1] >= alt:
+            self._min.pop()
+        self._min.append((ts, alt))
+        while self._max and self._max[-1][1] <= alt:
+            self._max.pop()
+        self._max.append((ts, alt))
+
+        cutoff = ts - self.seconds
+        while self.samples and self.samples[0][0] < cutoff:
+            _, old = self.samples.popleft()
+            self.net_turn -= old
+            self.abs_turn -= abs(old)
+        while self._min[0][0] < cutoff:
+            self._min.popleft()
+        while self._max[0][0] < cutoff:
+            self._max.popleft()
+
+    def span(self):
+        return self.samples[-1][0] - self.samples[0][0] if len(self.samples) > 1 else 0.0
+
+    def turn_rate(self):
+        """Average signed turn rate over the window (deg/s)."""
+        span = self.span()
+        return self.net_turn / span if span > 0 else 0.0
+
+    def alt_band(self):
+        return self._max[0][1] - self._min[0][1] if self._min else 0.0
+
+    def clear(self):
+        self.samples.clear()
+        self._min.clear()
+        self._max.clear()
+        self.net_turn = self.abs_turn = 0.0
+
+class AircraftHistory:
+    """Latest physics plus the sliding windows of one aircraft."""
+
+    def __init__(self, icao, callsign):
+        self.icao = icao
+        self.callsign = callsign
+        self.ts = None
+        self.alt = None          # Unknown until the first row carrying an altitude
+        self.vs = self.speed = 0.0
+        self.track = None
+        self.last_final_ts = None
+        self.turn = SlidingWindow(TURN_WINDOW_S)
+        self.pattern = SlidingWindow(PATTERN_WINDOW_S)
+
+    def add(self, ts, alt, vs, track, speed):
+        """ts in seconds. Samples at or before the last one are ignored."""
+        if self.ts is not None and ts <= self.ts:
+            return
+        if self.ts is not None and ts - self.ts > MAX_GAP_S:
+            self.turn.clear()
+            self.pattern.clear()
+            self.track = None
+
+        d_track = 0.0
+        if track is not None and self.track is not None:
+            d_track = (track - self.track + 180.0) % 360.0 - 180.0
+        if track is not None:
+            self.track = track
+
+        self.ts = ts
+        # Rows may carry only some fields (delta writes): keep the last known value
+        if alt is not None:
+            self.alt = alt
+        if vs is not None:
+            self.vs = vs
+        if speed is not None:
+            self.speed = speed
+        if self.alt is None:
+            return
+        self.turn.push(ts, d_track, self.alt)
+        self.pattern.push(ts, d_track, self.alt)
+        if 100 <= self.alt < LANDING_ALT and self.vs < DESCENT_RATE:
+            self.last_final_ts = ts
+
+def ingest(fleet, data):
+    """Pushes all new samples into the fleet. Returns the newest timestamp (ms) seen."""
+    newest = None
+    for series in data['results'][0].get('series', []):
+        tags = series.get('tags', {})
+        icao = tags.get('icao24', 'N/A')
+        ac = fleet.get(icao)
+        if ac is None:
+            ac = fleet[icao] = AircraftHistory(icao, tags.get('callsign', 'N/A'))
+        if tags.get('callsign'):
+            ac.callsign = tags['callsign']
+        for t_ms, alt, vs, track, speed in series['values']:
+            ac.add(t_ms / 1000.0, alt, vs, track, speed)
+            if newest is None or t_ms > newest:
+                newest = t_ms
+    return newest
+
+def label_fleet(aircraft):
+    """Base rules for all aircraft at once, then the history-aware overrides."""
+    alt = np.array([a.alt for a in aircraft])
+    vs = np.array([a.vs for a in aircraft])
+    speed = np.array([a.speed for a in aircraft])
+    ts = np.array([a.ts for a in aircraft])
+    rate = np.array([a.turn.turn_rate() for a in aircraft])
+    net = np.abs([a.pattern.net_turn for a in aircraft])
+    band = np.array([a.pattern.alt_band() for a in aircraft])
+    since_final = np.array([ts_i - a.last_final_ts if a.last_final_ts is not None else np.inf
+                            for ts_i, a in zip(ts, aircraft)])
+
+    base = classify_batch(alt, vs, speed)
+    airborne = alt >= 100
+    conditions = [
+        base == "TAXI / PARKED",
+        airborne & (alt < LANDING_ALT) & (vs > CLIMB_RATE) & (since_final <= GO_AROUND_S),
+        airborne & (net >= HOLD_TURN_DEG) & (band <= HOLD_ALT_BAND),
+        airborne & (net >= ORBIT_TURN_DEG),
+        airborne & (np.abs(rate) >= TURN_THRESHOLD) & (base == "EN_ROUTE"),
+    ]
+    choices = ["TAXI / PARKED", "GO-AROUND", "HOLDING", "ORBIT", "TURNING"]
+    return np.select(conditions, choices, default=base), rate
 
 def main():
     print("--- 🏷️  LIVE AI DATA LABELER ---")
     print("Watching for flight maneuvers...")
-    
+
+    fleet = {}
+    watermark = None
+
     while True:
-        data = get_active_flights()
-        
+        data = get_active_flights(watermark)
+
         if data and 'results' in data and 'series' in data['results'][0]:
-            print("\n--- Current Airspace Activity ---")
-            for series in data['results'][0]['series']:
-                tags = series.get('tags', {})
-                vals = series['values'][0]
-                
-                # Extract Physics
-                callsign = tags.get('callsign', 'N/A')
-                icao = tags.get('icao24', 'N/A')
-                alt = vals[1] if vals[1] is not None else 0
-                vs = vals[2] if vals[2] is not None else 0
-                speed = vals[4] if vals[4] is not None else 0
-                
-                # Apply Logic
-                label = classify_maneuver(alt, vs, speed)
-                
-                # Visual Output
-                icon = "✈️"
-                if "LANDING" in label: icon = "🛬"
-                elif "TAKEOFF" in label: icon = "🛫"
-                elif "CRUISE" in label: icon = "⏩"
-                
-                print(f"{icon} {callsign:<8} | Alt: {alt:>5}ft | VS: {vs:>5}fpm | {label}")
-                
+            newest = ingest(fleet, data)
+            if newest is not None:
+                watermark = newest
+
+        if fleet:
+            now = max(a.ts for a in fleet.values())
+            for icao in [i for i, a in fleet.items() if now - a.ts > AIRCRAFT_TTL]:
+                del fleet[icao]
+
+            active = [a for a in fleet.values() if now - a.ts <= DISPLAY_AGE_S and a.alt is not None]
+            if active:
+                print("\n--- Current Airspace Activity ---")
+                labels, rates = label_fleet(active)
+                for a, label, rate in zip(active, labels.tolist(), rates):
+                    # Visual Output
+                    icon = "✈️"
+                    if "LANDING" in label or "FINAL" in label: icon = "🛬"
+                    elif "TAKEOFF" in label or "GO-AROUND" in label: icon = "🛫"
+                    elif "CRUISE" in label: icon = "⏩"
+                    elif label in ("HOLDING", "ORBIT", "TURNING"): icon = "🔄"
+
+                    print(f"{icon} {a.callsign:<8} | Alt: {int(a.alt):>5}ft | VS: {int(a.vs):>5}fpm | Turn: {rate:>5.1f}°/s | {label}")
+
         time.sleep(5)
 
 if __name__ == "__main__":
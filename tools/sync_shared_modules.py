@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+import os
+import sys
+import shutil
+import filecmp
+
+# ==============================================================================
+# Script: sync_shared_modules.py
+# Version: 1.0.0 (Shared Module Sync)
+# Description:
+#   Every service is its own Docker build context, so the shared modules
+#   (batched Influx writer, live state bus, Beast decoder, ...) live as
+#   copies next to each service. This script keeps them identical:
+#     python3 tools/sync_shared_modules.py          # master -> every copy
+#     python3 tools/sync_shared_modules.py --check  # exit 1 if a copy drifted
+#   Edit only the master copy, then run the sync. CI runs --check.
+#   A new service using a shared module is added to SHARED below.
+# ==============================================================================
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Master copy -> directories carrying an identical copy
+SHARED = {
+    "adsb-feeders/influx_writer.py": [
+        "spoof-detector", "physics-guard/src", "runway-tracker/src",
+        "trajectory-guard/src", "rf-battle-manager/src", "mlat-verifier/src",
+    ],
+    "adsb-feeders/aircraft_state.py": [
+        "spoof-detector", "physics-guard/src", "runway-tracker/src",
+        "trajectory-guard/src", "mlat-verifier/src",
+    ],
+    "adsb-feeders/beast_decoder.py": ["mlat-verifier/src"],
+    "adsb-feeders/node_poller.py": ["rf-battle-manager/src"],
+    "tools/archive_v1_v3/mlat_solver.py": ["mlat-verifier/src"],
+}
+
+def copies():
+    """Yields (master, copy) path pairs relative to the repo root."""
+    for master, dirs in SHARED.items():
+        for d in dirs:
+            yield master, f"{d}/{os.path.basename(master)}"
+
+def main():
+    check = "--check" in sys.argv[1:]
+    drifted = []
+    for master, copy in copies():
+        src, dst = os.path.join(ROOT, master), os.path.join(ROOT, copy)
+        if os.path.exists(dst) and filecmp.cmp(src, dst, shallow=False):
+            continue
+        drifted.append(copy)
+        if check:
+            print(f"❌ {copy} differs from {master}")
+        else:
+            shutil.copyfile(src, dst)
+            print(f"🔄 {master} -> {copy}")
+
+    if check:
+        if drifted:
+            print(f"{len(drifted)} shared module copies out of sync. Run: python3 tools/sync_shared_modules.py")
+            sys.exit(1)
+        print(f"✅ {sum(1 for _ in copies())} shared module copies in sync.")
+    elif not drifted:
+        print("✅ Nothing to sync.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import json
+import os
+
+import numpy as np
+
+try:
+    from tflite_runtime.interpreter import Interpreter
+except ImportError:  # Dev machines with full TensorFlow
+    import tensorflow as tf
+    Interpreter = tf.lite.Interpreter
+
+# ==============================================================================
+# Module: gru_engine.py
+# Version: 1.0.0 (TFLite Batch Inference)
+# Description:
+#   CPU inference for the trajectory GRU exported by
+#   ai-research/src/export_tflite.py (<model>.tflite + <model>.json).
+#   - One interpreter, XNNPACK on num_threads cores.
+#   - Batch dimension resized to power-of-two buckets (>= MIN_BATCH), so a
+#     changing aircraft count does not re-allocate tensors every cycle;
+#     the input buffer is padded up to the bucket.
+#   - Scaling uses the exported MinMaxScaler parameters (no sklearn).
+# ==============================================================================
+
+MIN_BATCH = 32
+
+
+class GruEngine:
+
+    def __init__(self, model_path, threads=4):
+        with open(os.path.splitext(model_path)[0] + ".json") as f:
+            self.meta = json.load(f)
+        self.features = self.meta["features"]
+        self.seq_len = self.meta["seq_len"]
+        self.horizon = self.meta.get("horizon", 1)
+        self.min_ = np.asarray(self.meta["scaler_min"], dtype=np.float32)
+        self.scale_ = np.asarray(self.meta["scaler_scale"], dtype=np.float32)
+
+        self.interpreter = Interpreter(model_path=model_path, num_threads=threads)
+        self.input_index = self.interpreter.get_input_details()[0]["index"]
+        self.output_index = self.interpreter.get_output_details()[0]["index"]
+        self.capacity = 0
+        self.buffer = None
+
+    def scale(self, raw):
+        return raw * self.scale_ + self.min_
+
+    def unscale(self, scaled):
+        return (scaled - self.min_) / self.scale_
+
+    def _reserve(self, n):
+        bucket = max(MIN_BATCH, 1 << (n - 1).bit_length())
+        if bucket != self.capacity:
+            shape = [bucket, self.seq_len, len(self.features)]
+            self.interpreter.resize_tensor_input(self.input_index, shape)
+            self.interpreter.allocate_tensors()
+            self.buffer = np.zeros(shape, dtype=np.float32)
+            self.capacity = bucket
+
+    def predict(self, windows):
+        """windows: (n, seq_len, features) scaled float32 -> (n, features) scaled predictions."""
+        n = len(windows)
+        if n == 0:
+            return np.zeros((0, len(self.features)), dtype=np.float32)
+        self._reserve(n)
+        self.buffer[:n] = windows
+        self.buffer[n:] = 0.0
+        self.interpreter.set_tensor(self.input_index, self.buffer)
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output_index)[:n].copy()
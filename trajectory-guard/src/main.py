@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# ==============================================================================
+# Service: TRAJECTORY GUARD
+# Version: 1.0.0 (GRU Next-Position Anomaly Scoring)
+# Author: Operations Team
+# Description: Runs the trajectory GRU from ai-research (TensorFlow Lite,
+#              CPU only) against the live fused feed.
+#              Every cycle:
+#                1. One snapshot of the live state bus (aircraft_state.py).
+#                2. Each aircraft with a new report appends it to its window
+#                   (last SEQ_LEN reports; a gap > MAX_GAP_S restarts it,
+#                   like the per-flight windows used in training).
+#                3. The new report is scored against the position the model
+#                   predicted for it: residual per feature (track wrapped),
+#                   RMS in scaled units = anomaly score.
+#                4. One batched inference for all full windows -> the
+#                   predictions scored next cycle.
+#              Scores go to 'trajectory_anomaly' in one write per cycle.
+#              Latency budget: if a cycle runs over CYCLE_BUDGET_MS the batch
+#              cap shrinks (aircraft inferred least recently go first), and
+#              grows back while cycles are well under budget.
+# ==============================================================================
+
+import glob
+import os
+import time
+import logging
+from collections import deque
+
+import numpy as np
+from influxdb import InfluxDBClient
+
+from influx_writer import InfluxWriter, escape_key
+from aircraft_state import connect_state
+from gru_engine import GruEngine
+
+# --- CONFIGURATION ---
+INFLUX_HOST = os.getenv('INFLUX_HOST', 'influxdb')
+INFLUX_PORT = int(os.getenv('INFLUX_PORT', 8086))
+INFLUX_DB   = os.getenv('INFLUX_DB', 'readsb')
+
+# Model: newest *.tflite in MODEL_DIR unless MODEL_PATH is set
+MODEL_DIR = os.getenv('MODEL_DIR', '/models')
+MODEL_PATH = os.getenv('MODEL_PATH', '')
+TFLITE_THREADS = int(os.getenv('TFLITE_THREADS', 4))   # Pi 5: 4 cores
+
+# Cycle
+CYCLE_SECONDS = float(os.getenv('CYCLE_SECONDS', 1.0))
+CYCLE_BUDGET_MS = float(os.getenv('CYCLE_BUDGET_MS', 250))
+MAX_BATCH = int(os.getenv('MAX_BATCH', 1024))
+MIN_BATCH_CAP = 64
+
+# Scoring
+ANOMALY_THRESHOLD = float(os.getenv('ANOMALY_THRESHOLD', 0.05))  # RMS residual (scaled units)
+ALERT_COOLDOWN = 60        # Same aircraft logged at most once per this (seconds)
+MAX_GAP_S = 60             # Same as ai-research/src/sequences.py
+TRACK_TTL = 300            # Forget aircraft silent for this long (seconds)
+STATS_INTERVAL = 300
+
+# Live state field for every model feature (training reads v_rate_fpm from Influx)
+FIELD_MAP = {'v_rate_fpm': ['vert_rate_fpm', 'v_rate_fpm']}
+STATE_FIELDS = ["lat", "lon", "alt_baro_ft", "gs_knots", "track", "vert_rate_fpm"]
+STATE_MAX_AGE = 10
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(name)s] %(message)s')
+logger = logging.getLogger("TrajectoryGuard")
+
+def find_model():
+    if MODEL_PATH:
+        return MODEL_PATH
+    models = glob.glob(os.path.join(MODEL_DIR, "*.tflite"))
+    return max(models, key=os.path.getmtime) if models else None
+
+class Track:
+    """Recent reports of one aircraft plus the predictions waiting for their report."""
+    __slots__ = ("icao", "rows", "pending", "ts", "callsign", "last_inferred", "last_alert")
+
+    def __init__(self, icao, seq_len, horizon):
+        self.icao = icao
+        self.rows = deque(maxlen=seq_len)
+        self.pending = deque(maxlen=horizon)   # Oldest = prediction for the next report
+        self.ts = 0.0
+        self.callsign = None
+        self.last_inferred = 0.0
+        self.last_alert = 0.0
+
+    def reset(self):
+        self.rows.clear()
+        self.pending.clear()
+
+class TrajectoryGuard:
+
+    def __init__(self, engine, writer):
+        self.engine = engine
+        self.writer = writer
+        self.horizon = max(1, engine.horizon)
+        self.tracks = {}
+        self.batch_cap = MAX_BATCH
+        self.track_idx = engine.features.index('track') if 'track' in engine.features else None
+        self.sources = [FIELD_MAP.get(f, [f]) for f in engine.features]
+        self.infer_ms = deque(maxlen=STATS_INTERVAL)
+        self.shed = 0
+
+    def read_row(self, rec):
+        row = []
+        for names in self.sources:
+            value = next((rec[n] for n in names if rec.get(n) is not None), None)
+            if value is None:
+                return None
+            row.append(float(value))
+        return row
+
+    def ingest(self, snapshot):
+        """Appends new reports. Returns (tracks, rows, predictions) to score."""
+        scored, rows, preds = [], [], []
+        for icao, rec in snapshot.items():
+            ts = float(rec.get('ts') or 0)
+            row = self.read_row(rec)
+            if row is None:
+                continue
+            track = self.tracks.get(icao)
+            if track is None:
+                track = self.tracks[icao] = Track(icao, self.engine.seq_len, self.horizon)
+            elif ts <= track.ts:
+                continue
+            elif ts - track.ts > MAX_GAP_S:
+                track.reset()
+
+            if len(track.pending) == self.horizon and track.pending[0] is not None:
+                scored.append(track)
+                rows.append(row)
+                preds.append(track.pending[0])
+            track.rows.append(row)
+            track.ts = ts
+            track.callsign = rec.get('callsign') or icao.upper()
+            track.pending.append(None)   # Filled in by infer() if this track is in the batch
+        return scored, rows, preds
+
+    def score(self, tracks, rows, preds, now):
+        """Residuals of the new reports vs their predictions -> Line Protocol rows."""
+        if not tracks:
+            return []
+        actual = np.asarray(rows, dtype=np.float32)
+        predicted = self.engine.unscale(np.asarray(preds, dtype=np.float32))
+        err = actual - predicted
+        if self.track_idx is not None:
+            err[:, self.track_idx] = (err[:, self.track_idx] + 180.0) % 360.0 - 180.0
+        scores = np.sqrt(np.mean((err * self.engine.scale_) ** 2, axis=1))
+
+        f = self.engine.features
+        lat = actual[:, f.index('lat')]
+        pos_err_m = np.hypot(err[:, f.index('lat')] * 111320.0,
+                             err[:, f.index('lon')] * 111320.0 * np.cos(np.radians(lat)))
+        alt_err = err[:, f.index('alt_baro_ft')]
+        gs_err = err[:, f.index('gs_knots')]
+
+        now_ns = int(now * 1e9)
+        lines = []
+        for track, s, p, a, g in zip(tracks, scores.tolist(), pos_err_m.tolist(), alt_err.tolist(), gs_err.tolist()):
+            lines.append(f"trajectory_anomaly,icao24={track.icao},callsign={escape_key(track.callsign)} "
+                         f"score={s:.5f},pos_err_m={p:.1f},alt_err_ft={a:.1f},gs_err_kts={g:.1f} {now_ns}")
+            if s >= ANOMALY_THRESHOLD and now - track.last_alert >= ALERT_COOLDOWN:
+                track.last_alert = now
+                logger.warning(f"🚨 {track.callsign} ({track.icao}) off predicted trajectory: "
+                               f"score {s:.3f} | pos {p:.0f} m | alt {a:+.0f} ft | gs {g:+.0f} kt")
+        return lines
+
+    def infer(self, now):
+        """One batched prediction for every window that got a new report (up to batch_cap). Returns ms spent."""
+        ready = [t for t in self.tracks.values()
+                 if t.pending and t.pending[-1] is None and len(t.rows) == self.engine.seq_len]
+        if len(ready) > self.batch_cap:
+            ready.sort(key=lambda t: t.last_inferred)
+            self.shed += len(ready) - self.batch_cap
+            ready = ready[:self.batch_cap]
+        if not ready:
+            return 0.0
+
+        start = time.perf_counter()
+        windows = self.engine.scale(np.asarray([t.rows for t in ready], dtype=np.float32))
+        preds = self.engine.predict(windows)
+        for track, pred in zip(ready, preds):
+            track.pending[-1] = pred
+            track.last_inferred = now
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        self.infer_ms.append(elapsed_ms)
+        return elapsed_ms
+
+    def adapt(self, cycle_ms):
+        """Shrinks the batch cap over budget, grows it back while well under."""
+        if cycle_ms > CYCLE_BUDGET_MS:
+            self.batch_cap = max(MIN_BATCH_CAP, int(self.batch_cap * 0.75))
+        elif cycle_ms < CYCLE_BUDGET_MS * 0.5 and self.batch_cap < MAX_BATCH:
+            self.batch_cap = min(MAX_BATCH, self.batch_cap + MIN_BATCH_CAP)
+
+    def expire(self, now):
+        for icao in [i for i, t in self.tracks.items() if now - t.ts > TRACK_TTL]:
+            del self.tracks[icao]
+
+    def cycle(self, snapshot, now):
+        start = time.perf_counter()
+        tracks, rows, preds = self.ingest(snapshot)
+        lines = self.score(tracks, rows, preds, now)
+        self.infer(now)
+        if lines:
+            self.writer.write_lines(lines)
+        cycle_ms = (time.perf_counter() - start) * 1000.0
+        self.adapt(cycle_ms)
+        return cycle_ms
+
+    def stats(self):
+        p95 = float(np.percentile(self.infer_ms, 95)) if self.infer_ms else 0.0
+        logger.info(f"Tracking {len(self.tracks)} aircraft | inference p95 {p95:.1f} ms "
+                    f"| batch cap {self.batch_cap} | shed {self.shed}")
+        self.shed = 0
+
+def main():
+    logger.info("--- TRAJECTORY GUARD v1.0.0 STARTED ---")
+
+    model_path = find_model()
+    while not model_path:
+        logger.warning(f"No *.tflite model in {MODEL_DIR} (run ai-research/src/export_tflite.py). Retrying...")
+        time.sleep(60)
+        model_path = find_model()
+
+    engine = GruEngine(model_path, threads=TFLITE_THREADS)
+    logger.info(f"Model: {os.path.basename(model_path)} | seq_len {engine.seq_len} | "
+                f"horizon {engine.horizon} | quantize {engine.meta.get('quantize', '?')} | threads {TFLITE_THREADS}")
+    if engine.horizon < 1:
+        logger.warning("Model was trained on the last input row (horizon 0); scoring it as next-report prediction.")
+
+    client = InfluxDBClient(host=INFLUX_HOST, port=INFLUX_PORT, database=INFLUX_DB)
+    writer = InfluxWriter(f"http://{INFLUX_HOST}:{INFLUX_PORT}", INFLUX_DB,
+                          name="trajectory-guard", log=logger.warning)
+    state = connect_state("TrajectoryGuard", client, STATE_FIELDS, log=logger.info)
+    guard = TrajectoryGuard(engine, writer)
+
+    last_stats = time.time()
+    while True:
+        now = time.time()
+        try:
+            snapshot = state.snapshot(max_age=STATE_MAX_AGE)
+            cycle_ms = guard.cycle(snapshot, now)
+            if cycle_ms > CYCLE_BUDGET_MS:
+                logger.warning(f"Cycle over budget: {cycle_ms:.0f} ms > {CYCLE_BUDGET_MS:.0f} ms "
+                               f"(batch cap now {guard.batch_cap})")
+            guard.expire(now)
+        except Exception as e:
+            logger.error(f"Cycle Error: {e}")
+
+        if now - last_stats >= STATS_INTERVAL:
+            guard.stats()
+            last_stats = now
+
+        time.sleep(max(0.0, CYCLE_SECONDS - (time.time() - now)))
+
+if __name__ == "__main__":
+    main()